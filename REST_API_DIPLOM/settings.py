@@ -25,7 +25,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.getenv('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = os.getenv('DEBUG')
+DEBUG = os.getenv('DEBUG', '').lower() in ('1', 'true', 'yes')
 
 ALLOWED_HOSTS = os.getenv('POSTGRES_HOST').split()
 
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'sales_product_app',
@@ -45,11 +46,10 @@ INSTALLED_APPS = [
     'django_extensions',
     'imagekit',
     'social_django',
-    'debug_toolbar'
 ]
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'sales_product_app.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,10 +57,34 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'sales_product_app.profiling.RequestProfilerMiddleware',
 ]
 
+# Панель отладки только в режиме разработки
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(1, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+
+# Метрики запросов: порог медленного SQL-запроса (мс) и токен доступа к api/v1/metrics/ (Bearer),
+# без токена метрики доступны только сотрудникам (is_staff)
+METRICS_SLOW_QUERY_MS = 100
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Профилирование запросов: доля случайных запросов, режим ('cprofile' - .prof, 'sample' - свернутые стеки),
+# каталог и ограничения на количество и объем файлов профилей, срок действия токена (с)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'cprofile')
+PROFILE_SAMPLE_INTERVAL = 0.001
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_MAX_FILES = 200
+PROFILE_MAX_BYTES = 200 * 1024 * 1024
+PROFILE_TOKEN_MAX_AGE = 60 * 60
+
 ROOT_URLCONF = 'REST_API_DIPLOM.urls'
 
+# Асинхронные представления чтения каталога и заказов под ASGI (по умолчанию выключены: ASYNC_READ_VIEWS=1)
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', '0') == '1'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -128,6 +152,14 @@ USE_TZ = True
 STATIC_URL = 'static/'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+# Файлы без ссылок удаляются не раньше, чем через столько секунд после последнего сохранения того же содержимого
+MEDIA_COLLECT_GRACE = 10 * 60
+
+# Медиафайлы хранятся под именем по хешу содержимого, одинаковые файлы - в одном экземпляре
+STORAGES = {
+    'default': {'BACKEND': 'sales_product_app.media.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
 
 
 # Default primary key field type
@@ -137,13 +169,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'sales_product_app.authentication.CachedTokenAuthentication',
         # 'rest_framework.authentication.BasicAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'sales_product_app.throttling.AnonRateThrottle',
+        'sales_product_app.throttling.UserRateThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '10/minute',
@@ -152,8 +184,15 @@ REST_FRAMEWORK = {
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
 }
 
+# Размер страницы курсорной пагинации списков товаров и заказов
+KEYSET_PAGE_SIZE = 50
+
 AUTH_USER_MODEL = 'sales_product_app.CustomUser'
 
+# Бэкенд поиска товаров: 'postgres' (tsvector + pg_trgm) или 'python' (инвертированный индекс в памяти),
+# по умолчанию выбирается по СУБД
+PRODUCT_SEARCH_BACKEND = os.getenv('PRODUCT_SEARCH_BACKEND')
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 
 EMAIL_HOST = 'smtp.yandex.ru'
@@ -164,6 +203,13 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Количество повторов задачи отправки писем при ошибках SMTP (с экспоненциальной задержкой)
+MAIL_MAX_RETRIES = 5
+# Количество событий заказов, передаваемых в Celery за одну транзакцию (и отправляемых одним пакетом писем)
+OUTBOX_BATCH_SIZE = 100
+# Задержка передачи событий после оформления (с): события за это время объединяются в один пакет
+OUTBOX_RELAY_DELAY = 2
+
 
 DJOSER = {
     'SERIALIZERS': {
@@ -177,8 +223,50 @@ DJOSER = {
     'CONFIRMATION_URL': 'confirm/{uid}/{token}',
 }
 
+REDIS_URL = os.getenv('REDIS_URL')
+
+# Основной кэш - Redis из docker-compose.yml (если задан REDIS_URL), иначе память процесса
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'local',
+    },
+}
+
+# Кэш аутентификации по токену: алиас кэша и время жизни записи (с)
+AUTH_TOKEN_CACHE_ALIAS = 'default'
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+
+# Счетчики ограничения частоты запросов в Redis, без адреса - в памяти процесса
+THROTTLE_REDIS_URL = REDIS_URL
+
+# Кэш ответов каталога: алиас основного бэкенда, запасного бэкенда и время жизни ключей
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_FALLBACK_ALIAS = 'local'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# Индекс фасетов: наибольшее число версий журнала изменений, применяемых инкрементально
+FACET_INDEX_MAX_CHANGES = 100
+
+# Хранилище корзин: 'db' (строки Order со статусом 'basket'), 'redis' (хеши Redis со сроком жизни)
+# или 'memory' (замена Redis в памяти процесса для тестов)
+BASKET_BACKEND = os.getenv('BASKET_BACKEND', 'db')
+BASKET_REDIS_URL = REDIS_URL or 'redis://127.0.0.1:6379'
+BASKET_TTL = 7 * 24 * 60 * 60
+
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379'
 CELERY_BACKEND = 'redis://127.0.0.1:6379'
+# Периодическая передача событий, оставшихся в таблице исходящих событий (например, при недоступности брокера)
+CELERY_BEAT_SCHEDULE = {
+    'relay-outbox': {'task': 'sales_product_app.tasks.relay_outbox_async', 'schedule': 60.0},
+    'collect-media': {'task': 'sales_product_app.tasks.collect_media_async', 'schedule': 60 * 60.0},
+}
 
 AUTHENTICATION_BACKENDS = {
     'social_core.backends.google.GoogleOAuth2',
@@ -21,11 +21,20 @@ from rest_framework.routers import DefaultRouter
 from django.conf import settings
 
 
+from sales_product_app.media import serve_media
 from sales_product_app.views import ShopView, CategoryView, ProductInfoView, ProductViewSet, BasketView, \
     account_activation, ContactView, ThanksForOrderView, OrderListView, ShopUpdateUserView, SupplierOrdersView, \
-    UserView
+    UserView, ProductFilterView, CatalogCacheStatsView, ProductInfoBatchView, BasketBatchView, metrics
+from sales_product_app.async_views import AsyncShopView, AsyncCategoryView, AsyncProductViewSet, \
+    AsyncProductInfoView, AsyncOrderListView
+
+# При ASYNC_READ_VIEWS эндпоинты чтения каталога и заказов обслуживаются асинхронными вариантами представлений
+read_views = {view: async_view if settings.ASYNC_READ_VIEWS else view for view, async_view in (
+    (ShopView, AsyncShopView), (CategoryView, AsyncCategoryView), (ProductViewSet, AsyncProductViewSet),
+    (ProductInfoView, AsyncProductInfoView), (OrderListView, AsyncOrderListView))}
+
 router = DefaultRouter()
-router.register('products', ProductViewSet, basename='product')
+router.register('products', read_views[ProductViewSet], basename='product')
 print(router)
 
 app_name = 'sales_product_app'
@@ -34,26 +43,33 @@ urlpatterns = [
     re_path(r'^auth/', include('djoser.urls.authtoken'), name='token-login-logout'),
     path('activate/<str:uid>/<str:token>/', account_activation, name='account_activation_success'),
     path('api/v1/', include('djoser.urls'), name='user-create-password-reset'),
+    path('api/v1/products/filter/', ProductFilterView.as_view(), name='products-filter'),
+    path('api/v1/products/detail/', ProductInfoBatchView.as_view(), name='productinfo-batch-detail'),
     path('api/v1/', include(router.urls)),
-    path("__debug__/", include("debug_toolbar.urls")),
     path('auth/', include('social_django.urls', namespace='social')),
     path('api/v1/users-list/', UserView.as_view(), name='users-list'),
+    path('api/v1/catalog-cache-stats/', CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
+    path('api/v1/metrics/', metrics, name='metrics'),
     # path('api/v1/users-create/', UserView.as_view(), name='create-user'),
-    path('api/v1/shops/', ShopView.as_view(), name='shops-list'),
-    path('api/v1/shops/<int:pk>/', ShopView.as_view(), name='shop-status-update'),
-    path('api/v1/categories/', CategoryView.as_view(), name='category-list'),
-    path('api/v1/products/<int:product_id>/detail/', ProductInfoView.as_view(), name='productinfo-detail'),
+    path('api/v1/shops/', read_views[ShopView].as_view(), name='shops-list'),
+    path('api/v1/shops/<int:pk>/', read_views[ShopView].as_view(), name='shop-status-update'),
+    path('api/v1/categories/', read_views[CategoryView].as_view(), name='category-list'),
+    path('api/v1/products/<int:product_id>/detail/', read_views[ProductInfoView].as_view(), name='productinfo-detail'),
     path('api/v1/basket/', BasketView.as_view(), name='basket'),
     path('api/v1/basket/<int:pk>/', BasketView.as_view(), name='order-update'),
+    path('api/v1/basket/batch/', BasketBatchView.as_view(), name='basket-batch'),
     path('api/v1/contact/', ContactView.as_view(), name='contact'),
     path('api/v1/contact/<int:pk>/', ContactView.as_view(), name='contact-detail'),
     path('api/v1/thanks-for-order/', ThanksForOrderView.as_view(), name='thanks-for-order'),
-    path('api/v1/orders/', OrderListView.as_view(), name='orders'),
-    path('api/v1/orders/<str:order_number>/', OrderListView.as_view(), name='order-detail'),
+    path('api/v1/orders/', read_views[OrderListView].as_view(), name='orders'),
+    path('api/v1/orders/<str:order_number>/', read_views[OrderListView].as_view(), name='order-detail'),
     path('api/v1/shops-update-user/', ShopUpdateUserView.as_view(), name='supplier-status-update'),
     path('api/v1/supplier-orders/', SupplierOrdersView.as_view(), name='supplier-orders'),
     path('api/v1/supplier-orders/<str:order_number>/', SupplierOrdersView.as_view(), name='supplier-orders-detail'),
 ]
 
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+if 'debug_toolbar' in settings.INSTALLED_APPS:
+    urlpatterns.append(path("__debug__/", include("debug_toolbar.urls")))
+
+urlpatterns += static(settings.MEDIA_URL, view=serve_media, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, Category, Shop, CustomUser, ProductInfo, Contact, Order
+from .models import Product, Category, Shop, CustomUser, ProductInfo, Contact, Order, OrderHeader, OutboxEvent
 
 # admin.site.register(Product)
 admin.site.register(Category)
@@ -7,4 +7,6 @@ admin.site.register(Shop)
 admin.site.register(CustomUser)
 admin.site.register(ProductInfo)
 admin.site.register(Contact)
-admin.site.register(Order)
\ No newline at end of file
+admin.site.register(Order)
+admin.site.register(OrderHeader)
+admin.site.register(OutboxEvent)
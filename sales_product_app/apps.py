@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class SalesProductAppConfig(AppConfig):
@@ -6,4 +7,6 @@ class SalesProductAppConfig(AppConfig):
     name = 'sales_product_app'
 
     def ready(self):
-        import sales_product_app.signals
\ No newline at end of file
+        import sales_product_app.signals
+        from .search import create_search_indexes
+        post_migrate.connect(create_search_indexes, sender=self)
\ No newline at end of file
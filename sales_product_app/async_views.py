@@ -0,0 +1,126 @@
+import asyncio
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.http import Http404
+from rest_framework.response import Response
+
+from .catalog_cache import acache_catalog_response
+from .models import OrderHeader, ProductInfo
+from .pagination import OrderPagination
+from .serializers import OrderDetailSerializer, OrderHeaderSerializer, ProductInfoSerializer, ShopSerializer
+from .views import CategoryView, OrderListView, ProductInfoView, ProductViewSet, ShopView
+
+
+class AsyncAPIViewMixin:
+    """Асинхронная обработка запросов DRF под ASGI.
+
+    Аутентификация, проверка прав и ограничение частоты (синхронный код DRF) выполняются в потоке,
+    асинхронные обработчики методов ожидаются в цикле событий, синхронные (изменение данных)
+    выполняются в потоке. Данные читаются через асинхронный ORM, поэтому обработчики не занимают
+    поток на время ожидания ответа БД.
+    """
+    view_is_async = True
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        return markcoroutinefunction(super().as_view(*args, **kwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if asyncio.iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def paginated_response(self, queryset, serializer_class, paginator=None):
+        """Страница курсорной пагинации (выборка страницы - в потоке) или весь список"""
+        paginator = paginator or self.paginator
+        context = {'request': self.request, 'view': self}
+        if paginator is not None:
+            page = await sync_to_async(paginator.paginate_queryset)(queryset, self.request, view=self)
+            if page is not None:
+                return paginator.get_paginated_response(serializer_class(page, many=True, context=context).data)
+        return Response(serializer_class([item async for item in queryset], many=True, context=context).data)
+
+
+class AsyncShopView(AsyncAPIViewMixin, ShopView):
+    """Класс для работы со списком магазинов (чтение через асинхронный ORM)"""
+
+    @acache_catalog_response
+    async def get(self, request, *args, **kwargs):
+        """Получить магазин (список магазинов)"""
+        return Response(ShopSerializer([shop async for shop in self.get_queryset(kwargs.get('pk'))], many=True).data)
+
+
+class AsyncCategoryView(AsyncAPIViewMixin, CategoryView):
+    """Класс для получения списка категорий (чтение через асинхронный ORM)"""
+
+    async def get(self, request, *args, **kwargs):
+        return await self.list(request, *args, **kwargs)
+
+    @acache_catalog_response
+    async def list(self, request, *args, **kwargs):
+        """Получение списка категорий"""
+        return await self.paginated_response(self.get_queryset(), self.get_serializer_class())
+
+
+class AsyncProductViewSet(AsyncAPIViewMixin, ProductViewSet):
+    """Класс для просмотра списка товаров (чтение через асинхронный ORM)"""
+
+    @acache_catalog_response
+    async def list(self, request, *args, **kwargs):
+        """Получение списка товаров"""
+        # Фильтр поиска может строить индекс в памяти запросами к БД, поэтому выполняется в потоке
+        queryset = await sync_to_async(self.filter_queryset)(self.get_queryset())
+        return await self.paginated_response(queryset, self.get_serializer_class())
+
+    async def retrieve(self, request, *args, **kwargs):
+        """Получение товара"""
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        try:
+            instance = await self.get_queryset().aget(**{self.lookup_field: kwargs[lookup]})
+        except (self.queryset.model.DoesNotExist, ValueError):
+            raise Http404
+        self.check_object_permissions(request, instance)
+        return Response(self.get_serializer(instance).data)
+
+
+class AsyncProductInfoView(AsyncAPIViewMixin, ProductInfoView):
+    """Класс для работы с информацией о товаре (чтение через асинхронный ORM)"""
+
+    async def get(self, request, product_id):
+        """Получение информации о товаре"""
+        if not product_id:
+            return Response({'Error': 'Method GET not allowed'})
+        try:
+            product_info = await self.get_queryset().aget(product_id=product_id)
+        except (ProductInfo.DoesNotExist, ProductInfo.MultipleObjectsReturned):
+            return Response({'Error': 'Object does not exists'})
+        return Response(ProductInfoSerializer(product_info).data)
+
+
+class AsyncOrderListView(AsyncAPIViewMixin, OrderListView):
+    """Класс для работы с заказами пользователя (чтение через асинхронный ORM)"""
+
+    async def get(self, request, **kwargs):
+        """Получение детализированного заказа пользователя"""
+        order_number = kwargs.get('order_number')
+        if order_number:
+            orders = [order async for order in self.get_order_queryset(request.user.id, order_number)]
+            return Response(OrderDetailSerializer(orders, many=True).data)
+        return await self.paginated_response(OrderHeader.objects.filter(user_id=request.user.id),
+                                             OrderHeaderSerializer, OrderPagination())
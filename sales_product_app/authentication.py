@@ -0,0 +1,63 @@
+import hashlib
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+logger = logging.getLogger(__name__)
+
+
+def token_cache_key(key):
+    """Ключ кэша по хешу токена, сам токен в кэш не записывается"""
+    return f'auth:token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def get_token_cache():
+    return caches[getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', 'default')]
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кэшированием id пользователя токена.
+
+    В кэше хранится только id пользователя (без хеша пароля и других данных), сам пользователь
+    читается по первичному ключу при каждом запросе, поэтому изменения в обход сигналов
+    (QuerySet.update(is_active=False)) действуют сразу. Запись живет AUTH_TOKEN_CACHE_TIMEOUT секунд
+    и удаляется при выходе (удалении токена) и удалении пользователя.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        cache_key = token_cache_key(key)
+        try:
+            user_id = cache.get(cache_key)
+        except Exception as error:
+            logger.warning('Token cache backend error: %s', error)
+            user_id = None
+        user = get_user_model()._default_manager.filter(pk=user_id).first() if user_id is not None else None
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            try:
+                cache.set(cache_key, user.pk, getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 60))
+            except Exception as error:
+                logger.warning('Token cache backend error: %s', error)
+            return user, token
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        token = self.get_model()(key=key, user=user)
+        token._state.adding = False
+        return user, token
+
+
+def invalidate_token_cache(keys):
+    keys = [token_cache_key(key) for key in keys]
+    if keys:
+        get_token_cache().delete_many(keys)
+
+
+def invalidate_user_tokens(user_id):
+    invalidate_token_cache(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
@@ -0,0 +1,225 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import Order, ProductInfo
+
+BASKET_KEY = 'basket:{user_id}'
+
+
+class DatabaseBasket:
+    """Корзина в таблице Order (строки со статусом 'basket'), строка корзины - id заказа"""
+
+    @staticmethod
+    def orders(user_id):
+        return Order.objects.filter(user_id=user_id, status='basket')
+
+    def lines(self, user_id):
+        """Строки корзины (заказы пользователя) с названием, магазином, ценой и остатком товара"""
+        queryset = self.orders(user_id).select_related('product_info')
+        return queryset.annotate(name=F('product_info__name'),
+                                 shop=F('product_info__shop__name'),
+                                 price=F('product_info__retail_price'),
+                                 quantity_in_stock=F('product_info__quantity_in_stock'),
+                                 sum_value=Sum(F('product_info__retail_price') * F('quantity')))
+
+    def get_line(self, user_id, line_id):
+        order = self.orders(user_id).filter(pk=line_id).select_related('product_info').first()
+        if order is None:
+            return None
+        return {'id': order.id, 'name': order.product_info.name, 'quantity': order.quantity,
+                'quantity_in_stock': order.product_info.quantity_in_stock}
+
+    def add(self, user_id, product_info_id, quantity=1):
+        """Добавление товара, False - если товар уже в корзине"""
+        if self.orders(user_id).filter(product_info_id=product_info_id).exists():
+            return False
+        Order.objects.create(user_id=user_id, product_info_id=product_info_id, quantity=quantity)
+        return True
+
+    def set_quantity(self, user_id, line_id, quantity):
+        self.orders(user_id).filter(pk=line_id).update(quantity=quantity)
+
+    def remove(self, user_id, line_id):
+        self.orders(user_id).filter(pk=line_id).delete()
+
+    def set_items(self, user_id, items):
+        """Установка количества товаров корзины {product_info_id: quantity}, 0 - удаление"""
+        with transaction.atomic():
+            basket = {order.product_info_id: order for order in self.orders(user_id).select_for_update().
+                      filter(product_info_id__in=items)}
+            to_create, to_update, to_delete = [], [], []
+            for product_info_id, quantity in items.items():
+                order = basket.get(product_info_id)
+                if order is None:
+                    if quantity:
+                        to_create.append(Order(user_id=user_id, product_info_id=product_info_id, quantity=quantity))
+                elif not quantity:
+                    to_delete.append(order.id)
+                elif order.quantity != quantity:
+                    order.quantity = quantity
+                    to_update.append(order)
+            Order.objects.bulk_create(to_create)
+            Order.objects.bulk_update(to_update, ['quantity'])
+            Order.objects.filter(id__in=to_delete).delete()
+        return len(to_create), len(to_update), len(to_delete)
+
+    def materialize(self, user_id):
+        """Строки корзины уже хранятся в Order"""
+
+
+class RedisBasket:
+    """Корзина в хеше Redis basket:<user_id> {product_info_id: quantity} со сроком жизни.
+
+    Строка корзины - id товара (ProductInfo). Строки Order создаются только при оформлении заказа.
+    """
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+
+    def key(self, user_id):
+        return BASKET_KEY.format(user_id=user_id)
+
+    def items(self, user_id):
+        return {int(product_info_id): int(quantity)
+                for product_info_id, quantity in self.client.hgetall(self.key(user_id)).items()}
+
+    def touch(self, user_id):
+        self.client.expire(self.key(user_id), self.ttl)
+
+    def lines(self, user_id):
+        items = self.items(user_id)
+        product_infos = ProductInfo.objects.filter(id__in=items).select_related('shop').order_by('id')
+        return [{'id': product_info.id, 'name': product_info.name,
+                 'shop': product_info.shop.name if product_info.shop else None,
+                 'price': product_info.retail_price, 'quantity_in_stock': product_info.quantity_in_stock,
+                 'quantity': items[product_info.id], 'sum_value': product_info.retail_price * items[product_info.id]}
+                for product_info in product_infos]
+
+    def get_line(self, user_id, line_id):
+        quantity = self.client.hget(self.key(user_id), line_id)
+        product_info = ProductInfo.objects.filter(id=line_id).values('name', 'quantity_in_stock').first()
+        if quantity is None or product_info is None:
+            return None
+        return {'id': line_id, 'quantity': int(quantity), **product_info}
+
+    def add(self, user_id, product_info_id, quantity=1):
+        added = self.client.hsetnx(self.key(user_id), product_info_id, quantity)
+        self.touch(user_id)
+        return bool(added)
+
+    def set_quantity(self, user_id, line_id, quantity):
+        self.client.hset(self.key(user_id), line_id, quantity)
+        self.touch(user_id)
+
+    def remove(self, user_id, line_id):
+        self.client.hdel(self.key(user_id), line_id)
+
+    def set_items(self, user_id, items):
+        basket = self.items(user_id)
+        to_set = {product_info_id: quantity for product_info_id, quantity in items.items()
+                  if quantity and basket.get(product_info_id) != quantity}
+        to_delete = [product_info_id for product_info_id, quantity in items.items()
+                     if not quantity and product_info_id in basket]
+        if to_set:
+            self.client.hset(self.key(user_id), mapping=to_set)
+        if to_delete:
+            self.client.hdel(self.key(user_id), *to_delete)
+        self.touch(user_id)
+        added = sum(product_info_id not in basket for product_info_id in to_set)
+        return added, len(to_set) - added, len(to_delete)
+
+    def materialize(self, user_id):
+        """Создание строк Order со статусом 'basket' из хеша перед оформлением заказа.
+
+        Хеш удаляется только после фиксации транзакции оформления.
+        """
+        items = self.items(user_id)
+        if items:
+            DatabaseBasket().set_items(user_id, items)
+            transaction.on_commit(lambda: self.client.delete(self.key(user_id)))
+
+
+class FakeRedis:
+    """Минимальная замена клиента Redis в памяти процесса (хеши и срок жизни ключей) для тестов"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expires = {}
+
+    def _hash(self, key, create=False):
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        if create:
+            return self.data.setdefault(key, {})
+        return self.data.get(key, {})
+
+    def hgetall(self, key):
+        with self.lock:
+            return dict(self._hash(key))
+
+    def hget(self, key, field):
+        with self.lock:
+            return self._hash(key).get(str(field))
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self.lock:
+            values = dict(mapping or {})
+            if field is not None:
+                values[field] = value
+            data = self._hash(key, create=True)
+            added = sum(str(field) not in data for field in values)
+            data.update({str(field): str(value) for field, value in values.items()})
+            return added
+
+    def hsetnx(self, key, field, value):
+        with self.lock:
+            data = self._hash(key, create=True)
+            if str(field) in data:
+                return 0
+            data[str(field)] = str(value)
+            return 1
+
+    def hdel(self, key, *fields):
+        with self.lock:
+            data = self._hash(key)
+            return sum(data.pop(str(field), None) is not None for field in fields)
+
+    def expire(self, key, seconds):
+        with self.lock:
+            if key in self.data:
+                self.expires[key] = time.monotonic() + seconds
+                return True
+            return False
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.expires.pop(key, None)
+            return sum(self.data.pop(key, None) is not None for key in keys)
+
+
+_backends = {}
+
+
+def get_basket_backend():
+    """Бэкенд корзины по настройке BASKET_BACKEND: 'db' (по умолчанию), 'redis' или 'memory' (FakeRedis)"""
+    name = getattr(settings, 'BASKET_BACKEND', 'db')
+    if name not in _backends:
+        ttl = getattr(settings, 'BASKET_TTL', 7 * 24 * 60 * 60)
+        if name == 'redis':
+            import redis
+
+            _backends[name] = RedisBasket(redis.Redis.from_url(settings.BASKET_REDIS_URL, decode_responses=True),
+                                          ttl)
+        elif name == 'memory':
+            _backends[name] = RedisBasket(FakeRedis(), ttl)
+        else:
+            _backends[name] = DatabaseBasket()
+    return _backends[name]
@@ -0,0 +1,143 @@
+import hashlib
+import logging
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+class CatalogCache:
+    """Кэш ответов каталога с версионированными ключами.
+
+    Версия - отметка времени последнего изменения каталога, она же служит Last-Modified.
+    Изменение магазинов, категорий и товаров увеличивает версию, и старые ключи больше не читаются.
+    При недоступности основного бэкенда (Redis) используется локальный кэш процесса.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified_count = 0
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+    def call(self, method, *args, **kwargs):
+        """Вызов метода основного кэша с переходом на локальный кэш при ошибке"""
+        try:
+            return getattr(caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')], method)(*args, **kwargs)
+        except Exception as error:
+            logger.warning('Catalog cache backend error, using local memory: %s', error)
+            return getattr(caches[getattr(settings, 'CATALOG_CACHE_FALLBACK_ALIAS', 'local')], method)(*args, **kwargs)
+
+    def get_version(self):
+        return self.call('get_or_set', CATALOG_VERSION_KEY, time.time_ns, timeout=None)
+
+    def bump_version(self):
+        self.call('set', CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+    def count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified_count,
+                    'hit_ratio': round(self.hits / total, 4) if total else 0.0}
+
+    def is_not_modified(self, request, etag, last_modified):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+    def get_keys(self, request):
+        """Ключ кэша, ETag и Last-Modified ответа по текущей версии каталога и URL запроса"""
+        version = self.get_version()
+        digest = hashlib.md5(request.build_absolute_uri().encode('utf8')).hexdigest()
+        return f'catalog:{version}:{digest}', f'"{version:x}-{digest[:12]}"', version / 1e9
+
+    def from_cache(self, data):
+        if data is None:
+            self.count('misses')
+            return None
+        self.count('hits')
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    def not_modified(self):
+        self.count('not_modified_count')
+        return Response(status=status.HTTP_304_NOT_MODIFIED)
+
+    @staticmethod
+    def add_validators(response, etag, last_modified):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        return response
+
+    def respond(self, request, handler):
+        """Ответ из кэша, 304 для актуальной копии клиента или ответ обработчика с сохранением в кэш"""
+        key, etag, last_modified = self.get_keys(request)
+        if self.is_not_modified(request, etag, last_modified):
+            return self.add_validators(self.not_modified(), etag, last_modified)
+        response = self.from_cache(self.call('get', key))
+        if response is None:
+            response = handler()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            self.call('set', key, response.data, timeout=self.timeout)
+            response['X-Cache'] = 'MISS'
+        return self.add_validators(response, etag, last_modified)
+
+    async def arespond(self, request, handler):
+        """Вариант respond для асинхронных представлений: кэш читается в потоке, обработчик - корутина"""
+        key, etag, last_modified = await sync_to_async(self.get_keys)(request)
+        if self.is_not_modified(request, etag, last_modified):
+            return self.add_validators(self.not_modified(), etag, last_modified)
+        response = self.from_cache(await sync_to_async(self.call)('get', key))
+        if response is None:
+            response = await handler()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            await sync_to_async(self.call)('set', key, response.data, timeout=self.timeout)
+            response['X-Cache'] = 'MISS'
+        return self.add_validators(response, etag, last_modified)
+
+
+catalog_cache = CatalogCache()
+
+
+def cache_catalog_response(method):
+    """Декоратор метода представления: кэширование ответа каталога"""
+    @wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        return catalog_cache.respond(request, lambda: method(view, request, *args, **kwargs))
+    return wrapper
+
+
+def acache_catalog_response(method):
+    """Декоратор асинхронного метода представления: кэширование ответа каталога"""
+    @wraps(method)
+    async def wrapper(view, request, *args, **kwargs):
+        return await catalog_cache.arespond(request, lambda: method(view, request, *args, **kwargs))
+    return wrapper
+
+
+def invalidate_catalog_cache():
+    catalog_cache.bump_version()
@@ -0,0 +1,47 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+CHANGES_TIMEOUT = 24 * 60 * 60
+
+
+class ChangeLog:
+    """Журнал изменений в общем кэше для индексов в памяти процессов.
+
+    Каждое изменение увеличивает версию и записывает id измененных строк под ключом этой версии,
+    процесс с индексом старой версии применяет изменения инкрементально или, если журнал неполон
+    или слишком длинен, перестраивает индекс целиком.
+    """
+
+    def __init__(self, name):
+        self.version_key = f'{name}_version'
+        self.changes_key = f'{name}_changes:{{}}'
+
+    def version(self):
+        return cache.get_or_set(self.version_key, time.time_ns, timeout=None)
+
+    def publish(self, ids=None):
+        """Запись изменения после фиксации транзакции; без ids - пометка, что нужно полное перестроение"""
+        ids = list(ids) if ids is not None else None
+
+        def write():
+            try:
+                version = cache.incr(self.version_key)
+            except ValueError:
+                cache.set(self.version_key, time.time_ns(), timeout=None)
+                return
+            if ids is not None:
+                cache.set(self.changes_key.format(version), ids, timeout=CHANGES_TIMEOUT)
+
+        transaction.on_commit(write)
+
+    def changes(self, since, version, limit=100):
+        """id, измененные между версиями since и version, или None, если нужно полное перестроение"""
+        if since is None or not 0 < version - since <= limit:
+            return None
+        keys = [self.changes_key.format(number) for number in range(since + 1, version + 1)]
+        logged = cache.get_many(keys)
+        if len(logged) != len(keys):
+            return None
+        return [pk for key in keys for pk in logged[key]]
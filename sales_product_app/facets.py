@@ -0,0 +1,276 @@
+import bisect
+import logging
+import re
+import threading
+from array import array
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+
+from .changelog import ChangeLog
+from .models import ProductInfo, ProductParameter
+
+logger = logging.getLogger(__name__)
+
+FACET_PARAM = re.compile(r'^param\[(.+)\]$')
+SET_BIT = re.compile('1')
+
+
+def to_bitmap(positions, size):
+    """Битовая карта (int) с единицами в заданных позициях"""
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def from_bitmap(bitmap, offset=0, limit=None):
+    """Позиции единичных бит битовой карты по возрастанию (поиск по двоичной записи выполняется в C)"""
+    found = SET_BIT.finditer(bin(bitmap)[:1:-1])
+    return [match.start() for match in islice(found, offset, None if limit is None else offset + limit)]
+
+
+def make_postings(positions, size):
+    """Список позиций значения: отсортированный массив, а для значений, которые есть больше чем
+    у 1/32 товаров, - битовая карта (4 байта на позицию против size / 8 байт на карту)"""
+    if len(positions) * 32 > size:
+        return to_bitmap(positions, size)
+    return array('I', sorted(positions))
+
+
+def count_postings(postings):
+    return postings.bit_count() if isinstance(postings, int) else len(postings)
+
+
+def contains(postings, position):
+    if isinstance(postings, int):
+        return postings >> position & 1
+    index = bisect.bisect_left(postings, position)
+    return index < len(postings) and postings[index] == position
+
+
+def add_position(postings, position, size):
+    if isinstance(postings, int):
+        return postings | 1 << position
+    if not contains(postings, position):
+        bisect.insort(postings, position)
+    return to_bitmap(postings, size) if len(postings) * 32 > size else postings
+
+
+def remove_position(postings, position):
+    if isinstance(postings, int):
+        return postings & ~(1 << position)
+    del postings[bisect.bisect_left(postings, position)]
+    return postings
+
+
+class FacetIndex:
+    """Предрассчитанный индекс значений параметров товаров.
+
+    Для каждой пары (параметр, значение) хранится список позиций ProductInfo - сжатый массив
+    или битовая карта для частых значений, поэтому фильтр по нескольким параметрам - это пересечение
+    списков без соединений таблиц EAV, а количество товаров по значению фасета - размер пересечения.
+    Изменения товаров применяются к индексу инкрементально по журналу в кэше (версия и id измененных
+    товаров), полное перестроение выполняется в фоновом потоке, запросы тем временем читают прежний индекс.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.refreshing = threading.Lock()
+        self.version = None
+        self.ids = array('q')
+        self.all = 0
+        self.postings = {}
+
+    def position(self, product_info_id):
+        index = bisect.bisect_left(self.ids, product_info_id)
+        return index if index < len(self.ids) and self.ids[index] == product_info_id else None
+
+    def load(self, ids, rows):
+        """Построение индекса по отсортированным id товаров и строкам (id товара, параметр, значение).
+
+        Строки товаров, которых нет в ids (добавлены после чтения id), пропускаются - они придут
+        в журнале изменений.
+        """
+        ids = array('q', ids)
+        positions = defaultdict(lambda: defaultdict(list))
+        last, position = None, None
+        for product_info_id, name, value in rows:
+            if product_info_id != last:
+                last = product_info_id
+                index = bisect.bisect_left(ids, product_info_id)
+                position = index if index < len(ids) and ids[index] == product_info_id else None
+            if position is not None:
+                positions[name][value].append(position)
+        postings = {name: {value: make_postings(value_positions, len(ids))
+                           for value, value_positions in values.items()}
+                    for name, values in positions.items()}
+        with self.lock:
+            self.ids, self.all, self.postings = ids, (1 << len(ids)) - 1, postings
+
+    def build(self):
+        ids = ProductInfo.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=10000)
+        rows = ProductParameter.objects.filter(product_info__isnull=False, parameter__isnull=False). \
+            values_list('product_info_id', 'parameter__name', 'value').order_by('product_info_id'). \
+            iterator(chunk_size=10000)
+        self.load(ids, rows)
+
+    def apply(self, product_info_ids):
+        """Инкрементальное обновление индекса для измененных товаров, False - нужно полное перестроение"""
+        product_info_ids = sorted(set(product_info_ids))
+        live = set(ProductInfo.objects.filter(id__in=product_info_ids).values_list('id', flat=True))
+        rows = ProductParameter.objects.filter(product_info_id__in=live, parameter__isnull=False). \
+            values_list('product_info_id', 'parameter__name', 'value')
+        with self.lock:
+            positions = {}
+            for product_info_id in product_info_ids:
+                position = self.position(product_info_id)
+                if position is None and product_info_id in live:
+                    if self.ids and product_info_id < self.ids[-1]:
+                        return False
+                    self.ids.append(product_info_id)
+                    position = len(self.ids) - 1
+                if position is not None:
+                    positions[product_info_id] = position
+            for values in self.postings.values():
+                for value, postings in values.items():
+                    for position in positions.values():
+                        if contains(postings, position):
+                            postings = remove_position(postings, position)
+                    values[value] = postings
+            for product_info_id, position in positions.items():
+                if product_info_id in live:
+                    self.all |= 1 << position
+                else:
+                    self.all &= ~(1 << position)
+            for product_info_id, name, value in rows:
+                values = self.postings.setdefault(name, {})
+                values[value] = add_position(values.get(value, array('I')), positions[product_info_id],
+                                             len(self.ids))
+        return True
+
+    def catch_up(self, version):
+        """Применение журнала изменений от текущей версии индекса до version, иначе полное перестроение"""
+        changes = facet_changes.changes(self.version, version, getattr(settings, 'FACET_INDEX_MAX_CHANGES', 100))
+        if changes is None or not self.apply(changes):
+            self.build()
+        self.version = version
+
+    def refresh(self, wait=False):
+        """Приведение индекса к версии в кэше.
+
+        Пока индекс не построен, а также внутри транзакции (другой поток не увидит ее изменений)
+        обновление выполняется сразу, иначе - в фоновом потоке.
+        """
+        version = facet_changes.version()
+        if version == self.version:
+            return
+        if wait or self.version is None or connection.in_atomic_block:
+            with self.refreshing:
+                if version != self.version:
+                    self.catch_up(version)
+        elif self.refreshing.acquire(blocking=False):
+            threading.Thread(target=self.refresh_in_background, args=(version,), daemon=True).start()
+
+    def refresh_in_background(self, version):
+        try:
+            self.catch_up(version)
+        except Exception:
+            logger.exception('Facet index refresh failed')
+        finally:
+            self.refreshing.release()
+            connection.close()
+
+    def match(self, filters, exclude=None, candidates=None):
+        """Битовая карта товаров из candidates (по умолчанию всех), удовлетворяющих фильтрам {параметр: [значения]}"""
+        matched = self.all if candidates is None else candidates
+        for name, values in filters.items():
+            if name == exclude:
+                continue
+            postings = self.postings.get(name, {})
+            selected = 0
+            for value in values:
+                if value in postings:
+                    value_postings = postings[value]
+                    selected |= value_postings if isinstance(value_postings, int) else \
+                        to_bitmap(value_postings, len(self.ids))
+            matched &= selected
+        return matched
+
+    def selector(self, matched):
+        """Представление отобранных позиций для подсчета по массивам: множество, если позиций мало,
+        иначе байт b'1' или b'0' на каждую позицию (проверка выполняется map без цикла Python)"""
+        if matched is self.all:
+            return None
+        if matched.bit_count() * 32 < len(self.ids):
+            return set(from_bitmap(matched))
+        return bin(matched)[:1:-1].ljust(len(self.ids), '0').encode('ascii')
+
+    def count(self, postings, matched, selector):
+        """Количество товаров значения среди отобранных"""
+        if selector is None:
+            return count_postings(postings)
+        if isinstance(postings, int):
+            return (postings & matched).bit_count()
+        if isinstance(selector, set):
+            return len(selector.intersection(postings))
+        return sum(map(selector.__getitem__, postings)) - ord('0') * len(postings)
+
+    def facets(self, filters, candidates=None):
+        """Количество товаров по каждому значению каждого параметра.
+
+        Для параметра, по которому задан фильтр, счетчики считаются без учета его собственного фильтра.
+        """
+        base = self.match(filters, candidates=candidates)
+        base_selector = self.selector(base)
+        result = {}
+        for name, values in self.postings.items():
+            if name in filters:
+                matched = self.match(filters, exclude=name, candidates=candidates)
+                selector = self.selector(matched)
+            else:
+                matched, selector = base, base_selector
+            counts = {value: self.count(postings, matched, selector) for value, postings in values.items()}
+            counts = {value: count for value, count in sorted(counts.items()) if count}
+            if counts:
+                result[name] = counts
+        return result
+
+    def search(self, filters, offset=0, limit=50, within=None):
+        """Количество найденных товаров, id товаров запрошенной страницы и счетчики фасетов.
+
+        within - id товаров, которыми ограничиваются выборка и счетчики (например, найденные поиском).
+        """
+        self.refresh()
+        with self.lock:
+            candidates = self.all
+            if within is not None:
+                positions = (self.position(product_info_id) for product_info_id in within)
+                candidates &= to_bitmap([position for position in positions if position is not None], len(self.ids))
+            matched = self.match(filters, candidates=candidates)
+            ids = [self.ids[position] for position in from_bitmap(matched, offset, limit)]
+            return matched.bit_count(), ids, self.facets(filters, candidates)
+
+
+facet_changes = ChangeLog('facet_index')
+facet_index = FacetIndex()
+
+
+def invalidate_facet_index(product_info_ids=None):
+    """Пометка индекса фасетов устаревшим во всех процессах после фиксации транзакции.
+
+    С id товаров процессы обновят в индексе только их, без id - перестроят индекс целиком.
+    """
+    facet_changes.publish(product_info_ids)
+
+
+def parse_facet_filters(query_params):
+    """Фильтры вида ?param[Цвет]=красный&param[Цвет]=синий -> {'Цвет': ['красный', 'синий']}"""
+    filters = {}
+    for key in query_params:
+        match = FACET_PARAM.match(key)
+        if match:
+            filters[match.group(1)] = query_params.getlist(key)
+    return filters
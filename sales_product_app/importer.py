@@ -0,0 +1,298 @@
+import hashlib
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Q
+
+from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from .catalog_cache import invalidate_catalog_cache
+from .facets import invalidate_facet_index
+from .readers import read_price_list
+from .routing import refresh_supplier_routes
+from .search import get_search_backend
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def content_hash(good):
+    """Хеш цены, розничной цены, количества и набора параметров товара"""
+    parameters = sorted((key, str(value)) for key, value in good.get('parameters', {}).items())
+    content = json.dumps([good['price'], good['price_rrc'], good['quantity'], parameters], ensure_ascii=False)
+    return hashlib.sha1(content.encode('utf8')).hexdigest()
+
+
+def reset_sequence(model):
+    """Продолжение последовательности id после строк, вставленных с id из файла (PostgreSQL)"""
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов, выполненных через соединение с БД"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class BulkImporter:
+    """Пакетный импорт прайс-листа поставщика.
+
+    Магазины, категории и параметры разрешаются один раз в словари в памяти,
+    товары записываются пакетами через bulk_create с upsert, по одной транзакции на пакет.
+    Строки пишутся в порядке ключей, чтобы параллельные импорты блокировали общие строки
+    Category и Parameter в одном порядке и не попадали во взаимную блокировку.
+    В инкрементальном режиме записываются только новые, измененные и удаленные из прайс-листа товары.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, incremental=False):
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.seen = set()
+        self.diff = {'inserted': 0, 'changed': 0, 'unchanged': 0, 'removed': 0}
+        self.shop_ids = []
+        self.category_ids = {}
+        self.category_shop = {}
+        self.conflicts = []
+        self.parameters = {}
+        self.rows = 0
+        self.queries = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def load_shops(self, shops):
+        """Создание или обновление магазинов"""
+        shops = [Shop(id=shop['id'], name=shop['name'], url=shop.get('url', ''))
+                 for shop in sorted(shops, key=lambda shop: shop['id'])]
+        Shop.objects.bulk_create(shops, update_conflicts=True, unique_fields=['id'], update_fields=['name', 'url'])
+        return [shop.id for shop in shops]
+
+    def resolve_categories(self, categories):
+        """Создание категорий и сопоставление их id из файла с id в БД по уникальному названию.
+
+        Категория с тем же названием, но другим id не создается: товары файла привязываются
+        к существующей категории, расхождение попадает в отчет. Если название не найдено,
+        а id занят другой категорией, категория создается с новым id.
+        """
+        names = {category['name']: category['id'] for category in categories}
+        Category.objects.bulk_create([Category(id=category['id'], name=category['name']) for category in categories],
+                                     ignore_conflicts=True)
+        resolved = dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = [name for name in names if name not in resolved]
+        if missing:
+            reset_sequence(Category)
+            Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+            resolved.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+        for category in categories:
+            name = category['name']
+            category_id = self.category_ids[category['id']] = resolved[name]
+            if category_id != category['id']:
+                self.conflicts.append(f'категория "{name}": id {category["id"]} в файле, {category_id} в БД')
+        return [self.category_ids[category['id']] for category in categories]
+
+    def load_categories(self, categories, shop_ids=()):
+        """Создание или обновление категорий и их привязки к магазинам.
+
+        Магазины категории берутся из ключа 'shops', а если его нет и в файле один магазин - из него.
+        """
+        categories = sorted(categories, key=lambda category: category['id'])
+        category_ids = self.resolve_categories(categories)
+        links = []
+        for category, category_id in zip(categories, category_ids):
+            category_shops = category.get('shops') or (list(shop_ids) if len(shop_ids) == 1 else [])
+            links += [Category.shops.through(category_id=category_id, shop_id=shop_id)
+                      for shop_id in category_shops]
+        Category.shops.through.objects.bulk_create(links, ignore_conflicts=True)
+        category_shops = Category.shops.through.objects.filter(
+            category_id__in=category_ids).values_list('category_id', 'shop_id')
+        for category_id, shop_id in category_shops:
+            self.category_shop[category_id] = min(shop_id, self.category_shop.get(category_id, shop_id))
+        return category_ids
+
+    def resolve_parameters(self, names):
+        """Получение id параметров по именам, отсутствующие параметры создаются одним запросом"""
+        missing = set(names) - self.parameters.keys()
+        if missing:
+            Parameter.objects.bulk_create([Parameter(name=name) for name in sorted(missing)], ignore_conflicts=True)
+            self.parameters.update(Parameter.objects.filter(name__in=missing).values_list('name', 'id'))
+        return self.parameters
+
+    def diff_goods(self, goods):
+        """Отбор новых и измененных товаров пакета по хешу содержимого"""
+        hashes = dict(ProductInfo.objects.filter(name__in=[good['name'] for good in goods]).
+                      values_list('name', 'content_hash'))
+        changed = []
+        for good in goods:
+            self.seen.add(good['name'])
+            if good['name'] not in hashes:
+                self.diff['inserted'] += 1
+            elif hashes[good['name']] != content_hash(good):
+                self.diff['changed'] += 1
+            else:
+                self.diff['unchanged'] += 1
+                continue
+            changed.append(good)
+        return changed
+
+    def remove_missing(self):
+        """Обнуление остатков товаров магазинов файла, отсутствующих в прайс-листе.
+
+        Строки не удаляются, так как на них ссылаются заказы покупателей.
+        """
+        stale = [pk for pk, name in ProductInfo.objects.filter(shop_id__in=self.shop_ids).
+                 exclude(quantity_in_stock=0, content_hash='').values_list('id', 'name') if name not in self.seen]
+        for start in range(0, len(stale), self.batch_size):
+            ProductInfo.objects.filter(id__in=stale[start:start + self.batch_size]).\
+                update(quantity_in_stock=0, content_hash='')
+        self.diff['removed'] = len(stale)
+
+    def resolve_products(self, goods):
+        """Создание товаров и сопоставление их id из файла с id в БД по уникальному названию.
+
+        Как и для категорий: товар с тем же названием и другим id не создается (расхождение попадает
+        в отчет), товар с новым названием и занятым id создается с новым id. Категория существующего
+        товара обновляется по файлу.
+        """
+        names = [good['name'] for good in goods]
+        taken = dict(Product.objects.filter(Q(name__in=names) | Q(id__in=[good['id'] for good in goods])).
+                     values_list('id', 'name'))
+        existing = set(taken.values())
+        # Существующие по названию товары обновляются по конфликту названия, поэтому вставляются без id
+        products = [Product(id=None if good['name'] in existing or good['id'] in taken else good['id'],
+                            name=good['name'], category_id=good['category']) for good in goods]
+        if any(product.id is None for product in products):
+            reset_sequence(Product)
+        Product.objects.bulk_create(products, update_conflicts=True, unique_fields=['name'],
+                                    update_fields=['category'])
+        resolved = dict(Product.objects.filter(name__in=names).values_list('name', 'id'))
+        for good in goods:
+            if resolved[good['name']] != good['id']:
+                self.conflicts.append(f'товар "{good["name"]}": id {good["id"]} в файле, '
+                                      f'{resolved[good["name"]]} в БД')
+        return resolved
+
+    def write_goods(self, goods):
+        """Запись пакета товаров, их информации и параметров"""
+        goods = sorted(goods, key=lambda good: good['id'])
+        for good in goods:
+            good['category'] = self.category_ids.get(good['category'], good['category'])
+        product_ids = self.resolve_products(goods)
+        ProductInfo.objects.bulk_create(
+            [ProductInfo(name=good['name'], product_id=product_ids[good['name']],
+                         shop_id=self.category_shop.get(good['category']), quantity_in_stock=good['quantity'],
+                         price=good['price'], retail_price=good['price_rrc'], content_hash=content_hash(good))
+             for good in goods],
+            update_conflicts=True, unique_fields=['name'],
+            update_fields=['product', 'shop', 'quantity_in_stock', 'price', 'retail_price', 'content_hash'])
+        product_infos = dict(ProductInfo.objects.filter(name__in=[good['name'] for good in goods]).
+                             values_list('name', 'id'))
+        get_search_backend().update(Product, product_ids.values())
+        get_search_backend().update(ProductInfo, product_infos.values())
+        refresh_supplier_routes(product_info_ids=product_infos.values())
+        # Параметры товаров пакета заменяются целиком: удаленные из прайс-листа параметры не остаются
+        ProductParameter.objects.filter(product_info_id__in=product_infos.values()).delete()
+        parameters = self.resolve_parameters({key for good in goods for key in good.get('parameters', {})})
+        ProductParameter.objects.bulk_create(
+            [ProductParameter(product_info_id=product_infos[good['name']], parameter_id=parameters[key],
+                              value=str(value))
+             for good in goods for key, value in good.get('parameters', {}).items()],
+            update_conflicts=True, unique_fields=['product_info', 'parameter'], update_fields=['value'])
+
+    def write_headers(self, shops, categories):
+        """Запись накопленных магазинов и категорий"""
+        with transaction.atomic():
+            if shops:
+                self.shop_ids += self.load_shops(shops)
+            if categories:
+                refresh_supplier_routes(category_ids=self.load_categories(categories, self.shop_ids))
+
+    def write_batch(self, goods):
+        """Запись пакета товаров в отдельной транзакции"""
+        with transaction.atomic():
+            self.rows += len(goods)
+            if self.incremental:
+                goods = self.diff_goods(goods)
+            if goods:
+                self.write_goods(goods)
+
+    def run(self, entries):
+        """Импорт потока пар (раздел, элемент) с подсчетом скорости и количества SQL-запросов.
+
+        Магазины и категории записываются перед первым товаром, товары - пакетами по batch_size,
+        поэтому потребление памяти зависит от размера пакета, а не от размера файла.
+        """
+        counter = QueryCounter()
+        started = time.perf_counter()
+        shops, categories, goods = [], [], []
+        with connection.execute_wrapper(counter):
+            for section, entry in entries:
+                if section == 'shop':
+                    shops.append(entry)
+                elif section == 'categories':
+                    categories.append(entry)
+                elif section == 'goods':
+                    if shops or categories:
+                        self.write_headers(shops, categories)
+                        shops, categories = [], []
+                    goods.append(entry)
+                    if len(goods) >= self.batch_size:
+                        self.write_batch(goods)
+                        goods = []
+            if shops or categories:
+                self.write_headers(shops, categories)
+            if goods:
+                self.write_batch(goods)
+            if self.incremental and self.shop_ids:
+                self.remove_missing()
+        invalidate_facet_index()
+        invalidate_catalog_cache()
+        self.elapsed = time.perf_counter() - started
+        self.queries = counter.count
+        return self
+
+
+def _init_worker():
+    """Закрытие унаследованных соединений: каждый процесс открывает собственное соединение с БД.
+
+    Пул создается методом fork: процессы наследуют настроенный Django (при spawn и forkserver
+    дочерний процесс импортирует модели до django.setup()).
+    """
+    connections.close_all()
+
+
+def import_file(path, batch_size=DEFAULT_BATCH_SIZE, incremental=False):
+    """Пакетный импорт одного файла, возвращает сводку для отчета"""
+    result = {'path': str(path), 'rows': 0, 'queries': 0, 'elapsed': 0.0, 'rows_per_second': 0.0, 'diff': None,
+              'conflicts': [], 'error': None}
+    try:
+        importer = BulkImporter(batch_size=batch_size, incremental=incremental).run(read_price_list(path))
+    except Exception as error:
+        result['error'] = str(error)
+        return result
+    result.update(rows=importer.rows, queries=importer.queries, elapsed=importer.elapsed,
+                  rows_per_second=importer.rows_per_second, diff=importer.diff if incremental else None,
+                  conflicts=importer.conflicts)
+    return result
+
+
+def import_files(paths, batch_size=DEFAULT_BATCH_SIZE, workers=1, incremental=False):
+    """Импорт нескольких файлов, при workers > 1 - в пуле процессов"""
+    if workers <= 1 or len(paths) <= 1:
+        return [import_file(path, batch_size, incremental) for path in paths]
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths)), mp_context=multiprocessing.get_context('fork'),
+                             initializer=_init_worker) as executor:
+        return list(executor.map(import_file, paths, [batch_size] * len(paths), [incremental] * len(paths)))
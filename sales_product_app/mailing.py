@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+logger = logging.getLogger(__name__)
+
+STATUS_NAMES = {'order_new': 'Новый', 'order_canceled': 'Удален'}
+
+
+class MailStats:
+    """Счетчики отправки писем в процессе: письма, пакеты, соединения и время отправки"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.batches = 0
+        self.connections = 0
+        self.send_time = 0.0
+
+    def add(self, counter, value=1):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + value)
+
+    def as_dict(self):
+        with self.lock:
+            return {'sent': self.sent, 'batches': self.batches, 'connections': self.connections,
+                    'send_time': round(self.send_time, 4),
+                    'messages_per_second': round(self.sent / self.send_time, 1) if self.send_time else 0.0}
+
+
+mail_stats = MailStats()
+
+
+def order_messages(notification):
+    """Письма покупателю и поставщикам о событии заказа.
+
+    notification - словарь с ключами event, first_name, last_name, email, order_number и suppliers.
+    """
+    order_number = notification['order_number']
+    status = STATUS_NAMES[notification['event']]
+    messages = [EmailMessage(f'Изменение статуса заказа #{order_number}',
+                             f'{notification["first_name"]} {notification["last_name"]}, cтатус вашего заказа '
+                             f'#{order_number} изменен на "{status}".',
+                             settings.DEFAULT_FROM_EMAIL, [notification['email']])]
+    if notification['suppliers']:
+        if notification['event'] == 'order_new':
+            subject = f'Получен новый заказ #{order_number}'
+            body = f'С деталями заказа #{order_number} ознакомьтесь в разделе "Заказы".'
+        else:
+            subject = f'Изменение статуса заказа #{order_number}'
+            body = f'Cтатус заказа #{order_number} изменен на "{status}".'
+        messages.append(EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, notification['suppliers']))
+    return messages
+
+
+def send_messages(messages):
+    """Отправка пакета писем через одно SMTP-соединение, ошибки SMTP передаются вызывающему"""
+    started = time.perf_counter()
+    connection = get_connection(fail_silently=False)
+    mail_stats.add('connections')
+    with connection:
+        sent = connection.send_messages(messages) or 0
+    elapsed = time.perf_counter() - started
+    mail_stats.add('batches')
+    mail_stats.add('sent', sent)
+    mail_stats.add('send_time', elapsed)
+    logger.info('Sent %d emails in %.2f s', sent, elapsed)
+    return sent
@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from sales_product_app.models import Order
+from sales_product_app.order_headers import refresh_order_headers
+
+
+class Command(BaseCommand):
+    help = 'Create or recalculate order headers from existing order lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Количество заказов в пакете')
+
+    def handle(self, *args, **options):
+        order_numbers = Order.objects.exclude(status='basket').exclude(order_number=''). \
+            order_by('order_number').values_list('order_number', flat=True).distinct()
+        batch, total = [], 0
+        for order_number in order_numbers.iterator():
+            batch.append(order_number)
+            if len(batch) >= options['batch_size']:
+                with transaction.atomic():
+                    total += refresh_order_headers(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                total += refresh_order_headers(batch)
+        self.stdout.write(f'Обработано заказов: {total}')
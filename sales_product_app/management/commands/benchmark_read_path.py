@@ -0,0 +1,173 @@
+import asyncio
+import io
+import json
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.authtoken.models import Token
+
+from sales_product_app.models import CustomUser, OrderHeader, Product
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0
+
+
+class Command(BaseCommand):
+    help = 'Benchmark catalog and order read endpoints under concurrency (ASGI if ASYNC_READ_VIEWS, else WSGI)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=3000, help='Общее количество запросов')
+        parser.add_argument('--concurrency', type=int, default=200, help='Количество одновременных клиентов')
+        parser.add_argument('--threads', type=int, default=8, help='Количество рабочих потоков WSGI-сервера')
+        parser.add_argument('--db-latency', type=float, default=0,
+                            help='Добавочная задержка каждого SQL-запроса в мс (сетевая задержка до БД)')
+        parser.add_argument('--host', default=None, help='Заголовок Host (по умолчанию - первый из ALLOWED_HOSTS)')
+        parser.add_argument('--output', default=None, help='JSON-файл с результатами')
+        parser.add_argument('--baseline', default=None, help='JSON-файл прошлого запуска для сравнения')
+
+    def prepare(self, count):
+        """Пути запросов и токены покупателей (около 15 запросов заказов на покупателя)"""
+        products = list(Product.objects.order_by('?').values_list('id', flat=True)[:1000])
+        if not products:
+            raise CommandError('Каталог пуст, заполните его командой generate_synthetic_data')
+        buyers = list(CustomUser.objects.filter(type='buyer', is_active=True,
+                                                id__in=OrderHeader.objects.values('user_id'))
+                      .order_by('?').values_list('id', flat=True)[:count // 6 // 15 + 1])
+        tokens = [Token.objects.get_or_create(user_id=user_id)[0].key for user_id in buyers]
+        requests = []
+        first = random.getrandbits(24)
+        for number in range(count):
+            product_id = random.choice(products)
+            path, token = random.choice((('/api/v1/shops/', None), ('/api/v1/categories/', None),
+                                         ('/api/v1/products/', None), (f'/api/v1/products/{product_id}/', None),
+                                         (f'/api/v1/products/{product_id}/detail/', None),
+                                         ('/api/v1/orders/', tokens[number % len(tokens)] if tokens else None)))
+            # Отдельный адрес клиента на каждый запрос, чтобы ограничение частоты для анонимов не срабатывало
+            address = first + number
+            requests.append((path, token, f'10.{address >> 16 & 255}.{address >> 8 & 255}.{address & 255}'))
+        return requests
+
+    @staticmethod
+    def install_db_latency(latency):
+        def delay(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def install(sender, connection, **kwargs):
+            if delay not in connection.execute_wrappers:
+                connection.execute_wrappers.append(delay)
+
+        connection_created.connect(install, weak=False)
+        for connection in connections.all():
+            install(None, connection)
+
+    @staticmethod
+    async def call_asgi(handler, host, path, token, client):
+        headers = [(b'host', host.encode())]
+        if token:
+            headers.append((b'authorization', f'Token {token}'.encode()))
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'headers': headers,
+                 'client': (client, 50000), 'server': (host, 80)}
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await handler(scope, receive, send)
+        return status[0]
+
+    @staticmethod
+    def call_wsgi(handler, host, path, token, client):
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                   'SERVER_NAME': host, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': host,
+                   'REMOTE_ADDR': client, 'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(),
+                   'wsgi.url_scheme': 'http', 'wsgi.multithread': True, 'wsgi.multiprocess': False}
+        if token:
+            environ['HTTP_AUTHORIZATION'] = f'Token {token}'
+        status = []
+        response = handler(environ, lambda value, headers, exc_info=None: status.append(int(value.split()[0])))
+        try:
+            b''.join(response)
+        finally:
+            response.close()
+        return status[0]
+
+    async def run(self, mode, requests, concurrency, threads, host):
+        if mode == 'asgi':
+            handler = ASGIHandler()
+
+            async def call(*args):
+                return await self.call_asgi(handler, *args)
+        else:
+            handler = WSGIHandler()
+            executor = ThreadPoolExecutor(max_workers=threads)
+            loop = asyncio.get_running_loop()
+
+            async def call(*args):
+                return await loop.run_in_executor(executor, self.call_wsgi, handler, *args)
+
+        queue = iter(requests)
+        latencies = []
+        errors = Counter()
+
+        async def client():
+            for path, token, address in queue:
+                started = time.perf_counter()
+                status = await call(host, path, token, address)
+                latencies.append(time.perf_counter() - started)
+                if status >= 400:
+                    errors[status] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        if mode != 'asgi':
+            executor.shutdown()
+        return elapsed, latencies, errors
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['concurrency'], options['threads']) < 1:
+            raise CommandError('requests, concurrency и threads должны быть больше 0')
+        mode = 'asgi' if settings.ASYNC_READ_VIEWS else 'wsgi'
+        host = options['host'] or next((name for name in settings.ALLOWED_HOSTS if name != '*'), 'localhost')
+        requests = self.prepare(options['requests'])
+        if options['db_latency']:
+            self.install_db_latency(options['db_latency'] / 1000)
+        # Прогрев: загрузка URL-конфигурации, промежуточных слоев и кэша каталога
+        asyncio.run(self.run(mode, requests[:options['concurrency']], options['concurrency'], options['threads'],
+                             host))
+        elapsed, latencies, errors = asyncio.run(self.run(mode, requests, options['concurrency'], options['threads'],
+                                                          host))
+        result = {'mode': mode, 'requests': len(latencies), 'concurrency': options['concurrency'],
+                  'threads': options['threads'] if mode == 'wsgi' else None, 'db_latency_ms': options['db_latency'],
+                  'rps': round(len(latencies) / elapsed, 1), 'errors': dict(errors),
+                  **{f'p{share}_ms': round(percentile(latencies, share / 100) * 1000, 1) for share in (50, 95, 99)}}
+        self.stdout.write(f'{mode.upper()}: {result["requests"]} запросов, {result["concurrency"]} клиентов, '
+                          f'{result["rps"]} запросов/с, p50 {result["p50_ms"]} мс, p95 {result["p95_ms"]} мс, '
+                          f'p99 {result["p99_ms"]} мс, ошибок {sum(errors.values())} {dict(errors) or ""}')
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf8') as file:
+                baseline = json.load(file)
+            for name in ('rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+                self.stdout.write(f'{name:<8}{baseline[name]:>10} ({baseline["mode"]}) -> {result[name]} ({mode})')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from sales_product_app.synthetic import SyntheticCatalog, next_ids, write_buyers, write_catalog, write_orders, \
+    write_price_lists
+from sales_product_app.models import Shop, Category, Product
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic catalog, buyers and order history in the database or as supplier price lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shops', type=int, default=100, help='Количество магазинов')
+        parser.add_argument('--categories', type=int, default=200, help='Количество категорий')
+        parser.add_argument('--products', type=int, default=100000, help='Количество товаров')
+        parser.add_argument('--buyers', type=int, default=10000, help='Количество покупателей')
+        parser.add_argument('--orders', type=int, default=100000, help='Количество заказов')
+        parser.add_argument('--max-lines', type=int, default=5, help='Наибольшее количество товаров в заказе')
+        parser.add_argument('--days', type=int, default=365, help='Глубина истории заказов в днях')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа для популярности товаров и активности покупателей')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пакета записи в БД')
+        parser.add_argument('--password', default=None,
+                            help='Пароль создаваемых пользователей (без него вход под ними невозможен)')
+        parser.add_argument('--output', default=None,
+                            help='Каталог для прайс-листов магазинов вместо записи в БД (для import_data)')
+        parser.add_argument('--format', choices=('yaml', 'jsonl'), default='yaml', help='Формат прайс-листов')
+        parser.add_argument('--id-offset', type=int, default=0,
+                            help='Сдвиг id магазинов, категорий и товаров в прайс-листах')
+
+    def report(self, name, rows, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{name}: {rows} за {elapsed:.2f} с ({rows / elapsed if elapsed else 0:.0f} строк/с)')
+
+    def handle(self, *args, **options):
+        if min(options['shops'], options['categories'], options['products'], options['buyers'], options['orders']) < 0:
+            raise CommandError('Количество объектов не может быть отрицательным')
+        if options['products'] and not (options['shops'] and options['categories']):
+            raise CommandError('Для товаров нужны магазины и категории')
+        if options['skew'] <= 0 or options['max_lines'] < 1 or options['days'] < 1:
+            raise CommandError('skew, max-lines и days должны быть больше 0')
+        if options['output']:
+            offset = options['id_offset']
+            ids = (offset + 1,) * 3
+        else:
+            ids = next_ids(Shop, Category, Product)
+        catalog = SyntheticCatalog(options['shops'], options['categories'], options['products'], seed=options['seed'],
+                                   shop_id=ids[0], category_id=ids[1], product_id=ids[2])
+        started = time.perf_counter()
+        if options['output']:
+            files, rows = write_price_lists(catalog, options['output'], options['format'])
+            self.report(f'Прайс-листы ({files} файлов в {options["output"]}), товаров', rows, started)
+            return
+        rows = write_catalog(catalog, options['batch_size'], options['password'])
+        self.report(f'Магазины: {options["shops"]}, категории: {options["categories"]}, товары', rows, started)
+        started = time.perf_counter()
+        rows = write_buyers(options['buyers'], options['seed'], options['batch_size'], options['password'])
+        self.report('Покупатели', rows, started)
+        started = time.perf_counter()
+        rows = write_orders(options['orders'], options['max_lines'], options['days'], options['skew'], options['seed'],
+                            options['batch_size'])
+        self.report('Заказы', rows, started)
@@ -0,0 +1,18 @@
+from django.core.management import BaseCommand
+
+from sales_product_app.models import CustomUser, ProductInfo
+from sales_product_app.tasks import generate_thumbnails_async
+from sales_product_app.thumbnails import renditions_ready
+
+
+class Command(BaseCommand):
+    help = 'Queue thumbnail renditions for images that do not have them yet'
+
+    def handle(self, *args, **options):
+        total = 0
+        for model in (CustomUser, ProductInfo):
+            for instance in model.objects.exclude(thumbnail='').only('thumbnail', 'thumbnail_renditions').iterator():
+                if not renditions_ready(instance):
+                    generate_thumbnails_async.delay(model._meta.label, instance.pk)
+                    total += 1
+        self.stdout.write(f'Поставлено в очередь изображений: {total}')
@@ -0,0 +1,69 @@
+import os
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from sales_product_app.importer import DEFAULT_BATCH_SIZE, import_files
+from sales_product_app.readers import PRICE_LIST_EXTENSIONS
+
+
+class Command(BaseCommand):
+    help = 'Load data from a YAML or JSON Lines file into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('yaml_file', type=str, nargs='+',
+                            help='Пути к прайс-листам (.yaml или .jsonl), каталоги с ними или имена файлов в fixtures')
+        parser.add_argument('--bulk', action='store_true',
+                            help='Оставлен для совместимости: импорт всегда выполняется пакетами')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Размер пакета товаров')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Количество процессов для параллельного пакетного импорта файлов')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Записывать только новые, измененные и удаленные товары (по хешу содержимого)')
+
+    def get_path(self, yaml_file):
+        """Поиск файла прайс-листа по указанному пути или в каталоге fixtures"""
+        for path in (yaml_file, os.path.join('fixtures', yaml_file)):
+            if os.path.isfile(path):
+                return path
+        raise CommandError(f'Файл {yaml_file} не найден')
+
+    def get_paths(self, yaml_files):
+        """Список файлов прайс-листов с раскрытием каталогов"""
+        paths = []
+        for yaml_file in yaml_files:
+            if os.path.isdir(yaml_file):
+                paths += sorted(os.path.join(yaml_file, name) for name in os.listdir(yaml_file)
+                                if name.endswith(PRICE_LIST_EXTENSIONS))
+            else:
+                paths.append(self.get_path(yaml_file))
+        if not paths:
+            raise CommandError('Не найдено ни одного прайс-листа')
+        return paths
+
+    def print_summary(self, results, elapsed):
+        """Сводка по времени и скорости импорта каждого файла"""
+        self.stdout.write(f"{'Файл':<40} {'Товаров':>10} {'Время, с':>10} {'Строк/с':>10} {'SQL-запросов':>13}")
+        for result in results:
+            if result['error']:
+                self.stderr.write(f"{result['path']:<40} Ошибка: {result['error']}")
+                continue
+            self.stdout.write(f"{result['path']:<40} {result['rows']:>10} {result['elapsed']:>10.2f} "
+                              f"{result['rows_per_second']:>10.0f} {result['queries']:>13}")
+            if result['diff']:
+                self.stdout.write(f"{'':<40} новых: {result['diff']['inserted']}, "
+                                  f"измененных: {result['diff']['changed']}, "
+                                  f"без изменений: {result['diff']['unchanged']}, "
+                                  f"удаленных: {result['diff']['removed']}")
+            for conflict in result['conflicts']:
+                self.stdout.write(f"{'':<40} {conflict}")
+        rows = sum(result['rows'] for result in results)
+        self.stdout.write(f'Итого: {len(results)} файлов, {rows} товаров за {elapsed:.2f} с '
+                          f'({rows / elapsed if elapsed else 0:.0f} строк/с)')
+
+    def handle(self, *args, **options):
+        paths = self.get_paths(options['yaml_file'])
+        started = time.perf_counter()
+        results = import_files(paths, batch_size=options['batch_size'], workers=options['workers'],
+                               incremental=options['incremental'])
+        self.print_summary(results, time.perf_counter() - started)
@@ -0,0 +1,50 @@
+import time
+import uuid
+
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import throttling
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from sales_product_app import throttling as sliding_throttling
+from sales_product_app.authentication import CachedTokenAuthentication
+from sales_product_app.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Measure per-request authentication and throttling overhead'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Количество запросов')
+
+    def measure(self, name, count, check):
+        check()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(count):
+                check()
+            elapsed = time.perf_counter() - started
+        self.stdout.write(f'{name:<45}{elapsed / count * 1e6:>10.1f} мкс{len(queries) / count:>10.2f} SQL')
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        tag = uuid.uuid4().hex[:8]
+        user = CustomUser.objects.create_user(username=f'overhead-{tag}', email=f'overhead-{tag}@test',
+                                              password=tag, is_active=True)
+        token = Token.objects.create(user=user)
+        try:
+            request = Request(APIRequestFactory().get('/api/v1/basket/', HTTP_AUTHORIZATION=f'Token {token.key}'))
+            request.user = user
+            for name, authentication in (('TokenAuthentication', TokenAuthentication()),
+                                         ('CachedTokenAuthentication', CachedTokenAuthentication())):
+                self.measure(name, count, lambda: authentication.authenticate(request))
+            for name, base in (('DRF UserRateThrottle (cache history)', throttling.UserRateThrottle),
+                               ('Sliding window UserRateThrottle', sliding_throttling.UserRateThrottle)):
+                throttle_class = type(f'Measured{base.__name__}', (base,), {'rate': f'{count * 10}/h'})
+                self.measure(name, count, lambda: throttle_class().allow_request(request, None))
+        finally:
+            user.delete()
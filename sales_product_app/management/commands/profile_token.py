@@ -0,0 +1,10 @@
+from django.core.management import BaseCommand
+
+from sales_product_app.profiling import sign_profile_token
+
+
+class Command(BaseCommand):
+    help = 'Print a signed token that enables profiling of requests sent with it'
+
+    def handle(self, *args, **options):
+        self.stdout.write(sign_profile_token())
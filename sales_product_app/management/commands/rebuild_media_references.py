@@ -0,0 +1,26 @@
+from collections import Counter
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from sales_product_app.media import HASHED_NAME, collect
+from sales_product_app.models import CustomUser, MediaFile, ProductInfo
+
+
+class Command(BaseCommand):
+    help = 'Recount references to content-addressed media files and delete unreferenced ones'
+
+    def handle(self, *args, **options):
+        references = Counter()
+        for model in (CustomUser, ProductInfo):
+            for thumbnail, renditions in model.objects.exclude(thumbnail=''). \
+                    values_list('thumbnail', 'thumbnail_renditions').iterator():
+                references[thumbnail] += 1
+                references.update(path for name, path in (renditions or {}).items() if name != 'source')
+        references = {name: count for name, count in references.items() if HASHED_NAME.search(name)}
+        with transaction.atomic():
+            MediaFile.objects.exclude(name__in=list(references)).update(references=0)
+            MediaFile.objects.bulk_create(
+                [MediaFile(name=name, references=count) for name, count in references.items()],
+                update_conflicts=True, unique_fields=['name'], update_fields=['references'])
+        self.stdout.write(f'Файлов со ссылками: {len(references)}, удалено файлов без ссылок: {collect()}')
@@ -0,0 +1,10 @@
+from django.core.management import BaseCommand
+
+from sales_product_app.routing import refresh_supplier_routes
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product-to-supplier routing table'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Маршрутов поставщиков: {refresh_supplier_routes()}')
@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+
+from sales_product_app.outbox import relay_outbox
+from sales_product_app.tasks import send_order_events
+
+
+class Command(BaseCommand):
+    help = 'Relay pending order events from the outbox table to Celery'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Количество событий в пакете')
+
+    def handle(self, *args, **options):
+        total = relay_outbox(send_order_events, options['batch_size'])
+        self.stdout.write(f'Передано событий: {total}')
@@ -0,0 +1,75 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from sales_product_app.models import Category, CustomUser, Order, Product, ProductInfo
+from sales_product_app.outbox import order_events_disabled
+from sales_product_app.reservations import StockReservationError, reservation_stats, reserve_basket
+
+
+class Command(BaseCommand):
+    help = 'Stress test of concurrent checkouts of one popular product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=200, help='Количество покупателей')
+        parser.add_argument('--threads', type=int, default=32, help='Количество параллельных потоков')
+        parser.add_argument('--stock', type=int, default=100, help='Остаток товара на складе')
+        parser.add_argument('--quantity', type=int, default=1, help='Количество товара в корзине покупателя')
+
+    def setup(self, buyers, stock, quantity):
+        """Создание товара и корзин покупателей"""
+        tag = uuid.uuid4().hex[:8]
+        category, _ = Category.objects.get_or_create(name='Stress test')
+        product = Product.objects.create(name=f'Stress {tag}', category=category)
+        product_info = ProductInfo.objects.create(name=f'Stress {tag}', product=product, quantity_in_stock=stock,
+                                                  price=1, retail_price=1)
+        CustomUser.objects.bulk_create([CustomUser(username=f'stress-{tag}-{i}', email=f'stress-{tag}-{i}@test')
+                                        for i in range(buyers)])
+        users = list(CustomUser.objects.filter(username__startswith=f'stress-{tag}-').values_list('id', flat=True))
+        Order.objects.bulk_create([Order(user_id=user_id, product_info=product_info, quantity=quantity)
+                                   for user_id in users])
+        return product, product_info, users
+
+    def checkout(self, user_id):
+        started = time.perf_counter()
+        try:
+            reserve_basket(user_id)
+            success = True
+        except StockReservationError:
+            success = False
+        finally:
+            connection.close()
+        return success, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        if options['buyers'] < 1 or options['threads'] < 1:
+            raise CommandError('Количество покупателей и потоков должно быть больше 0')
+        product, product_info, users = self.setup(options['buyers'], options['stock'], options['quantity'])
+        lock_wait = reservation_stats.as_dict()['lock_wait']
+        started = time.perf_counter()
+        try:
+            # Синтетическим покупателям не записываются события заказов и не отправляются письма
+            with order_events_disabled(), ThreadPoolExecutor(max_workers=options['threads']) as executor:
+                results = list(executor.map(self.checkout, users))
+            elapsed = time.perf_counter() - started
+            lock_wait = reservation_stats.as_dict()['lock_wait'] - lock_wait
+            product_info.refresh_from_db()
+            sold = Order.objects.filter(product_info=product_info, status='new').count() * options['quantity']
+        finally:
+            CustomUser.objects.filter(id__in=users).delete()
+            product.delete()
+        latencies = sorted(latency for _, latency in results)
+        succeeded = sum(success for success, _ in results)
+        self.stdout.write(f'Оформлено заказов: {succeeded}, отказов: {len(results) - succeeded}')
+        self.stdout.write(f'Продано: {sold}, остаток: {product_info.quantity_in_stock}, '
+                          f'исходный остаток: {options["stock"]}')
+        self.stdout.write(f'Время: {elapsed:.2f} с, пропускная способность: {len(results) / elapsed:.1f} заказов/с')
+        self.stdout.write(f'Задержка p50: {latencies[len(latencies) // 2] * 1000:.1f} мс, '
+                          f'p99: {latencies[int(len(latencies) * 0.99)] * 1000:.1f} мс')
+        self.stdout.write(f'Ожидание блокировок: всего {lock_wait:.2f} с, '
+                          f'в среднем {lock_wait / len(results) * 1000:.1f} мс на оформление')
+        if sold + product_info.quantity_in_stock != options['stock'] or product_info.quantity_in_stock < 0:
+            raise CommandError('Обнаружена перепродажа товара')
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.views.static import serve
+
+from .models import MediaFile
+
+HASHED_NAME = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}(\.\w+)?$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище с адресацией по содержимому.
+
+    Файл сохраняется под именем <каталог upload_to>/<ab>/<sha256><расширение>: загрузка
+    записывается во временный файл по частям с одновременным подсчетом хеша, затем переименовывается.
+    Одинаковые файлы хранятся в одном экземпляре, а их URL не меняются и кэшируются клиентами бессрочно.
+    Перед проверкой наличия файла его запись в MediaFile отмечается временем сохранения (touch), поэтому
+    collect не удалит файл, пока объект, на который он будет записан, не учтет ссылку.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        os.makedirs(self.path(directory), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=self.path(directory), prefix='.upload-')
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(descriptor, 'wb') as file:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    file.write(chunk)
+            value = digest.hexdigest()
+            name = posixpath.join(directory, value[:2], value + extension)
+            touch(name)
+            path = self.path(name)
+            if os.path.exists(path):
+                os.remove(temporary)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.chmod(temporary, self.file_permissions_mode or 0o644)
+                os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+
+def media_names(instance):
+    """Имена файлов, на которые ссылается объект: изображение и его уменьшенные копии.
+
+    Значения читаются из __dict__, чтобы не загружать отложенные поля.
+    """
+    thumbnail = instance.__dict__.get('thumbnail')
+    names = [getattr(thumbnail, 'name', thumbnail)]
+    renditions = instance.__dict__.get('thumbnail_renditions') or {}
+    names += [path for name, path in renditions.items() if name != 'source']
+    return Counter(name for name in names if name)
+
+
+def touch(name):
+    """Создание записи файла или обновление времени его сохранения под блокировкой строки, общей с collect"""
+    MediaFile.objects.update_or_create(name=name, defaults={'stored_at': timezone.now()})
+
+
+def acquire(names):
+    """Увеличение счетчиков ссылок на файлы"""
+    names = Counter(names)
+    if not names:
+        return
+    with transaction.atomic():
+        MediaFile.objects.bulk_create([MediaFile(name=name) for name in sorted(names)], ignore_conflicts=True)
+        for name, count in sorted(names.items()):
+            MediaFile.objects.filter(name=name).update(references=F('references') + count)
+
+
+def release(names):
+    """Уменьшение счетчиков ссылок, файлы без ссылок удаляются после фиксации транзакции.
+
+    Файлы, не учтенные в таблице (загруженные до появления счетчиков), не удаляются.
+    """
+    names = Counter(names)
+    if not names:
+        return
+    with transaction.atomic():
+        for name, count in sorted(names.items()):
+            MediaFile.objects.filter(name=name, references__gte=count).update(references=F('references') - count)
+        transaction.on_commit(lambda: collect(names))
+
+
+def discard(names):
+    """Удаление сохраненных, но не использованных файлов, если на них нет ссылок"""
+    names = set(names)
+    if names:
+        MediaFile.objects.bulk_create([MediaFile(name=name) for name in sorted(names)], ignore_conflicts=True)
+        transaction.on_commit(lambda: collect(names))
+
+
+def collect(names=None):
+    """Удаление файлов без ссылок и их записей, возвращает количество удаленных файлов.
+
+    Файлы, сохраненные за последние MEDIA_COLLECT_GRACE секунд, пропускаются: одновременная загрузка
+    того же содержимого могла получить это имя, но еще не увеличить счетчик ссылок. Их удалит
+    следующий запуск (периодическая задача collect-media).
+    """
+    stored_before = timezone.now() - timedelta(seconds=getattr(settings, 'MEDIA_COLLECT_GRACE', 10 * 60))
+    with transaction.atomic():
+        files = MediaFile.objects.select_for_update().filter(references=0, stored_at__lt=stored_before)
+        if names is not None:
+            files = files.filter(name__in=list(names))
+        unused = list(files.values_list('name', flat=True))
+        for name in unused:
+            default_storage.delete(name)
+        MediaFile.objects.filter(name__in=unused, references=0).delete()
+    return len(unused)
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    """Раздача медиафайлов с бессрочным кэшированием файлов с именем по хешу содержимого.
+
+    Используется только при DEBUG (static() без DEBUG не добавляет маршрут), в рабочем окружении файлы
+    раздает прокси-сервер, и заголовок Cache-Control для имен по хешу задается в его настройках.
+    """
+    response = serve(request, path, document_root, show_indexes)
+    if HASHED_NAME.search(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
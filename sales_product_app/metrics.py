@@ -0,0 +1,223 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+
+class Histogram:
+    """Гистограмма с накопительными корзинами в формате Prometheus"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Пары (верхняя граница корзины, накопленное количество), включая +Inf"""
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield bound, cumulative
+
+
+class MetricsRegistry:
+    """Гистограммы и счетчики запросов по представлениям в памяти процесса"""
+
+    metrics = {
+        'http_request_duration_seconds': ('Total request latency', LATENCY_BUCKETS),
+        'http_request_db_seconds': ('Time spent in SQL queries', LATENCY_BUCKETS),
+        'http_request_serialize_seconds': ('Time spent building response data in serializers', LATENCY_BUCKETS),
+        'http_request_render_seconds': ('Time spent in the response renderer (excluding serializer .data)',
+                                        LATENCY_BUCKETS),
+        'http_request_queries': ('SQL queries per request', QUERY_BUCKETS),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.slow_queries = {}
+
+    def observe(self, view, method, values):
+        with self.lock:
+            for name, value in values.items():
+                key = (name, view, method)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(self.metrics[name][1])
+                histogram.observe(value)
+
+    def count_slow_query(self, view):
+        with self.lock:
+            self.slow_queries[view] = self.slow_queries.get(view, 0) + 1
+
+    def render(self):
+        """Текст в формате Prometheus exposition 0.0.4"""
+        lines = []
+        with self.lock:
+            for name, (description, _) in self.metrics.items():
+                lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+                for (metric, view, method), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    labels = f'view="{view}",method="{method}"'
+                    for bound, count in histogram.samples():
+                        lines.append(f'{name}_bucket{{{labels},le="{"+Inf" if bound == float("inf") else bound}"}} '
+                                     f'{count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+            lines += ['# HELP db_slow_queries_total SQL queries slower than METRICS_SLOW_QUERY_MS',
+                      '# TYPE db_slow_queries_total counter']
+            lines += [f'db_slow_queries_total{{view="{view}"}} {count}'
+                      for view, count in sorted(self.slow_queries.items())]
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+
+def view_name(view_func):
+    """Имя класса представления (или функции) для меток метрик"""
+    view = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None) or view_func
+    return getattr(view, '__name__', 'unknown')
+
+
+class QueryTimer:
+    """Обертка выполнения SQL: количество и время запросов, запись медленных запросов в лог"""
+
+    def __init__(self, request):
+        self.request = request
+        self.count = 0
+        self.elapsed = 0.0
+        self.slow = getattr(settings, 'METRICS_SLOW_QUERY_MS', 100) / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.elapsed += elapsed
+            if elapsed >= self.slow:
+                view = getattr(self.request, 'metrics_view', 'unknown')
+                metrics_registry.count_slow_query(view)
+                logger.warning('Slow query in %s (%.1f ms): %s', view, elapsed * 1000, sql)
+
+
+# Текущий HTTP-запрос для учета времени сериализации (передается в потоки sync_to_async так же, как таймер)
+current_request = contextvars.ContextVar('current_request', default=None)
+
+
+class TimedSerializerMixin:
+    """Учет времени построения данных ответа сериализатором (serializer .data) в метриках запроса.
+
+    Учитывается верхний сериализатор (для many=True - каждый элемент списка), вложенные сериализаторы
+    входят во время родителя.
+    """
+
+    def to_representation(self, instance):
+        request = current_request.get()
+        top = self.parent is None or self.parent.parent is None and getattr(self.parent, 'child', None) is self
+        if request is None or not top:
+            return super().to_representation(instance)
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            request.metrics_serialize += time.perf_counter() - started
+
+
+# Таймер SQL-запросов текущего HTTP-запроса. Соединения с БД принадлежат потокам, а запросы асинхронных
+# представлений выполняются в потоках sync_to_async, поэтому таймер передается через contextvar,
+# который копируется в эти потоки, а обертка выполнения SQL установлена на каждом соединении.
+current_query_timer = contextvars.ContextVar('current_query_timer', default=None)
+
+
+def execute_with_timer(execute, sql, params, many, context):
+    timer = current_query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(connection):
+    """Установка обертки первой в списке, чтобы не нарушать снятие временных оберток execute_wrapper"""
+    if execute_with_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, execute_with_timer)
+
+
+class RequestMetricsMiddleware:
+    """Учет задержки, количества и времени SQL-запросов, времени сериализации и рендеринга ответа по представлениям.
+
+    Работает и в синхронном (WSGI), и в асинхронном (ASGI) стеке middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def start(self, request):
+        request.metrics_view = 'unresolved'
+        request.metrics_render = 0.0
+        request.metrics_serialize = 0.0
+        timer = QueryTimer(request)
+        return time.perf_counter(), timer, (current_query_timer.set(timer), current_request.set(request))
+
+    def finish(self, request, started, timer, tokens):
+        current_query_timer.reset(tokens[0])
+        current_request.reset(tokens[1])
+        method = request.method if request.method in METHODS else 'OTHER'
+        metrics_registry.observe(request.metrics_view, method, {
+            'http_request_duration_seconds': time.perf_counter() - started,
+            'http_request_db_seconds': timer.elapsed,
+            'http_request_serialize_seconds': request.metrics_serialize,
+            'http_request_render_seconds': request.metrics_render,
+            'http_request_queries': timer.count,
+        })
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started, timer, tokens = self.start(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self.finish(request, started, timer, tokens)
+
+    async def __acall__(self, request):
+        started, timer, tokens = self.start(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finish(request, started, timer, tokens)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = view_name(view_func)
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def rendered(response):
+            request.metrics_render = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
@@ -1,8 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
-from imagekit.models import ImageSpecField, ProcessedImageField
-from imagekit.processors import ResizeToFill, TrimBorderColor
 
 STATE_CHOICES = (
     ('basket', 'Статус корзины'),
@@ -15,6 +14,11 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+OUTBOX_EVENT_CHOICES = (
+    ('order_new', 'Новый заказ'),
+    ('order_canceled', 'Отмена заказа'),
+)
+
 USER_TYPE_CHOICES = (
     ('supplier', 'Поставщик'),
     ('buyer', 'Покупатель'),
@@ -33,8 +37,10 @@ class CustomUser(AbstractUser):
     company = models.CharField(max_length=50, verbose_name='Компания')
     position = models.CharField(max_length=30, verbose_name='Должность')
     type = models.CharField(max_length=10, verbose_name='Тип пользователя', choices=USER_TYPE_CHOICES, default='buyer')
-    thumbnail = ProcessedImageField(upload_to='images', processors=[ResizeToFill(800, 800)], format='JPEG',
-                                    options={'quality': 100}, blank=True, verbose_name='Изображение профиля')
+    thumbnail = models.ImageField(upload_to='images', blank=True, verbose_name='Изображение профиля')
+    thumbnail_renditions = models.JSONField(default=dict, blank=True, editable=False,
+                                            verbose_name='Уменьшенные копии изображения')
+    order_sequence = models.PositiveIntegerField(default=0, editable=False, verbose_name='Последний номер заказа')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
@@ -79,6 +85,7 @@ class Product(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name='Название')
     category = models.ForeignKey(Category, blank=True, verbose_name='Категории',
                                  related_name='product_category', on_delete=models.CASCADE)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Продукт'
@@ -97,9 +104,12 @@ class ProductInfo(models.Model):
                                 related_name='product_name', on_delete=models.CASCADE)
     shop = models.ForeignKey(Shop, blank=True, null=True, verbose_name='Магазины',
                              related_name='productinfo_shop', on_delete=models.CASCADE)
-    thumbnail = ProcessedImageField(upload_to='images', processors=[ResizeToFill(800, 800)], format='JPEG',
-                                    options={'quality': 100}, blank=True)
+    thumbnail = models.ImageField(upload_to='images', blank=True)
+    thumbnail_renditions = models.JSONField(default=dict, blank=True, editable=False,
+                                            verbose_name='Уменьшенные копии изображения')
     basket = models.BooleanField(default=False)
+    content_hash = models.CharField(max_length=40, blank=True, editable=False, verbose_name='Хеш содержимого')
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Информация о продукте'
@@ -122,6 +132,9 @@ class ProductParameter(models.Model):
     class Meta:
         verbose_name = 'Параметр продукта'
         verbose_name_plural = 'Параметры продуктов'
+        constraints = [
+            models.UniqueConstraint(fields=['product_info', 'parameter'], name='unique_product_parameter'),
+        ]
 
 
 class Parameter(models.Model):
@@ -135,23 +148,100 @@ class Parameter(models.Model):
         return self.name
 
 
+class SupplierRoute(models.Model):
+    product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте', related_name='supplier_routes',
+                                     on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='supplier_routes', on_delete=models.CASCADE)
+    supplier = models.ForeignKey(CustomUser, verbose_name='Поставщик', related_name='supplier_routes',
+                                 blank=True, null=True, on_delete=models.SET_NULL)
+    email = models.EmailField(verbose_name='Email поставщика', blank=True)
+
+    class Meta:
+        verbose_name = 'Маршрут поставщика'
+        verbose_name_plural = 'Маршруты поставщиков'
+        constraints = [
+            models.UniqueConstraint(fields=['product_info', 'shop'], name='unique_supplier_route'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_info_id} -> {self.shop_id}'
+
+
 class Order(models.Model):
     user = models.ForeignKey(CustomUser, verbose_name='Пользователь', related_name='orders', on_delete=models.CASCADE)
-    date = models.DateField(verbose_name='Дата заказа', auto_now_add=True)
+    date = models.DateField(verbose_name='Дата заказа', auto_now_add=True, db_index=True)
     status = models.CharField(max_length=30, choices=STATE_CHOICES, verbose_name='Статус', default='basket')
     quantity = models.PositiveIntegerField(verbose_name='Количество', default=1)
     product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте',
                                      related_name='orders', on_delete=models.CASCADE)
-    order_number = models.CharField(verbose_name='Номер заказа', blank=True)
+    order_number = models.CharField(max_length=50, verbose_name='Номер заказа', blank=True, db_index=True)
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            models.Index(fields=['user', '-date'], name='order_user_date_idx'),
+        ]
 
     def __str__(self):
         return self.product_info.name
 
 
+class OrderHeader(models.Model):
+    user = models.ForeignKey(CustomUser, verbose_name='Пользователь', related_name='order_headers',
+                             on_delete=models.CASCADE)
+    order_number = models.CharField(max_length=50, unique=True, verbose_name='Номер заказа')
+    date = models.DateField(verbose_name='Дата заказа')
+    status = models.CharField(max_length=30, choices=STATE_CHOICES, verbose_name='Статус', default='new')
+    total = models.PositiveIntegerField(verbose_name='Сумма заказа', default=0)
+    city = models.CharField(max_length=50, verbose_name='Город', blank=True)
+    street = models.CharField(max_length=100, verbose_name='Улица', blank=True)
+    house = models.CharField(max_length=20, verbose_name='Дом', blank=True)
+    phone = models.CharField(max_length=20, verbose_name='Телефон', blank=True)
+
+    class Meta:
+        verbose_name = 'Заголовок заказа'
+        verbose_name_plural = 'Заголовки заказов'
+        indexes = [
+            models.Index(fields=['user', '-date', '-id'], name='orderheader_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return self.order_number
+
+
+class OutboxEvent(models.Model):
+    user = models.ForeignKey(CustomUser, verbose_name='Пользователь', related_name='outbox_events',
+                             on_delete=models.CASCADE)
+    event = models.CharField(max_length=30, choices=OUTBOX_EVENT_CHOICES, verbose_name='Событие')
+    order_number = models.CharField(max_length=50, verbose_name='Номер заказа')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name='Передано в очередь')
+
+    class Meta:
+        verbose_name = 'Событие для отправки'
+        verbose_name_plural = 'Исходящие события'
+        indexes = [
+            models.Index(fields=['processed_at', 'id'], name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.event} {self.order_number}'
+
+
+class MediaFile(models.Model):
+    name = models.CharField(max_length=255, unique=True, verbose_name='Путь к файлу')
+    references = models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')
+    stored_at = models.DateTimeField(default=timezone.now, verbose_name='Время последнего сохранения')
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+    def __str__(self):
+        return self.name
+
+
 class Contact(models.Model):
     user = models.ForeignKey(CustomUser, blank=True, verbose_name='Пользователь',
                              related_name='contacts', on_delete=models.CASCADE)
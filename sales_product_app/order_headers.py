@@ -0,0 +1,66 @@
+from collections import defaultdict
+
+from django.db.models import F, Max, Min, Sum
+
+from .models import STATE_CHOICES, Contact, Order, OrderHeader
+
+CONTACT_FIELDS = ('city', 'street', 'house', 'phone')
+# Порядок статусов выполнения заказа от начального к конечному
+STATUS_PROGRESS = [status for status, _ in STATE_CHOICES if status not in ('basket', 'canceled')]
+
+
+def order_status(statuses):
+    """Статус заказа по статусам его строк.
+
+    Если статусы строк совпадают - этот статус. Иначе отмененные строки не учитываются, а статус
+    заказа - наименее продвинутый из остальных: заказ собран, когда собраны все его строки.
+    """
+    statuses = set(statuses)
+    if len(statuses) == 1:
+        return statuses.pop()
+    active = [status for status in statuses if status in STATUS_PROGRESS]
+    return min(active, key=STATUS_PROGRESS.index) if active else 'canceled'
+
+
+def contact_snapshot(contact):
+    """Копия адреса и телефона покупателя на момент оформления заказа"""
+    return {field: str((contact or {}).get(field, '')) for field in CONTACT_FIELDS}
+
+
+def create_order_header(user_id, order_number, order_ids, contact=None):
+    """Создание заголовка оформленного заказа с итоговой суммой по его строкам"""
+    lines = Order.objects.filter(id__in=order_ids). \
+        aggregate(total=Sum(F('product_info__retail_price') * F('quantity')), date=Min('date'))
+    return OrderHeader.objects.create(user_id=user_id, order_number=order_number, date=lines['date'],
+                                      status='new', total=lines['total'] or 0, **contact_snapshot(contact))
+
+
+def refresh_order_headers(order_numbers):
+    """Пересчет статуса (order_status), даты и суммы заголовков заказов по их строкам.
+
+    Отсутствующие заголовки создаются с контактами покупателя, заголовки без строк удаляются.
+    """
+    order_numbers = {order_number for order_number in order_numbers if order_number}
+    if not order_numbers:
+        return 0
+    groups = Order.objects.filter(order_number__in=order_numbers).exclude(status='basket'). \
+        values('order_number', 'status'). \
+        annotate(user_id=Max('user_id'), date=Min('date'),
+                 total=Sum(F('product_info__retail_price') * F('quantity'))).order_by()
+    headers = defaultdict(list)
+    for group in groups:
+        headers[group['order_number']].append(group)
+    rows = [{'order_number': order_number, 'user_id': groups[0]['user_id'],
+             'date': min(group['date'] for group in groups),
+             'status': order_status(group['status'] for group in groups),
+             'total': sum(group['total'] or 0 for group in groups)}
+            for order_number, groups in headers.items()]
+    contacts = {contact['user_id']: contact for contact in
+                Contact.objects.filter(user_id__in={row['user_id'] for row in rows}).values('user_id', *CONTACT_FIELDS)}
+    OrderHeader.objects.bulk_create(
+        [OrderHeader(user_id=row['user_id'], order_number=row['order_number'], date=row['date'],
+                     status=row['status'], total=row['total'] or 0, **contact_snapshot(contacts.get(row['user_id'])))
+         for row in rows],
+        update_conflicts=True, unique_fields=['order_number'], update_fields=['date', 'status', 'total'])
+    OrderHeader.objects.filter(order_number__in=order_numbers - {row['order_number'] for row in rows}).delete()
+    return len(rows)
@@ -0,0 +1,94 @@
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Количество активных order_events_disabled() (общее для потоков процесса)
+_disabled_lock = threading.Lock()
+_disabled = 0
+
+
+@contextmanager
+def order_events_disabled():
+    """Отключение записи событий заказов и запуска их передачи в Celery во всех потоках процесса.
+
+    Для нагрузочных проверок на синтетических покупателях: уведомления им не отправляются.
+    """
+    global _disabled
+    with _disabled_lock:
+        _disabled += 1
+    try:
+        yield
+    finally:
+        with _disabled_lock:
+            _disabled -= 1
+
+
+def schedule_relay():
+    """Отложенный запуск передачи событий в Celery.
+
+    События, записанные за время задержки, передаются одним пакетом, следующие запуски находят
+    очередь пустой. При недоступности брокера события передаст периодическая задача.
+    """
+    from .tasks import relay_outbox_async
+
+    try:
+        relay_outbox_async.apply_async(countdown=getattr(settings, 'OUTBOX_RELAY_DELAY', 2))
+    except Exception as error:
+        logger.warning('Outbox relay was not scheduled: %s', error)
+
+
+def record_order_events(event, user_id, order_numbers):
+    """Запись событий заказов в той же транзакции, что и изменение статуса.
+
+    Передача в Celery запускается только после фиксации транзакции, при откате события исчезают
+    вместе с изменением статуса.
+    """
+    if _disabled:
+        return []
+    events = [OutboxEvent(user_id=user_id, event=event, order_number=order_number)
+              for order_number in dict.fromkeys(order_numbers) if order_number]
+    OutboxEvent.objects.bulk_create(events)
+    if events:
+        transaction.on_commit(schedule_relay)
+    return events
+
+
+def get_supplier_emails(order_numbers):
+    """Адреса поставщиков по номерам заказов одним запросом по таблице маршрутов: {order_number: [email, ...]}"""
+    rows = Order.objects.filter(order_number__in=set(order_numbers)). \
+        values_list('order_number', 'product_info__supplier_routes__email').distinct()
+    emails = defaultdict(list)
+    for order_number, email in rows:
+        if email:
+            emails[order_number].append(email)
+    return emails
+
+
+def relay_outbox(send, batch_size=None):
+    """Передача необработанных событий пакетами в функцию send(events, {order_number: [email, ...]}).
+
+    Пакет блокируется (SKIP LOCKED), поэтому параллельные запуски не передают события дважды.
+    События помечаются обработанными в той же транзакции; если send завершается ошибкой, пакет
+    остается необработанным. Возвращает количество переданных событий.
+    """
+    batch_size = batch_size or getattr(settings, 'OUTBOX_BATCH_SIZE', 100)
+    total = 0
+    while True:
+        with transaction.atomic():
+            events = list(OutboxEvent.objects.select_for_update(skip_locked=True, of=('self',)).
+                          filter(processed_at=None).select_related('user').order_by('id')[:batch_size])
+            if events:
+                send(events, get_supplier_emails([event.order_number for event in events]))
+            OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(processed_at=timezone.now())
+        total += len(events)
+        if len(events) < batch_size:
+            return total
@@ -0,0 +1,106 @@
+import json
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class KeysetPagination(CursorPagination):
+    """Курсорная (keyset) пагинация: страница N стоит столько же, сколько первая.
+
+    Курсор непрозрачный (base64), размер страницы задается KEYSET_PAGE_SIZE и параметром ?page_size=.
+    Сортировка ?ordering= учитывается, если поле разрешено в ordering_fields представления.
+    Последний ключ сортировки всегда id, а позиция курсора - значения всех ключей, поэтому
+    следующая страница выбирается условием (a, id) > (a0, id0) без пропусков и повторов строк
+    с одинаковым значением первого ключа.
+    """
+    page_size = getattr(settings, 'KEYSET_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = OrderingFilter().get_ordering(request, queryset, view) \
+            if OrderingFilter in getattr(view, 'filter_backends', []) else None
+        if not ordering:
+            ordering = (self.ordering,) if isinstance(self.ordering, str) else self.ordering
+        return self.with_tiebreaker(tuple(ordering))
+
+    @staticmethod
+    def with_tiebreaker(ordering):
+        """Дополнение сортировки уникальным ключом id (в направлении первого ключа)"""
+        if ordering[-1].lstrip('-') in ('id', 'pk'):
+            return ordering
+        return ordering + ('-id' if ordering[0].startswith('-') else 'id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, position = self.cursor if self.cursor is not None else (0, False, None)
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.keyset_filter(json.loads(position), reverse))
+            except (ValueError, TypeError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        following = self._get_position_from_instance(results[-1], self.ordering) \
+            if len(results) > len(self.page) else None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None or offset > 0, following is not None
+            self.next_position, self.previous_position = position, following
+        else:
+            self.has_next, self.has_previous = following is not None, position is not None or offset > 0
+            self.next_position, self.previous_position = following, position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def keyset_filter(self, values, reverse):
+        """Строки после позиции values в порядке выборки: (a > a0) или (a = a0 и b > b0) или ..."""
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise ValueError(values)
+        conditions = []
+        for index, order in enumerate(self.ordering):
+            field = order.lstrip('-')
+            lookup = 'lt' if order.startswith('-') != reverse else 'gt'
+            equal = {key.lstrip('-'): value for key, value in zip(self.ordering[:index], values)}
+            conditions.append(Q(**equal, **{f'{field}__{lookup}': values[index]}))
+        return reduce(or_, conditions)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = [instance[order.lstrip('-')] if isinstance(instance, dict) else getattr(instance, order.lstrip('-'))
+                  for order in ordering]
+        return json.dumps(values, default=str)
+
+
+class ProductPagination(KeysetPagination):
+    """Пагинация списка товаров: по id, по запрошенной сортировке или по порядку бэкенда поиска"""
+    ordering = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        # Порядок бэкенда поиска (релевантность, затем схожесть по триграммам) дополняется id
+        if 'rank' in queryset.query.annotations and not request.query_params.get('ordering'):
+            return tuple(queryset.query.order_by) + ('id',)
+        return super().get_ordering(request, queryset, view)
+
+
+class OrderPagination(KeysetPagination):
+    """Пагинация заказов покупателя по дате"""
+    ordering = ('-date', '-id')
@@ -0,0 +1,170 @@
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+
+PROFILE_SALT = 'sales_product_app.profiling'
+
+
+def sign_profile_token():
+    """Подписанный токен для профилирования запросов (заголовок X-Profile или параметр ?profile=)"""
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign('profile')
+
+
+def check_profile_token(value):
+    try:
+        max_age = getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 60 * 60)
+        signing.TimestampSigner(salt=PROFILE_SALT).unsign(value, max_age=max_age)
+        return True
+    except signing.BadSignature:
+        return False
+
+
+class StackSampler:
+    """Сэмплирующий профилировщик: стек потока запроса снимается каждые interval секунд.
+
+    Результат - файл свернутых стеков (collapsed stacks) для построения flamegraph.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def enable(self):
+        self.thread.start()
+
+    def disable(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def dump_stats(self, path):
+        with open(path, 'w', encoding='utf8') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+def enforce_retention(directory):
+    """Удаление самых старых профилей сверх PROFILE_MAX_FILES файлов и PROFILE_MAX_BYTES байт"""
+    max_files = getattr(settings, 'PROFILE_MAX_FILES', 200)
+    max_bytes = getattr(settings, 'PROFILE_MAX_BYTES', 200 * 1024 * 1024)
+    files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(('.prof', '.collapsed')):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort(reverse=True)
+    total = 0
+    for number, (_, size, path) in enumerate(files):
+        total += size
+        if number >= max_files or total > max_bytes:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class RequestProfilerMiddleware:
+    """Профилирование отдельных запросов целиком (ORM, сериализация, рендеринг).
+
+    Запрос профилируется по подписанному токену в заголовке X-Profile или параметре ?profile=,
+    по ?profile=1 для сотрудника, вошедшего через сессию, или случайно с вероятностью PROFILE_SAMPLE_RATE.
+    Режим PROFILE_MODE: 'cprofile' (файл .prof) или 'sample' (свернутые стеки .collapsed).
+    Имя файла профиля возвращается в заголовке X-Profile-File.
+    В асинхронном стеке (ASGI) профилируется поток цикла событий, SQL-запросы выполняются в других потоках.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def requested(request):
+        return request.headers.get('X-Profile') or request.GET.get('profile')
+
+    def should_profile(self, request):
+        value = self.requested(request)
+        if value:
+            if check_profile_token(value):
+                return True
+            user = getattr(request, 'user', None)
+            if value == '1' and user is not None and user.is_staff:
+                return True
+        rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        return rate > 0 and random.random() < rate
+
+    def start(self):
+        if getattr(settings, 'PROFILE_MODE', 'cprofile') == 'sample':
+            profiler = StackSampler(threading.get_ident(), getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.001))
+            extension = 'collapsed'
+        else:
+            profiler = cProfile.Profile()
+            extension = 'prof'
+        profiler.enable()
+        return profiler, extension, time.perf_counter()
+
+    def finish(self, request, response, profiler, extension, started):
+        elapsed = int((time.perf_counter() - started) * 1000)
+        directory = getattr(settings, 'PROFILE_DIR', 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        view = getattr(request, 'metrics_view', None) or request.path.strip('/')
+        view = re.sub(r'[^\w-]+', '_', view)[:60] or 'root'
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        name = f'{stamp}-{request.method}-{view}-{elapsed}ms-{uuid.uuid4().hex[:8]}.{extension}'
+        profiler.dump_stats(os.path.join(directory, name))
+        enforce_retention(directory)
+        response['X-Profile-File'] = name
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+        profiler, extension, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        return self.finish(request, response, profiler, extension, started)
+
+    async def __acall__(self, request):
+        # Пользователь сессии загружается из БД, поэтому проверка с ?profile= выполняется в потоке
+        if self.requested(request):
+            profile = await sync_to_async(self.should_profile)(request)
+        else:
+            profile = self.should_profile(request)
+        if not profile:
+            return await self.get_response(request)
+        profiler, extension, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+        return await sync_to_async(self.finish)(request, response, profiler, extension, started)
@@ -0,0 +1,65 @@
+import json
+
+import yaml
+
+SECTIONS = ('shop', 'categories', 'goods')
+PRICE_LIST_EXTENSIONS = ('.yaml', '.yml', '.jsonl', '.ndjson')
+
+
+def iter_yaml(file):
+    """Потоковое чтение прайс-листа в формате YAML.
+
+    Файл разбирается по событиям, в память строится только один элемент раздела за раз.
+    Возвращает пары (раздел, элемент) для разделов shop, categories и goods.
+    """
+    loader = yaml.SafeLoader(file)
+    try:
+        loader.get_event()
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        loader.get_event()
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise yaml.YAMLError('Прайс-лист должен быть словарем с разделами shop, categories, goods')
+        loader.get_event()
+        while not loader.check_event(yaml.MappingEndEvent):
+            section = loader.get_event().value
+            if loader.check_event(yaml.SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(yaml.SequenceEndEvent):
+                    yield section, _construct_next(loader)
+                loader.get_event()
+            else:
+                value = _construct_next(loader)
+                if value is not None:
+                    yield section, value
+    finally:
+        loader.dispose()
+
+
+def _construct_next(loader):
+    """Построение одного узла YAML в объект Python"""
+    node = loader.compose_node(None, None)
+    loader.anchors = {}
+    return loader.construct_document(node)
+
+
+def iter_jsonl(file):
+    """Потоковое чтение прайс-листа в формате JSON Lines.
+
+    Каждая строка - объект с одним ключом-разделом, например {"goods": {"id": 1, ...}}.
+    """
+    for line_number, line in enumerate(file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        entry = json.loads(line)
+        if not isinstance(entry, dict) or len(entry) != 1:
+            raise ValueError(f'Строка {line_number}: ожидается объект с одним разделом {SECTIONS}')
+        yield next(iter(entry.items()))
+
+
+def read_price_list(path):
+    """Потоковое чтение прайс-листа из файла, формат определяется по расширению"""
+    reader = iter_jsonl if str(path).endswith(('.jsonl', '.ndjson')) else iter_yaml
+    with open(path, 'r', encoding='utf8') as file:
+        yield from reader(file)
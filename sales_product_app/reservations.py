@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import CustomUser, Order, OrderHeader, ProductInfo
+from .order_headers import create_order_header
+from .outbox import record_order_events
+
+RESERVED_STATUSES = ('new', 'confirmed', 'assembled')
+
+
+class StockReservationError(Exception):
+    """Недостаточно товара на складе для оформления заказа"""
+
+    def __init__(self, product_info_id, name=''):
+        self.product_info_id = product_info_id
+        super().__init__(f"Недостаточно товара '{name or product_info_id}' на складе")
+
+
+class ReservationStats:
+    """Счетчики резервирования в процессе: успешные и неудачные списания, время ожидания блокировок"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reserved = 0
+        self.failed = 0
+        self.released = 0
+        self.lock_wait = 0.0
+
+    def add(self, counter, value=1):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + value)
+
+    def as_dict(self):
+        with self.lock:
+            return {'reserved': self.reserved, 'failed': self.failed, 'released': self.released,
+                    'lock_wait': self.lock_wait}
+
+
+reservation_stats = ReservationStats()
+
+
+def _lock_orders(queryset):
+    """Блокировка строк заказов в порядке id, возвращает список (id, product_info_id, quantity, status)"""
+    started = time.perf_counter()
+    orders = list(queryset.select_for_update().order_by('id').
+                  values_list('id', 'product_info_id', 'quantity', 'status'))
+    reservation_stats.add('lock_wait', time.perf_counter() - started)
+    return orders
+
+
+def _lock_stock(product_info_ids):
+    """Блокировка строк товаров в порядке id, возвращает список (id, quantity_in_stock, name)"""
+    started = time.perf_counter()
+    stock = list(ProductInfo.objects.filter(id__in=product_info_ids).select_for_update().order_by('id').
+                 values_list('id', 'quantity_in_stock', 'name'))
+    reservation_stats.add('lock_wait', time.perf_counter() - started)
+    return stock
+
+
+def _totals(orders):
+    """Суммарное количество по товарам в порядке id товара"""
+    totals = defaultdict(int)
+    for _, product_info_id, quantity, _ in orders:
+        totals[product_info_id] += quantity
+    return sorted(totals.items())
+
+
+def _by_product(totals):
+    """Количество по id товара для изменения остатков нескольких товаров одним UPDATE"""
+    return Case(*(When(id=product_info_id, then=Value(quantity)) for product_info_id, quantity in totals),
+                output_field=IntegerField())
+
+
+def allocate_order_number(user_id):
+    """Выделение номера заказа из последовательности пользователя.
+
+    Счетчик увеличивается одним UPDATE, который блокирует строку пользователя до конца транзакции,
+    поэтому параллельные оформления получают разные номера. При первом выделении счетчик
+    продолжает номера заказов, оформленных до появления последовательности.
+    """
+    users = CustomUser.objects.filter(id=user_id)
+    users.update(order_sequence=F('order_sequence') + 1)
+    number = users.values_list('order_sequence', flat=True).get()
+    if number == 1:
+        numbers = Order.objects.filter(user_id=user_id).exclude(order_number='').\
+            values_list('order_number', flat=True).distinct()
+        previous = max((int(value.rpartition('-')[2]) for value in numbers
+                        if value.rpartition('-')[2].isdigit()), default=0)
+        if previous:
+            number = previous + 1
+            users.update(order_sequence=number)
+    return f'{user_id}-{number}'
+
+
+def reserve_basket(user_id, contact=None):
+    """Оформление корзины: списание остатков, выделение номера заказа и перевод в статус 'Новый'.
+
+    Строки товаров блокируются в порядке id, поэтому параллельные оформления не блокируют друг друга
+    взаимно, затем остатки всех товаров корзины уменьшаются одним условным UPDATE ... SET
+    quantity_in_stock = quantity_in_stock - CASE id ... END WHERE quantity_in_stock >= CASE id ... END:
+    больше, чем есть на складе, не продается, а число запросов не зависит от размера корзины.
+    При нехватке товара транзакция откатывается целиком. Номер заказа выделяется за O(1) и проставляется
+    только строкам этой корзины, заголовок заказа создается с итоговой суммой и копией контактов, событие
+    для уведомлений записывается в таблицу исходящих событий. Возвращает номер заказа.
+    """
+    with transaction.atomic():
+        orders = _lock_orders(Order.objects.filter(user_id=user_id, status='basket'))
+        if not orders:
+            return None
+        totals = _totals(orders)
+        stock = {product_info_id: (quantity_in_stock, name) for product_info_id, quantity_in_stock, name in
+                 _lock_stock([product_info_id for product_info_id, _ in totals])}
+        shortage = [product_info_id for product_info_id, needed in totals
+                    if stock.get(product_info_id, (0, ''))[0] < needed]
+        if not shortage:
+            quantity = _by_product(totals)
+            updated = ProductInfo.objects.filter(id__in=stock, quantity_in_stock__gte=quantity). \
+                update(quantity_in_stock=F('quantity_in_stock') - quantity)
+            # Без SELECT FOR UPDATE остаток мог измениться после чтения
+            shortage = [] if updated == len(totals) else [product_info_id for product_info_id, _ in totals]
+        if shortage:
+            reservation_stats.add('failed')
+            raise StockReservationError(shortage[0], stock.get(shortage[0], (0, ''))[1])
+        order_number = allocate_order_number(user_id)
+        order_ids = [order[0] for order in orders]
+        Order.objects.filter(id__in=order_ids).update(status='new', order_number=order_number)
+        create_order_header(user_id, order_number, order_ids, contact)
+        record_order_events('order_new', user_id, [order_number])
+    reservation_stats.add('reserved')
+    return order_number
+
+
+def release_orders(user_id):
+    """Отмена заказов пользователя с возвратом зарезервированных остатков на склад и записью событий отмены"""
+    with transaction.atomic():
+        orders = _lock_orders(Order.objects.filter(user_id=user_id).exclude(status__in=('basket', 'canceled')))
+        reserved = [order for order in orders if order[3] in RESERVED_STATUSES]
+        totals = _totals(reserved)
+        if totals:
+            # Строки товаров блокируются в порядке id, как при оформлении, иначе возможна взаимная блокировка
+            product_info_ids = [product_info_id for product_info_id, _ in totals]
+            _lock_stock(product_info_ids)
+            quantity = _by_product(totals)
+            ProductInfo.objects.filter(id__in=product_info_ids). \
+                update(quantity_in_stock=F('quantity_in_stock') + quantity)
+        order_ids = [order[0] for order in orders]
+        Order.objects.filter(id__in=order_ids).update(status='canceled')
+        OrderHeader.objects.filter(user_id=user_id).exclude(status='canceled').update(status='canceled')
+        order_numbers = Order.objects.filter(id__in=order_ids).order_by('order_number'). \
+            values_list('order_number', flat=True).distinct()
+        record_order_events('order_canceled', user_id, order_numbers)
+    reservation_stats.add('released', len(reserved))
+    return order_ids
@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Category, ProductInfo, Shop, SupplierRoute
+
+
+def refresh_supplier_routes(product_info_ids=None, category_ids=None):
+    """Пересчет маршрутов товаров к поставщикам по магазинам их категорий.
+
+    Маршруты выбранных товаров (или всех, если фильтры не заданы) удаляются и создаются заново
+    одним запросом на чтение и одной пакетной вставкой. Возвращает количество маршрутов.
+    """
+    product_infos = ProductInfo.objects.all()
+    routes = SupplierRoute.objects.all()
+    if product_info_ids is not None:
+        product_info_ids = list(product_info_ids)
+        product_infos = product_infos.filter(id__in=product_info_ids)
+        routes = routes.filter(product_info_id__in=product_info_ids)
+    if category_ids is not None:
+        category_ids = list(category_ids)
+        product_infos = product_infos.filter(product__category_id__in=category_ids)
+        routes = routes.filter(product_info__product__category_id__in=category_ids)
+    rows = product_infos.filter(product__category__shops__isnull=False). \
+        values_list('id', 'product__category__shops__id', 'product__category__shops__user_id',
+                    'product__category__shops__user__email').distinct()
+    with transaction.atomic():
+        routes.delete()
+        created = SupplierRoute.objects.bulk_create(
+            [SupplierRoute(product_info_id=product_info_id, shop_id=shop_id, supplier_id=supplier_id,
+                           email=email or '')
+             for product_info_id, shop_id, supplier_id, email in rows], ignore_conflicts=True)
+    return len(created)
+
+
+def refresh_shop_routes(shop_ids):
+    """Обновление поставщика и email в маршрутах магазинов одним запросом UPDATE"""
+    shops = Shop.objects.filter(id=OuterRef('shop_id'))
+    return SupplierRoute.objects.filter(shop_id__in=list(shop_ids)). \
+        update(supplier_id=Subquery(shops.values('user_id')[:1]),
+               email=Coalesce(Subquery(shops.values('user__email')[:1]), Value('')))
+
+
+def refresh_supplier_email(user):
+    """Обновление email поставщика в его маршрутах"""
+    return SupplierRoute.objects.filter(supplier_id=user.id).exclude(email=user.email).update(email=user.email)
+
+
+def derive_product_shops():
+    """Проставление магазина товарам по магазину их категории (с наименьшим id) одним запросом UPDATE"""
+    shops = Category.shops.through.objects.filter(category__product_category=OuterRef('product_id')). \
+        order_by('shop_id')
+    return ProductInfo.objects.update(shop_id=Subquery(shops.values('shop_id')[:1]))
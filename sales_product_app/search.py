@@ -0,0 +1,197 @@
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, F, FloatField, IntegerField, Q, When
+from django.db.models.functions import Cast
+from rest_framework.filters import BaseFilterBackend
+
+from .changelog import ChangeLog
+
+SEARCH_CONFIG = 'russian'
+TRIGRAM_THRESHOLD = 0.3
+RUSSIAN_ENDINGS = sorted(('ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие',
+                          'ый', 'ий', 'ой', 'ей', 'ов', 'ев', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'а', 'я', 'о', 'е',
+                          'ы', 'и', 'у', 'ю', 'ь', 'й'), key=len, reverse=True)
+SEARCH_INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS {table}_search_vector_gin ON {table} USING gin (search_vector)',
+    'CREATE INDEX IF NOT EXISTS {table}_name_trgm_gin ON {table} USING gin (name gin_trgm_ops)',
+)
+
+
+def stem(word):
+    """Упрощенный стемминг: отбрасывание типичного окончания русского слова"""
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    """Разбиение текста на нормализованные основы слов"""
+    return [stem(word) for word in re.findall(r'\w+', text.lower())]
+
+
+def trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PostgresSearchBackend:
+    """Полнотекстовый поиск PostgreSQL по колонке tsvector с GIN-индексом.
+
+    Строки, не найденные по основам слов, подбираются по триграммному сходству названия (опечатки).
+    """
+
+    def search(self, queryset, term):
+        query = SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch')
+        # ts_rank и similarity возвращают real: приведение к double, чтобы значения в курсоре пагинации
+        # точно совпадали с БД
+        return queryset.annotate(rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+                                 similarity=Cast(TrigramSimilarity('name', term), FloatField())). \
+            filter(Q(search_vector=query) | Q(name__trigram_similar=term)).order_by('-rank', '-similarity')
+
+    def update(self, model, pks):
+        model.objects.filter(pk__in=pks).update(search_vector=SearchVector('name', config=SEARCH_CONFIG))
+
+    def remove(self, model, pks):
+        pass
+
+
+class InvertedIndex:
+    """Инвертированный индекс по названиям строк одной модели"""
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.documents = {}
+        self.token_trigrams = defaultdict(set)
+
+    def add(self, pk, text):
+        self.remove(pk)
+        tokens = set(tokenize(text))
+        self.documents[pk] = tokens
+        for token in tokens:
+            if token not in self.postings:
+                for trigram in trigrams(token):
+                    self.token_trigrams[trigram].add(token)
+            self.postings[token].add(pk)
+
+    def remove(self, pk):
+        for token in self.documents.pop(pk, ()):
+            self.postings[token].discard(pk)
+
+    def similar_tokens(self, token):
+        """Токены индекса, похожие на токен запроса по доле общих триграмм"""
+        token_trigrams = trigrams(token)
+        counts = defaultdict(int)
+        for trigram in token_trigrams:
+            for candidate in self.token_trigrams.get(trigram, ()):
+                counts[candidate] += 1
+        return [candidate for candidate, common in counts.items()
+                if common / len(token_trigrams | trigrams(candidate)) >= TRIGRAM_THRESHOLD]
+
+    def search(self, text):
+        """Список pk, упорядоченный по количеству совпавших слов запроса"""
+        scores = defaultdict(float)
+        for token in set(tokenize(text)):
+            if self.postings.get(token):
+                for pk in self.postings[token]:
+                    scores[pk] += 1
+                continue
+            for candidate in self.similar_tokens(token):
+                for pk in self.postings[candidate]:
+                    scores[pk] += 0.5
+        return sorted(scores, key=lambda pk: (-scores[pk], pk))
+
+
+class PythonSearchBackend:
+    """Поиск по инвертированному индексу в памяти процесса (для SQLite и тестов).
+
+    Индекс модели строится при первом запросе. Изменения строк в любом процессе (сигналы, импорт,
+    генератор данных) публикуются в журнале изменений в кэше и применяются к индексу перед поиском.
+    """
+
+    def __init__(self):
+        self.indexes = {}
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def changelog(model):
+        return ChangeLog(f'search_index_{model._meta.label_lower}')
+
+    def get_index(self, model):
+        changelog = self.changelog(model)
+        version = changelog.version()
+        with self.lock:
+            if self.versions.get(model) != version:
+                changes = changelog.changes(self.versions.get(model), version)
+                if changes is None:
+                    index = self.indexes[model] = InvertedIndex()
+                    for pk, name in model.objects.values_list('pk', 'name').iterator():
+                        index.add(pk, name)
+                else:
+                    self.apply(model, changes)
+                self.versions[model] = version
+            return self.indexes[model]
+
+    def apply(self, model, pks):
+        """Добавление в индекс строк с pks из БД и удаление отсутствующих"""
+        index = self.indexes[model]
+        pks = set(pks)
+        for pk, name in model.objects.filter(pk__in=pks).values_list('pk', 'name').iterator():
+            index.add(pk, name)
+            pks.discard(pk)
+        for pk in pks:
+            index.remove(pk)
+
+    def search(self, queryset, term):
+        pks = self.get_index(queryset.model).search(term)
+        rank = Case(*[When(pk=pk, then=position) for position, pk in enumerate(pks)], output_field=IntegerField())
+        return queryset.filter(pk__in=pks).annotate(rank=rank).order_by('rank') if pks else queryset.none()
+
+    def update(self, model, pks):
+        self.changelog(model).publish(pks)
+
+    def remove(self, model, pks):
+        self.changelog(model).publish(pks)
+
+
+_backends = {}
+
+
+def get_search_backend():
+    """Бэкенд поиска: настройка PRODUCT_SEARCH_BACKEND ('postgres' или 'python'), по умолчанию - по СУБД"""
+    name = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None) or \
+        ('postgres' if connection.vendor == 'postgresql' else 'python')
+    if name not in _backends:
+        _backends[name] = PostgresSearchBackend() if name == 'postgres' else PythonSearchBackend()
+    return _backends[name]
+
+
+def create_search_indexes(sender, using='default', **kwargs):
+    """Создание GIN-индексов tsvector и триграмм после миграций (только PostgreSQL)"""
+    from .models import Product, ProductInfo
+
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for model in (Product, ProductInfo):
+            for sql in SEARCH_INDEXES:
+                cursor.execute(sql.format(table=model._meta.db_table))
+            get_search_backend().update(model, model.objects.filter(search_vector__isnull=True).values('pk'))
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """Фильтр DRF: ранжированный поиск по параметру ?search="""
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').strip()
+        if not term:
+            return queryset
+        return get_search_backend().search(queryset, term)
@@ -1,18 +1,36 @@
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
-from .models import Shop, Category, CustomUser, ProductInfo, Product, Parameter, ProductParameter, Order, Contact
+from .models import Shop, Category, CustomUser, ProductInfo, Product, Parameter, ProductParameter, Order, Contact, \
+    OrderHeader
+from .metrics import TimedSerializerMixin
+from .thumbnails import rendition_urls
+
+
+class ThumbnailsField(serializers.Field):
+    """URL уменьшенных копий изображения объекта, None - пока копии строятся"""
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, instance):
+        urls = rendition_urls(instance)
+        request = self.context.get('request')
+        if urls is None or request is None:
+            return urls
+        return {name: request.build_absolute_uri(url) for name, url in urls.items()}
 
 
 class CustomUserSerializer(UserCreateSerializer):
     thumbnail = serializers.ImageField(required=True)
+    thumbnails = ThumbnailsField()
 
     class Meta(UserCreateSerializer.Meta):
         model = CustomUser
         fields = ('id', 'username', 'email', 'password', 'first_name', 'last_name',
-                  'company', 'position', 'type', 'thumbnail')
+                  'company', 'position', 'type', 'thumbnail', 'thumbnails')
 
 
-class ShopSerializer(serializers.ModelSerializer):
+class ShopSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     name = serializers.CharField(required=False)
     is_active = serializers.BooleanField()
 
@@ -21,13 +39,13 @@ class ShopSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'url', 'is_active')
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ('id', 'name')
 
 
-class ProductSerializer(serializers.HyperlinkedModelSerializer):
+class ProductSerializer(TimedSerializerMixin, serializers.HyperlinkedModelSerializer):
     category = serializers.StringRelatedField()
     url = serializers.HyperlinkedIdentityField(view_name="product-detail")
 
@@ -50,21 +68,32 @@ class ProductParameterSerializer(serializers.ModelSerializer):
         fields = ('parameter', 'value')
 
 
-class ProductInfoSerializer(serializers.HyperlinkedModelSerializer):
+class ProductInfoSerializer(TimedSerializerMixin, serializers.HyperlinkedModelSerializer):
     shop = serializers.StringRelatedField()
     product = serializers.StringRelatedField()
     basket = serializers.BooleanField(required=True)
     quantity = serializers.IntegerField(required=False)
     retail_price = serializers.IntegerField(required=False)
     product_parameter = ProductParameterSerializer(read_only=True, many=True)
+    thumbnails = ThumbnailsField()
 
     class Meta:
         model = ProductInfo
         fields = ('id', 'product_id', 'product', 'shop', 'quantity', 'retail_price',  'basket', 'thumbnail',
-                  'product_parameter')
+                  'thumbnails', 'product_parameter')
+
+
+class FacetProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    shop = serializers.StringRelatedField()
+    product = serializers.StringRelatedField()
+    thumbnails = ThumbnailsField()
+
+    class Meta:
+        model = ProductInfo
+        fields = ('id', 'product_id', 'product', 'shop', 'quantity_in_stock', 'retail_price', 'thumbnails')
 
 
-class BasketSerializer(serializers.ModelSerializer):
+class BasketSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     name = serializers.CharField(read_only=True)
     shop = serializers.CharField(read_only=True)
     price = serializers.IntegerField(min_value=0, read_only=True)
@@ -77,13 +106,28 @@ class BasketSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'shop', 'price', 'quantity_in_stock', 'quantity', 'sum_value')
 
 
-class ContactSerializer(serializers.ModelSerializer):
+class BasketItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0)
+
+
+class BasketBatchSerializer(serializers.Serializer):
+    # Длина списка проверяется до валидации его элементов
+    items = BasketItemSerializer(many=True, allow_empty=False, max_length=300)
+
+    def validate_items(self, items):
+        if len({item['product_id'] for item in items}) != len(items):
+            raise serializers.ValidationError('Товары в списке не должны повторяться')
+        return items
+
+
+class ContactSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Contact
         fields = '__all__'
 
 
-class ThanksForOrderSerializer(serializers.ModelSerializer):
+class ThanksForOrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField()
     name = serializers.CharField(read_only=True)
     shop = serializers.CharField(read_only=True)
@@ -99,7 +143,7 @@ class ThanksForOrderSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'shop', 'price', 'quantity', 'sum_value', 'user', 'email', 'phone', 'street', 'house')
 
 
-class OrderListSerializer(serializers.ModelSerializer):
+class OrderListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     sum_ = serializers.IntegerField(min_value=0)
 
     class Meta:
@@ -107,7 +151,15 @@ class OrderListSerializer(serializers.ModelSerializer):
         fields = ('order_number', 'user_id', 'date', 'sum_', 'status',)
 
 
-class OrderDetailSerializer(serializers.ModelSerializer):
+class OrderHeaderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    sum_ = serializers.IntegerField(source='total', min_value=0)
+
+    class Meta:
+        model = OrderHeader
+        fields = ('order_number', 'user_id', 'date', 'sum_', 'status',)
+
+
+class OrderDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField()
     name = serializers.CharField(read_only=True)
     shop = serializers.CharField(read_only=True)
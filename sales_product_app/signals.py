@@ -1,24 +1,57 @@
 from time import sleep
-from django.db.models import F
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db.models.signals import post_init, post_save, post_delete, pre_save, m2m_changed
+from django.db import transaction
+from django.db.models import DEFERRED
+from django.db.backends.signals import connection_created
 from django.dispatch import receiver
 from djoser.signals import user_registered
 from django.conf import settings
-from .models import Contact, Order, CustomUser
-from .tasks import send_email_status_new, send_registration_email_async, send_email_status_canceled
+from rest_framework.authtoken.models import Token
+from .authentication import invalidate_token_cache, invalidate_user_tokens
+from .catalog_cache import invalidate_catalog_cache
+from .facets import invalidate_facet_index
+from .media import acquire, media_names, release
+from .metrics import install_query_timer
+from .order_headers import refresh_order_headers
+from .models import Order, CustomUser, Product, ProductInfo, ProductParameter, Parameter, Shop, Category
+from .routing import refresh_shop_routes, refresh_supplier_email, refresh_supplier_routes
+from .search import get_search_backend
+from .tasks import generate_thumbnails_async, send_registration_email_async
+from .thumbnails import renditions_ready
 
+# Поля, от которых зависят ответы каталога, поисковый индекс и маршруты к поставщикам
+CATALOG_FIELDS = {
+    Product: {'name', 'category_id'},
+    ProductInfo: {'name', 'quantity_in_stock', 'price', 'retail_price', 'product_id', 'shop_id', 'thumbnail',
+                  'thumbnail_renditions'},
+}
+SEARCH_FIELDS = {Product: {'name'}, ProductInfo: {'name'}}
+ROUTE_FIELDS = {Product: {'category_id'}, ProductInfo: {'product_id', 'shop_id'}}
 
-def get_supplier_email(user_id):
-    supplier = Order.objects.filter(user_id=user_id). \
-        select_related('product_info__product__category__shops__shop'). \
-        values(email=F('product_info__product__category__shops__user__email')).distinct()
-    return supplier
 
+def tracked_values(sender, instance):
+    """Значения отслеживаемых полей из __dict__ (отложенные поля не загружаются)"""
+    return {name: instance.__dict__.get(name, DEFERRED) for name in CATALOG_FIELDS[sender]}
 
-def get_order_number(user_id, status):
-    order_number = Order.objects.filter(user_id=user_id, status=status). \
-        annotate().values('order_number').distinct()
-    return order_number
+
+@receiver(post_init, sender=Product)
+@receiver(post_init, sender=ProductInfo)
+def remember_tracked_fields(sender, instance, **kwargs):
+    instance._tracked_values = tracked_values(sender, instance)
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductInfo)
+def detect_changed_fields(sender, instance, **kwargs):
+    """Отслеживаемые поля, измененные с момента загрузки или прошлого сохранения (у нового объекта - все)"""
+    values = tracked_values(sender, instance)
+    instance._changed_fields = set(values) if instance._state.adding else \
+        {name for name, value in values.items() if value is DEFERRED or value != instance._tracked_values[name]}
+    instance._tracked_values = values
+
+
+def changed(sender, instance, fields):
+    return bool(getattr(instance, '_changed_fields', fields[sender]) & fields[sender])
 
 
 @receiver(user_registered)
@@ -26,18 +59,144 @@ def send_registration_email(sender, user, **kwargs):
     send_registration_email_async.delay(user.first_name, user.last_name, user.email)
 
 
-@receiver(post_save, sender=Contact)
-def order_status_new(sender, instance, created, **kwargs):
-    order_number = get_order_number(instance.user.id, 'new')
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductInfo)
+def update_search_index(sender, instance, **kwargs):
+    if changed(sender, instance, SEARCH_FIELDS):
+        get_search_backend().update(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductInfo)
+def remove_from_search_index(sender, instance, **kwargs):
+    get_search_backend().remove(sender, [instance.pk])
+
+
+@receiver(post_save, sender=ProductParameter)
+@receiver(post_delete, sender=ProductParameter)
+def update_facet_index(sender, instance, **kwargs):
+    if instance.product_info_id:
+        invalidate_facet_index([instance.product_info_id])
+
+
+@receiver(post_save, sender=Parameter)
+@receiver(post_delete, sender=Parameter)
+def rebuild_facet_index(sender, **kwargs):
+    invalidate_facet_index()
+
+
+@receiver(post_save, sender=ProductInfo)
+def add_to_facet_index(sender, instance, created, **kwargs):
     if created:
-        send_email_status_new.delay(instance.user.first_name, instance.user.last_name,
-                                    instance.user.email, order_number[0]['order_number'],
-                                    [email['email'] for email in get_supplier_email(instance.user.id)])
+        invalidate_facet_index([instance.pk])
+
+
+@receiver(post_delete, sender=ProductInfo)
+def remove_from_facet_index(sender, instance, **kwargs):
+    invalidate_facet_index([instance.pk])
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(m2m_changed, sender=Category.shops.through)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductInfo)
+def update_catalog_cache(sender, **kwargs):
+    invalidate_catalog_cache()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductInfo)
+def update_catalog_cache_fields(sender, instance, **kwargs):
+    """Сброс кэша каталога только при изменении видимых в каталоге полей"""
+    if changed(sender, instance, CATALOG_FIELDS):
+        invalidate_catalog_cache()
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def update_order_header(sender, instance, **kwargs):
+    if instance.order_number:
+        refresh_order_headers([instance.order_number])
+
+
+@receiver(post_save, sender=Shop)
+def update_shop_routes(sender, instance, **kwargs):
+    refresh_shop_routes([instance.pk])
+
+
+@receiver(post_save, sender=CustomUser)
+def update_supplier_routes_email(sender, instance, **kwargs):
+    if instance.type == 'supplier':
+        refresh_supplier_email(instance)
+
+
+@receiver(m2m_changed, sender=Category.shops.through)
+def update_category_routes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        refresh_supplier_routes(category_ids=[instance.pk])
+    elif pk_set:
+        refresh_supplier_routes(category_ids=pk_set)
+    else:
+        refresh_supplier_routes(product_info_ids=instance.supplier_routes.values_list('product_info_id', flat=True))
+
+
+@receiver(post_save, sender=ProductInfo)
+def update_product_info_routes(sender, instance, **kwargs):
+    if changed(sender, instance, ROUTE_FIELDS):
+        refresh_supplier_routes(product_info_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def update_product_routes(sender, instance, **kwargs):
+    if changed(sender, instance, ROUTE_FIELDS):
+        product_info_ids = ProductInfo.objects.filter(product=instance).values_list('id', flat=True)
+        refresh_supplier_routes(product_info_ids=product_info_ids)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=ProductInfo)
+def schedule_thumbnails(sender, instance, **kwargs):
+    if instance.thumbnail and not renditions_ready(instance):
+        transaction.on_commit(lambda: generate_thumbnails_async.delay(sender._meta.label, instance.pk))
+
+
+@receiver(post_init, sender=CustomUser)
+@receiver(post_init, sender=ProductInfo)
+def remember_media_files(sender, instance, **kwargs):
+    instance._media_names = media_names(instance)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=ProductInfo)
+def update_media_references(sender, instance, **kwargs):
+    names = media_names(instance)
+    acquire(names - instance._media_names)
+    release(instance._media_names - names)
+    instance._media_names = names
+
+
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=ProductInfo)
+def release_media_files(sender, instance, **kwargs):
+    release(instance._media_names)
+
+
+@receiver(post_delete, sender=Token)
+def remove_cached_token(sender, instance, **kwargs):
+    invalidate_token_cache([instance.key])
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def remove_cached_user_tokens(sender, instance, **kwargs):
+    invalidate_user_tokens(instance.pk)
 
 
-@receiver(post_delete, sender=Contact)
-def order_status_delete(sender, instance, **kwargs):
-    order_number = get_order_number(instance.user.id, 'canceled')
-    send_email_status_canceled.delay(instance.user.first_name, instance.user.last_name,
-                                     instance.user.email, order_number[0]['order_number'],
-                                     [email['email'] for email in get_supplier_email(instance.user.id)])
\ No newline at end of file
+@receiver(connection_created)
+def time_request_queries(sender, connection, **kwargs):
+    install_query_timer(connection)
@@ -0,0 +1,344 @@
+import json
+import math
+import os
+import random
+from array import array
+from datetime import date, timedelta
+
+import yaml
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, OuterRef, Subquery
+
+from .catalog_cache import invalidate_catalog_cache
+from .facets import invalidate_facet_index
+from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, CustomUser, Contact, Order, \
+    OrderHeader
+from .routing import refresh_supplier_routes
+from .search import get_search_backend
+
+SHOP_NAMES = ('Связной', 'М.Видео', 'Эльдорадо', 'DNS', 'Ситилинк', 'Технопарк', 'Ozon', 'Wildberries')
+CITIES = ('Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань', 'Нижний Новгород', 'Самара')
+STREETS = ('Ленина', 'Мира', 'Советская', 'Гагарина', 'Пушкина', 'Тверская', 'Садовая', 'Лесная')
+COLORS = ('черный', 'белый', 'серебристый', 'золотистый', 'синий', 'красный', 'зеленый', 'серый')
+# Статусы истории заказов и их доли
+ORDER_STATUSES = (('received', 45), ('delivered', 20), ('sent', 8), ('assembled', 5), ('confirmed', 5),
+                  ('new', 10), ('canceled', 7))
+
+# Семейства категорий: название, существительное для названия товара, бренды и серии, диапазон цен,
+# параметры с возможными значениями и параметры, входящие в название товара
+FAMILIES = (
+    {'category': 'Смартфоны', 'noun': 'Смартфон', 'price': (7000, 160000),
+     'brands': {'Apple': ('iPhone 13', 'iPhone 14', 'iPhone 15 Pro'), 'Samsung': ('Galaxy A54', 'Galaxy S23'),
+                'Xiaomi': ('Redmi Note 12', '13T'), 'Honor': ('X8', '90')},
+     'parameters': {'Диагональ (дюйм)': ('5.8', '6.1', '6.5', '6.7', '6.8'),
+                    'Разрешение (пикс)': ('1792x828', '2532x1170', '2400x1080', '2796x1290'),
+                    'Встроенная память (Гб)': ('64', '128', '256', '512'),
+                    'Оперативная память (Гб)': ('4', '6', '8', '12'), 'Цвет': COLORS},
+     'title': ('Встроенная память (Гб)', 'Цвет')},
+    {'category': 'Ноутбуки', 'noun': 'Ноутбук', 'price': (30000, 300000),
+     'brands': {'Apple': ('MacBook Air', 'MacBook Pro'), 'Lenovo': ('IdeaPad 5', 'ThinkPad E14'),
+                'ASUS': ('Vivobook 15', 'Zenbook 14'), 'HP': ('Pavilion 15', 'ProBook 450')},
+     'parameters': {'Диагональ (дюйм)': ('13.3', '14', '15.6', '16', '17.3'),
+                    'Процессор': ('Intel Core i5', 'Intel Core i7', 'AMD Ryzen 5', 'AMD Ryzen 7', 'Apple M2'),
+                    'Оперативная память (Гб)': ('8', '16', '32'), 'SSD (Гб)': ('256', '512', '1024'),
+                    'Цвет': COLORS[:4]},
+     'title': ('Процессор', 'Оперативная память (Гб)')},
+    {'category': 'Телевизоры', 'noun': 'Телевизор', 'price': (12000, 250000),
+     'brands': {'Samsung': ('UE', 'QE'), 'LG': ('UQ', 'OLED'), 'Sony': ('Bravia',), 'Xiaomi': ('Mi TV P1',)},
+     'parameters': {'Диагональ (дюйм)': ('32', '43', '50', '55', '65', '75'),
+                    'Разрешение (пикс)': ('1366x768', '1920x1080', '3840x2160'),
+                    'Smart TV': ('да', 'нет'), 'Частота обновления (Гц)': ('50', '60', '100', '120')},
+     'title': ('Диагональ (дюйм)',)},
+    {'category': 'Flash-накопители', 'noun': 'Флеш-накопитель', 'price': (300, 6000),
+     'brands': {'Kingston': ('DataTraveler',), 'SanDisk': ('Ultra', 'Extreme'), 'Transcend': ('JetFlash',)},
+     'parameters': {'Объем (Гб)': ('16', '32', '64', '128', '256'),
+                    'Интерфейс': ('USB 2.0', 'USB 3.0', 'USB 3.2', 'USB Type-C'), 'Цвет': COLORS},
+     'title': ('Объем (Гб)', 'Цвет')},
+    {'category': 'Наушники', 'noun': 'Наушники', 'price': (800, 60000),
+     'brands': {'Apple': ('AirPods', 'AirPods Pro'), 'Sony': ('WH-1000XM5', 'WF-C500'), 'JBL': ('Tune 510BT',)},
+     'parameters': {'Тип': ('вкладыши', 'внутриканальные', 'накладные', 'полноразмерные'),
+                    'Подключение': ('Bluetooth', 'проводное'), 'Шумоподавление': ('да', 'нет'), 'Цвет': COLORS},
+     'title': ('Цвет',)},
+    {'category': 'Аксессуары', 'noun': 'Аксессуар', 'price': (200, 8000),
+     'brands': {'Baseus': ('Crystal', 'Superior'), 'Ugreen': ('Nexode',), 'Deppa': ('Case',)},
+     'parameters': {'Тип': ('чехол', 'защитное стекло', 'кабель', 'зарядное устройство', 'держатель'),
+                    'Совместимость': ('iPhone', 'Samsung Galaxy', 'Xiaomi', 'универсальный'), 'Цвет': COLORS},
+     'title': ('Тип', 'Цвет')},
+)
+
+
+def zipf_rank(rng, size, skew):
+    """Случайный ранг 0..size-1 с вероятностью ~ 1 / (rank + 1) ** skew (обратная функция распределения)"""
+    if skew == 1:
+        return min(int(math.exp(rng.random() * math.log(size + 1))) - 1, size - 1)
+    exponent = 1 - skew
+    return min(int(((((size + 1) ** exponent) - 1) * rng.random() + 1) ** (1 / exponent)) - 1, size - 1)
+
+
+def scatter(rank, size):
+    """Перестановка рангов по позициям, чтобы популярные товары не шли подряд"""
+    step = 2654435761
+    while math.gcd(step, size) != 1:
+        step += 1
+    return rank * step % size
+
+
+def next_ids(*models):
+    """Следующие свободные id таблиц (явные id сохраняются пакетами без чтения их из БД)"""
+    return [(model.objects.aggregate(value=Max('id'))['value'] or 0) + 1 for model in models]
+
+
+def reset_sequences(*models):
+    """Сдвиг последовательностей id после вставки строк с явными id (как в loaddata)"""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+class SyntheticCatalog:
+    """Детерминированный (по seed) генератор каталога в схеме прайс-листа fixtures/shop1.yaml.
+
+    У категории от одного до трех магазинов, товары категории относятся к магазину с наименьшим id,
+    как при импорте прайс-листов. Размеры категорий неравномерны (распределение Парето),
+    товары каждой категории занимают непрерывный диапазон id и генерируются независимо от порядка обхода.
+    """
+
+    def __init__(self, shops, categories, products, seed=0, shop_id=1, category_id=1, product_id=1):
+        self.seed = seed
+        self.product_id = product_id
+        rng = random.Random(seed)
+        self.shops = [{'id': shop_id + number, 'name': f'{SHOP_NAMES[number % len(SHOP_NAMES)]} {shop_id + number}',
+                       'url': f'https://shop{shop_id + number}.example.com'}
+                      for number in range(shops)]
+        shop_ids = [shop['id'] for shop in self.shops]
+        self.categories = []
+        for number in range(categories if shops else 0):
+            family = FAMILIES[number % len(FAMILIES)]
+            shop_count = min(rng.randint(1, 3), shops)
+            self.categories.append({'id': category_id + number, 'family': family,
+                                    'name': f'{family["category"]} {category_id + number}',
+                                    'shops': sorted(rng.sample(shop_ids, shop_count))})
+        weights = [rng.paretovariate(1.2) for _ in self.categories]
+        total = sum(weights)
+        sizes = [int(products * weight / total) for weight in weights]
+        for number in range(products - sum(sizes) if sizes else 0):
+            sizes[number % len(sizes)] += 1
+        start = product_id
+        for category, size in zip(self.categories, sizes):
+            category['first_id'], category['size'] = start, size
+            start += size
+        self.category_shop = {category['id']: category['shops'][0] for category in self.categories}
+
+    def shop_categories(self, shop_id):
+        """Категории магазина и категории, товары которых относятся к магазину"""
+        categories = [category for category in self.categories if shop_id in category['shops']]
+        return categories, [category for category in categories if category['shops'][0] == shop_id]
+
+    def goods(self, category):
+        """Товары категории в формате раздела goods прайс-листа"""
+        family = category['family']
+        rng = random.Random(f'{self.seed}:{category["id"]}')
+        brands = list(family['brands'].items())
+        low, high = family['price']
+        for good_id in range(category['first_id'], category['first_id'] + category['size']):
+            brand, series = brands[zipf_rank(rng, len(brands), 1.2)]
+            series = rng.choice(series)
+            parameters = {name: rng.choice(values) for name, values in family['parameters'].items()
+                          if name in family['title'] or rng.random() < 0.9}
+            title = ', '.join(parameters[name] for name in family['title'])
+            price = int(math.exp(rng.uniform(math.log(low), math.log(high)))) // 10 * 10
+            yield {'id': good_id, 'category': category['id'],
+                   'model': f'{brand}/{series}'.lower().replace(' ', '-'),
+                   'name': f'{family["noun"]} {brand} {series} ({title}) арт. {good_id}',
+                   'price': price, 'price_rrc': int(price * rng.uniform(1.03, 1.2)) // 10 * 10,
+                   'quantity': 0 if rng.random() < 0.1 else rng.randint(1, 200),
+                   'parameters': parameters}
+
+    def price_lists(self):
+        """Пары (магазин, категории магазина, генератор товаров магазина)"""
+        for shop in self.shops:
+            categories, owned = self.shop_categories(shop['id'])
+
+            def goods(owned=owned):
+                for category in owned:
+                    yield from self.goods(category)
+
+            yield shop, categories, goods()
+
+
+def write_price_lists(catalog, directory, file_format='yaml'):
+    """Запись прайс-листа каждого магазина в отдельный файл, возвращает (файлов, товаров)"""
+    os.makedirs(directory, exist_ok=True)
+    files = rows = 0
+    for shop, categories, goods in catalog.price_lists():
+        header = {'shop': [shop],
+                  'categories': [{'id': category['id'], 'name': category['name'], 'shops': [shop['id']]}
+                                 for category in categories]}
+        path = os.path.join(directory, f'shop{shop["id"]}.{file_format}')
+        with open(path, 'w', encoding='utf8') as file:
+            if file_format == 'jsonl':
+                for section, entries in header.items():
+                    file.writelines(json.dumps({section: entry}, ensure_ascii=False) + '\n' for entry in entries)
+                for good in goods:
+                    file.write(json.dumps({'goods': good}, ensure_ascii=False) + '\n')
+                    rows += 1
+            else:
+                yaml.safe_dump(header, file, allow_unicode=True, sort_keys=False)
+                file.write('\ngoods:\n')
+                for good in goods:
+                    file.write(yaml.safe_dump([good], allow_unicode=True, sort_keys=False, width=200))
+                    rows += 1
+        files += 1
+    return files, rows
+
+
+def user_password(password):
+    """Общий хеш пароля создаваемых пользователей (без пароля вход невозможен)"""
+    return make_password(password or None)
+
+
+def write_suppliers(catalog, password=None):
+    """Поставщики магазинов каталога: пользователь с компанией, совпадающей с названием магазина"""
+    user_id, = next_ids(CustomUser)
+    password = user_password(password)
+    users = [CustomUser(id=user_id + number, username=f'supplier{user_id + number}',
+                        email=f'supplier{user_id + number}@example.com', password=password, first_name='Поставщик',
+                        last_name=str(shop['id']), company=shop['name'], position='Менеджер', type='supplier',
+                        is_active=True)
+             for number, shop in enumerate(catalog.shops)]
+    CustomUser.objects.bulk_create(users, batch_size=1000)
+    return {shop['id']: user.id for shop, user in zip(catalog.shops, users)}
+
+
+def write_catalog(catalog, batch_size=5000, password=None):
+    """Запись каталога, поставщиков, маршрутов к поставщикам и поискового индекса напрямую в БД"""
+    with transaction.atomic():
+        suppliers = write_suppliers(catalog, password)
+        Shop.objects.bulk_create([Shop(id=shop['id'], name=shop['name'], url=shop['url'],
+                                       user_id=suppliers[shop['id']]) for shop in catalog.shops], batch_size=1000)
+        Category.objects.bulk_create([Category(id=category['id'], name=category['name'])
+                                      for category in catalog.categories], batch_size=1000)
+        Category.shops.through.objects.bulk_create(
+            [Category.shops.through(category_id=category['id'], shop_id=shop_id)
+             for category in catalog.categories for shop_id in category['shops']], batch_size=batch_size)
+        names = {name for family in FAMILIES for name in family['parameters']}
+        Parameter.objects.bulk_create([Parameter(name=name) for name in sorted(names)], ignore_conflicts=True)
+        parameters = dict(Parameter.objects.filter(name__in=names).values_list('name', 'id'))
+        reset_sequences(CustomUser, Shop, Category)
+    product_info_id, = next_ids(ProductInfo)
+    offset = product_info_id - catalog.product_id
+    goods = []
+    rows = 0
+    for _, _, shop_goods in catalog.price_lists():
+        for good in shop_goods:
+            goods.append(good)
+            if len(goods) >= batch_size:
+                rows += write_goods(goods, offset, parameters, catalog)
+                goods = []
+    if goods:
+        rows += write_goods(goods, offset, parameters, catalog)
+    reset_sequences(Product, ProductInfo)
+    invalidate_facet_index()
+    invalidate_catalog_cache()
+    return rows
+
+
+def write_goods(goods, offset, parameters, catalog):
+    """Запись пакета товаров: Product, ProductInfo (id = id товара + offset) и параметры"""
+    with transaction.atomic():
+        Product.objects.bulk_create([Product(id=good['id'], name=good['name'], category_id=good['category'])
+                                     for good in goods])
+        ProductInfo.objects.bulk_create(
+            [ProductInfo(id=good['id'] + offset, name=good['name'], product_id=good['id'],
+                         shop_id=catalog.category_shop[good['category']], quantity_in_stock=good['quantity'],
+                         price=good['price'], retail_price=good['price_rrc'])
+             for good in goods])
+        ProductParameter.objects.bulk_create(
+            [ProductParameter(product_info_id=good['id'] + offset, parameter_id=parameters[name], value=value)
+             for good in goods for name, value in good['parameters'].items()])
+        product_info_ids = [good['id'] + offset for good in goods]
+        get_search_backend().update(Product, [good['id'] for good in goods])
+        get_search_backend().update(ProductInfo, product_info_ids)
+        refresh_supplier_routes(product_info_ids=product_info_ids)
+    return len(goods)
+
+
+def write_buyers(count, seed=0, batch_size=5000, password=None):
+    """Покупатели с одним адресом доставки каждый"""
+    rng = random.Random(f'{seed}:buyers')
+    user_id, = next_ids(CustomUser)
+    password = user_password(password)
+    for start in range(0, count, batch_size):
+        ids = range(user_id + start, user_id + min(start + batch_size, count))
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(
+                [CustomUser(id=pk, username=f'buyer{pk}', email=f'buyer{pk}@example.com', password=password,
+                            first_name='Покупатель', last_name=str(pk), is_active=True) for pk in ids])
+            Contact.objects.bulk_create(
+                [Contact(user_id=pk, city=rng.choice(CITIES), street=rng.choice(STREETS),
+                         house=str(rng.randint(1, 150)), apartment=str(rng.randint(1, 300)),
+                         phone=f'+79{rng.randint(0, 999999999):09d}')
+                 for pk in ids])
+    reset_sequences(CustomUser)
+    return count
+
+
+def write_orders(count, max_lines=5, days=365, skew=1.1, seed=0, batch_size=5000):
+    """История заказов покупателей по товарам каталога с неравномерной популярностью.
+
+    Покупатели и товары выбираются по закону Ципфа с показателем skew: немногие популярные товары
+    встречаются в большинстве заказов, а немногие покупатели оформляют большую часть заказов.
+    Номера заказов продолжают последовательность пользователя, заголовки содержат сумму и копию адреса.
+    """
+    rng = random.Random(f'{seed}:orders')
+    products = ProductInfo.objects.order_by('id').values_list('id', 'retail_price')
+    product_ids, prices = array('q'), array('q')
+    for product_info_id, price in products.iterator(chunk_size=batch_size):
+        product_ids.append(product_info_id)
+        prices.append(price)
+    buyers = list(CustomUser.objects.filter(type='buyer').order_by('id').values_list('id', 'order_sequence'))
+    if not product_ids or not buyers or not count:
+        return 0
+    initial = dict(buyers)
+    sequences = dict(initial)
+    contacts = {contact['user_id']: contact for contact in
+                Contact.objects.filter(user__type='buyer').values('user_id', 'city', 'street', 'house', 'phone')}
+    statuses, weights = zip(*ORDER_STATUSES)
+    today = date.today()
+    headers, lines = [], []
+    for number in range(count):
+        user_id = buyers[scatter(zipf_rank(rng, len(buyers), skew), len(buyers))][0]
+        sequences[user_id] += 1
+        order_number = f'{user_id}-{sequences[user_id]}'
+        status = rng.choices(statuses, weights)[0]
+        positions = {scatter(zipf_rank(rng, len(product_ids), skew), len(product_ids))
+                     for _ in range(rng.randint(1, max_lines))}
+        quantities = {position: rng.choices((1, 2, 3, 5), (80, 12, 5, 3))[0] for position in positions}
+        contact = contacts.get(user_id, {})
+        headers.append(OrderHeader(user_id=user_id, order_number=order_number,
+                                   date=today - timedelta(days=rng.randrange(days)), status=status,
+                                   total=sum(prices[position] * quantity for position, quantity in quantities.items()),
+                                   city=contact.get('city', ''), street=contact.get('street', ''),
+                                   house=contact.get('house', ''), phone=contact.get('phone', '')))
+        lines += [Order(user_id=user_id, product_info_id=product_ids[position], quantity=quantity, status=status,
+                        order_number=order_number) for position, quantity in quantities.items()]
+        if len(headers) >= batch_size or number == count - 1:
+            write_order_batch(headers, lines)
+            headers, lines = [], []
+    users = [CustomUser(id=user_id, order_sequence=sequence) for user_id, sequence in sequences.items()
+             if sequence != initial[user_id]]
+    CustomUser.objects.bulk_update(users, ['order_sequence'], batch_size=batch_size)
+    return count
+
+
+def write_order_batch(headers, lines):
+    """Запись пакета заказов, дата строк заказа (auto_now_add) берется из заголовка одним UPDATE"""
+    with transaction.atomic():
+        OrderHeader.objects.bulk_create(headers)
+        Order.objects.bulk_create(lines)
+        Order.objects.filter(order_number__in=[header.order_number for header in headers]). \
+            update(date=Subquery(OrderHeader.objects.filter(order_number=OuterRef('order_number')).values('date')[:1]))
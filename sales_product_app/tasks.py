@@ -1,3 +1,4 @@
+import smtplib
 from time import sleep
 
 from django.core.mail import send_mail
@@ -5,8 +6,11 @@ from django.conf import settings
 from celery import shared_task
 from rest_framework.response import Response
 
-from .models import ProductInfo
-from .serializers import CustomUserSerializer, ProductInfoSerializer
+from .mailing import order_messages, send_messages
+from .media import collect
+from .outbox import relay_outbox
+from .serializers import CustomUserSerializer
+from .thumbnails import generate_renditions
 
 
 @shared_task
@@ -19,36 +23,42 @@ def send_registration_email_async(first_name, last_name, email):
     )
 
 
-@shared_task
+# Письма отправляются внутри задачи: сообщение подтверждается брокеру после выполнения (acks_late),
+# при ошибке SMTP задача повторяется с экспоненциальной задержкой, пакет при повторе отправляется заново
+MAIL_TASK_OPTIONS = {'autoretry_for': (smtplib.SMTPException, OSError), 'retry_backoff': True,
+                     'max_retries': getattr(settings, 'MAIL_MAX_RETRIES', 5), 'acks_late': True}
+
+
+@shared_task(**MAIL_TASK_OPTIONS)
 def send_email_status_new(first_name, last_name, email, order_number, supplier):
-    send_mail(
-        f'Изменение статуса заказа #{order_number}',
-        f'{first_name} {last_name}, cтатус вашего заказа #{order_number} изменен на "Новый".',
-        settings.DEFAULT_FROM_EMAIL,
-        [email]
-    ),
-    send_mail(
-        f'Получен новый заказ #{order_number}',
-        f'С деталями заказа #{order_number} ознакомьтесь в разделе "Заказы".',
-        settings.DEFAULT_FROM_EMAIL,
-        supplier
-    )
+    return send_messages(order_messages({'event': 'order_new', 'first_name': first_name, 'last_name': last_name,
+                                         'email': email, 'order_number': order_number, 'suppliers': supplier}))
 
 
-@shared_task
+@shared_task(**MAIL_TASK_OPTIONS)
 def send_email_status_canceled(first_name, last_name, email, order_number, supplier):
-    send_mail(
-        f'Изменение статуса заказа #{order_number}',
-        f'{first_name} {last_name}, cтатус вашего заказа #{order_number} изменен на "Удален".',
-        settings.DEFAULT_FROM_EMAIL,
-        [email]
-    ),
-    send_mail(
-        f'Изменение статуса заказа #{order_number}',
-        f'Cтатус заказа #{order_number} изменен на "Удален".',
-        settings.DEFAULT_FROM_EMAIL,
-        supplier
-    )
+    return send_messages(order_messages({'event': 'order_canceled', 'first_name': first_name,
+                                         'last_name': last_name, 'email': email, 'order_number': order_number,
+                                         'suppliers': supplier}))
+
+
+@shared_task(**MAIL_TASK_OPTIONS)
+def send_order_emails(notifications):
+    """Отправка уведомлений о пакете событий заказов через одно SMTP-соединение"""
+    return send_messages([message for notification in notifications for message in order_messages(notification)])
+
+
+def send_order_events(events, supplier_emails):
+    """Постановка пакета событий из таблицы исходящих событий в очередь Celery одной задачей"""
+    send_order_emails.delay([{'event': event.event, 'first_name': event.user.first_name,
+                              'last_name': event.user.last_name, 'email': event.user.email,
+                              'order_number': event.order_number,
+                              'suppliers': supplier_emails.get(event.order_number, [])} for event in events])
+
+
+@shared_task
+def relay_outbox_async():
+    return relay_outbox(send_order_events)
 
 
 @shared_task
@@ -60,9 +70,10 @@ def create_user_async(data):
 
 
 @shared_task
-def upload_thumbnail_async(data, product_id):
-    instance = ProductInfo.objects.get(product_id=product_id)
-    serializer = ProductInfoSerializer(data=data[0], instance=instance)
-    serializer.is_valid(raise_exception=True)
-    serializer.save()
-    return Response(serializer.data)
\ No newline at end of file
+def collect_media_async():
+    return collect()
+
+
+@shared_task(autoretry_for=(OSError,), retry_backoff=True, max_retries=3)
+def generate_thumbnails_async(model_label, pk):
+    return generate_renditions(model_label, pk)
@@ -1,3 +1,1095 @@
-from django.test import TestCase
+import importlib.util
+import json
+import os
+import platform
+import smtplib
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import django
+import yaml
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Mod
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import baskets, tasks, throttling
+from .authentication import get_token_cache, token_cache_key
+from .baskets import get_basket_backend
+from .async_views import AsyncOrderListView, AsyncShopView
+from .catalog_cache import catalog_cache
+from .facets import FacetIndex, facet_index, invalidate_facet_index
+from .importer import BulkImporter, import_file
+from .models import CustomUser, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, \
+    OrderHeader, OutboxEvent, Contact, MediaFile
+from .media import acquire, collect, release
+from .metrics import metrics_registry
+from .order_headers import refresh_order_headers
+from .outbox import order_events_disabled, relay_outbox
+from .readers import read_price_list
+from .pagination import ProductPagination
+from .reservations import StockReservationError, release_orders, reserve_basket
+from .routing import refresh_supplier_routes
+from .search import PythonSearchBackend, get_search_backend
+
+# Размер набора данных и число повторов каждого запроса задаются переменными окружения
+BENCHMARK_SCALE = int(os.getenv('BENCHMARK_SCALE', 1))
+BENCHMARK_ITERATIONS = int(os.getenv('BENCHMARK_ITERATIONS', 20))
+BENCHMARK_OUTPUT = os.getenv('BENCHMARK_OUTPUT', 'benchmark.json')
+BENCHMARK_BASELINE = os.getenv('BENCHMARK_BASELINE')
+
+SHOP1_YAML = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'shop1.yaml')
+
+PARAMETERS = {
+    'Цвет': ['черный', 'белый', 'красный', 'синий', 'серебристый'],
+    'Диагональ (дюйм)': ['5.5', '6.1', '6.7', '13.3', '15.6'],
+    'Встроенная память (Гб)': ['64', '128', '256', '512'],
+    'Разрешение (пикс)': ['1920x1080', '2532x1170', '2796x1290'],
+    'Гарантия (мес)': ['12', '24', '36'],
+}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def seed_catalog(shops=10, categories=8, products=200, extra_parameters=20):
+    """Каталог: магазины, категории, товары с 1..len(PARAMETERS) параметрами и один товар с множеством параметров"""
+    shop_list = Shop.objects.bulk_create([Shop(name=f'Магазин {number}', url=f'https://shop{number}.example.com')
+                                          for number in range(shops)])
+    category_list = Category.objects.bulk_create([Category(name=f'Категория {number}')
+                                                  for number in range(categories)])
+    for number, category in enumerate(category_list):
+        category.shops.set(shop_list[number % shops::categories] or shop_list[:1])
+    product_list = Product.objects.bulk_create([Product(name=f'Товар {number}',
+                                                        category=category_list[number % categories])
+                                                for number in range(products)])
+    product_infos = ProductInfo.objects.bulk_create([
+        ProductInfo(name=f'Товар {number} (артикул {number:06d})', quantity_in_stock=1000,
+                    price=1000 + number * 7 % 50000, retail_price=1200 + number * 7 % 60000,
+                    product=product, shop=shop_list[number % shops])
+        for number, product in enumerate(product_list)])
+    names = list(PARAMETERS) + [f'Характеристика {number}' for number in range(extra_parameters)]
+    parameters = Parameter.objects.bulk_create([Parameter(name=name) for name in names])
+    product_parameters = []
+    for number, product_info in enumerate(product_infos):
+        count = len(names) if number == 0 else number % len(PARAMETERS) + 1
+        for parameter in parameters[:count]:
+            values = PARAMETERS.get(parameter.name, [str(number)])
+            product_parameters.append(ProductParameter(product_info=product_info, parameter=parameter,
+                                                       value=values[number % len(values)]))
+    ProductParameter.objects.bulk_create(product_parameters)
+    return shop_list, product_infos
+
+
+def seed_user(email, user_type='buyer', company='', is_staff=False):
+    return CustomUser.objects.create(username=email.partition('@')[0], email=email, first_name='Иван',
+                                     last_name='Иванов', company=company, position='Менеджер', type=user_type,
+                                     is_active=True, is_staff=is_staff)
+
+
+def seed_orders(user, product_infos, orders=30, lines=3):
+    """История заказов пользователя: заголовки и строки заказов, номера вида <user_id>-<n>"""
+    headers, rows = [], []
+    for number in range(1, orders + 1):
+        order_number = f'{user.id}-{number}'
+        items = [product_infos[(number * lines + line) % len(product_infos)] for line in range(lines)]
+        headers.append(OrderHeader(user=user, order_number=order_number, date='2024-01-01', status='delivered',
+                                   total=sum(item.retail_price for item in items), city='Москва'))
+        rows += [Order(user=user, product_info=item, quantity=1, status='delivered', order_number=order_number)
+                 for item in items]
+    OrderHeader.objects.bulk_create(headers)
+    Order.objects.bulk_create(rows)
+    CustomUser.objects.filter(id=user.id).update(order_sequence=orders)
+
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'},
+               'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-local'}}
+
+
+@override_settings(
+    CACHES=TEST_CACHES, THROTTLE_REDIS_URL=None, BASKET_BACKEND='db', PROFILE_SAMPLE_RATE=0, METRICS_TOKEN=None,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class EndpointBenchmarkTests(TestCase):
+    """Нагрузочный прогон маршрутов REST_API_DIPLOM/urls.py на синтетическом каталоге.
+
+    Каждый запрос выполняется BENCHMARK_ITERATIONS раз в откатываемой транзакции мимо кэша каталога,
+    фиксируются процентили задержки и число SQL-запросов. Тест падает, если число запросов превышает
+    бюджет эндпоинта. Результаты записываются в BENCHMARK_OUTPUT, при заданном BENCHMARK_BASELINE
+    выводится сравнение с результатами предыдущего прогона.
+    """
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shops, cls.product_infos = seed_catalog(shops=10 * BENCHMARK_SCALE, categories=8 * BENCHMARK_SCALE,
+                                                    products=200 * BENCHMARK_SCALE)
+        cls.buyer = seed_user('buyer@example.com')
+        cls.buyer.set_password('benchmark')
+        cls.buyer.save()
+        cls.supplier = seed_user('supplier@example.com', 'supplier', company=cls.shops[0].name)
+        Shop.objects.filter(id=cls.shops[0].id).update(user=cls.supplier)
+        cls.staff = seed_user('staff@example.com', is_staff=True)
+        Contact.objects.create(user=cls.staff, city='Москва', street='Тверская', house='1', phone='+79990000000')
+        seed_orders(cls.buyer, cls.product_infos, orders=30 * BENCHMARK_SCALE)
+        seed_orders(cls.supplier, cls.product_infos, orders=5)
+        cls.basket = Order.objects.bulk_create([Order(user=cls.buyer, product_info=product_info, quantity=1)
+                                                for product_info in cls.product_infos[1:11]])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if not cls.results:
+            return
+        report = {'django': django.get_version(), 'python': platform.python_version(),
+                  'vendor': connection.vendor, 'scale': BENCHMARK_SCALE, 'iterations': BENCHMARK_ITERATIONS,
+                  'endpoints': dict(sorted(cls.results.items()))}
+        with open(BENCHMARK_OUTPUT, 'w', encoding='utf8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        if BENCHMARK_BASELINE and os.path.exists(BENCHMARK_BASELINE):
+            with open(BENCHMARK_BASELINE, encoding='utf8') as file:
+                baseline = json.load(file)['endpoints']
+            print(f'\n{"endpoint":<32}{"queries":>12}{"":4}{"p50, мс":>22}{"p95, мс":>22}')
+            for name, result in report['endpoints'].items():
+                before = baseline.get(name)
+                if before is None:
+                    continue
+                print(f'{name:<32}{before["queries"]:>6} -> {result["queries"]:<6}'
+                      f'{before["p50_ms"]:>10.2f} -> {result["p50_ms"]:<8.2f}'
+                      f'{before["p95_ms"]:>10.2f} -> {result["p95_ms"]:<8.2f}')
+
+    def endpoints(self):
+        """(имя, метод, путь, пользователь, данные, бюджет SQL-запросов, ожидаемый код ответа)"""
+        product = self.product_infos[0]
+        basket_line = self.basket[0]
+        shop = self.shops[0]
+        contact = {'city': 'Москва', 'street': 'Ленина', 'house': '1', 'phone': '+79991234567'}
+        return [
+            ('admin', 'get', '/admin/', self.staff, None, 5, 200),
+            ('token-login', 'post', '/auth/token/login/', None,
+             {'email': 'buyer@example.com', 'password': 'benchmark'}, 7, 200),
+            ('account-activation', 'get', '/activate/uid/token/', None, None, 0, 200),
+            ('users-me', 'get', '/api/v1/users/me/', self.buyer, None, 0, 200),
+            ('social-login', 'get', '/auth/login/google-oauth2/', None, None, 5, 302),
+            ('users-list', 'get', '/api/v1/users-list/', self.staff, None, 0, 405),
+            ('products-filter', 'get', '/api/v1/products/filter/?param[Цвет]=черный&limit=50', None, None, 1, 200),
+            ('products-batch-detail', 'get',
+             '/api/v1/products/detail/?ids=' + ','.join(str(item.product_id) for item in self.product_infos[:50]),
+             None, None, 2, 200),
+            ('products-list', 'get', '/api/v1/products/', None, None, 1, 200),
+            ('products-retrieve', 'get', f'/api/v1/products/{product.product_id}/', None, None, 1, 200),
+            ('catalog-cache-stats', 'get', '/api/v1/catalog-cache-stats/', self.staff, None, 0, 200),
+            ('metrics', 'get', '/api/v1/metrics/', self.staff, None, 2, 200),
+            ('shops-list', 'get', '/api/v1/shops/', None, None, 1, 200),
+            ('shop-detail', 'get', f'/api/v1/shops/{shop.id}/', None, None, 1, 200),
+            ('shop-status-update', 'put', f'/api/v1/shops/{shop.id}/', self.supplier, {'is_active': False}, 3, 200),
+            ('categories-list', 'get', '/api/v1/categories/', None, None, 1, 200),
+            ('productinfo-detail', 'get', f'/api/v1/products/{product.product_id}/detail/', None, None, 2, 200),
+            ('basket', 'get', '/api/v1/basket/', self.buyer, None, 1, 200),
+            ('basket-line-update', 'put', f'/api/v1/basket/{basket_line.id}/', self.buyer, {'quantity': 2}, 2, 200),
+            ('basket-batch', 'post', '/api/v1/basket/batch/', self.buyer,
+             {'items': [{'product_id': item.product_id, 'quantity': 3} for item in self.product_infos[1:21]]}, 6, 200),
+            ('contact', 'get', '/api/v1/contact/', self.buyer, None, 1, 200),
+            ('contact-create', 'post', '/api/v1/contact/', self.buyer, contact, 16, 200),
+            ('thanks-for-order', 'get', '/api/v1/thanks-for-order/', self.buyer, None, 1, 200),
+            ('orders', 'get', '/api/v1/orders/', self.buyer, None, 1, 200),
+            ('order-detail', 'get', f'/api/v1/orders/{self.buyer.id}-1/', self.buyer, None, 1, 200),
+            ('supplier-status-update', 'put', '/api/v1/shops-update-user/', self.supplier, None, 6, 200),
+            ('supplier-orders', 'get', '/api/v1/supplier-orders/', self.supplier, None, 1, 200),
+            ('supplier-orders-detail', 'get', f'/api/v1/supplier-orders/{self.buyer.id}-1/', self.supplier, None,
+             1, 200),
+        ]
+
+    def measure(self, method, path, user=None, data=None):
+        """Выполнение запроса BENCHMARK_ITERATIONS раз, возвращает задержки (с) и максимум SQL-запросов"""
+        client = APIClient()
+        if user is not None:
+            if path.startswith(('/admin/', '/api/v1/metrics/')):
+                client.force_login(user)
+            else:
+                client.force_authenticate(user)
+        timings, queries, status = [], 0, None
+        for _ in range(BENCHMARK_ITERATIONS):
+            catalog_cache.bump_version()
+            throttling._counters.clear()
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    response = getattr(client, method)(path, data, format='json')
+                    timings.append(time.perf_counter() - started)
+                queries = max(queries, len(context))
+                status = response.status_code
+                transaction.set_rollback(True)
+        return timings, queries, status
+
+    def test_endpoints(self):
+        facet_index.refresh(wait=True)
+        for name, method, path, user, data, budget, expected in self.endpoints():
+            with self.subTest(endpoint=name):
+                timings, queries, status = self.measure(method, path, user, data)
+                self.results[name] = {
+                    'method': method.upper(), 'path': path, 'status': status, 'queries': queries, 'budget': budget,
+                    'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+                    'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+                    'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+                    'mean_ms': round(statistics.mean(timings) * 1000, 3),
+                }
+                self.assertEqual(status, expected, f'{name}: {status}')
+                self.assertLessEqual(queries, budget, f'{name}: {queries} SQL-запросов при бюджете {budget}')
+
+    def test_product_detail_queries_do_not_depend_on_parameters(self):
+        """Детальная информация о товаре - O(1) запросов независимо от числа параметров"""
+        counts = {}
+        for product_info in self.product_infos[:len(PARAMETERS) + 1]:
+            _, counts[product_info.product_parameter.count()], _ = self.measure(
+                'get', f'/api/v1/products/{product_info.product_id}/detail/')
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_order_list_queries_do_not_depend_on_history(self):
+        """Список заказов - O(1) запросов независимо от числа заказов пользователя"""
+        _, short, _ = self.measure('get', '/api/v1/orders/', self.supplier)
+        _, long, _ = self.measure('get', '/api/v1/orders/', self.buyer)
+        self.assertEqual(short, long)
+
+    def test_checkout_queries_do_not_depend_on_basket(self):
+        """Оформление заказа - O(1) запросов независимо от числа строк корзины"""
+        Order.objects.create(user=self.supplier, product_info=self.product_infos[1])
+        contact = {'city': 'Москва', 'street': 'Ленина', 'house': '1', 'phone': '+79991234567'}
+        _, short, _ = self.measure('post', '/api/v1/contact/', self.supplier, contact)
+        _, long, _ = self.measure('post', '/api/v1/contact/', self.buyer, contact)
+        self.assertEqual(short, long)
+
+    def tearDown(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_facet_index()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FacetIndexTests(TestCase):
+    """Счетчики фасетов совпадают с подсчетом по таблице параметров, в том числе после изменений"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shops, cls.product_infos = seed_catalog(shops=3, categories=4, products=120, extra_parameters=2)
+
+    def setUp(self):
+        self.index = FacetIndex()
+        self.index.refresh(wait=True)
+
+    @staticmethod
+    def expected(filters):
+        """Количество и id товаров и счетчики фасетов, посчитанные напрямую по строкам ProductParameter"""
+        values = defaultdict(dict)
+        for product_info_id, name, value in ProductParameter.objects.values_list(
+                'product_info_id', 'parameter__name', 'value'):
+            values[product_info_id][name] = value
+        ids = ProductInfo.objects.order_by('id').values_list('id', flat=True)
+
+        def matches(product_info_id, exclude=None):
+            return all(values[product_info_id].get(name) in selected
+                       for name, selected in filters.items() if name != exclude)
+
+        matched = [product_info_id for product_info_id in ids if matches(product_info_id)]
+        facets = defaultdict(lambda: defaultdict(int))
+        for product_info_id in ids:
+            for name, value in values[product_info_id].items():
+                if matches(product_info_id, exclude=name):
+                    facets[name][value] += 1
+        return len(matched), matched, {name: dict(sorted(counts.items())) for name, counts in facets.items()}
+
+    def assertFacets(self, filters):
+        count, ids, facets = self.index.search(filters, 0, None)
+        self.assertEqual((count, ids, facets), self.expected(filters))
+
+    def test_counts(self):
+        for filters in ({}, {'Цвет': ['черный']}, {'Цвет': ['черный', 'белый'], 'Гарантия (мес)': ['24']},
+                        {'Встроенная память (Гб)': ['256'], 'Диагональ (дюйм)': ['6.1', '13.3']},
+                        {'Цвет': ['нет такого']}, {'Нет такого параметра': ['1']}):
+            with self.subTest(filters=filters):
+                self.assertFacets(filters)
+
+    def test_page(self):
+        count, ids, _ = self.index.search({'Цвет': ['белый']}, offset=5, limit=10)
+        self.assertEqual(ids, self.expected({'Цвет': ['белый']})[1][5:15])
+
+    def test_incremental_update(self):
+        """Изменение, добавление и удаление товаров применяются к индексу без полного перестроения"""
+        colour = Parameter.objects.get(name='Цвет')
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductParameter.objects.filter(product_info=self.product_infos[3], parameter=colour). \
+                update(value='зеленый')
+            ProductParameter.objects.get(product_info=self.product_infos[3], parameter=colour).save()
+            ProductParameter.objects.filter(product_info=self.product_infos[4], parameter=colour).delete()
+            product_info = ProductInfo.objects.create(name='Новый товар', quantity_in_stock=1, price=1,
+                                                      retail_price=1, product=self.product_infos[0].product,
+                                                      shop=self.shops[0])
+            ProductParameter.objects.create(product_info=product_info, parameter=colour, value='зеленый')
+            self.product_infos[5].delete()
+        with mock.patch.object(self.index, 'build', side_effect=AssertionError('full rebuild')):
+            self.index.refresh(wait=True)
+        self.assertEqual(self.index.search({'Цвет': ['зеленый']}, 0, None)[:2],
+                         (2, [self.product_infos[3].id, product_info.id]))
+        for filters in ({}, {'Цвет': ['зеленый']}, {'Цвет': ['черный'], 'Гарантия (мес)': ['12']}):
+            with self.subTest(filters=filters):
+                self.assertFacets(filters)
+
+    def test_parameter_rename_rebuilds(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Parameter.objects.filter(name='Цвет').update(name='Цвет корпуса')
+            invalidate_facet_index()
+        self.index.refresh(wait=True)
+        self.assertNotIn('Цвет', self.index.facets({}))
+        self.assertFacets({'Цвет корпуса': ['черный']})
+
+
+@override_settings(CACHES=TEST_CACHES, THROTTLE_REDIS_URL=None, PRODUCT_SEARCH_BACKEND='python')
+class PythonSearchBackendTests(TestCase):
+    """Поиск по инвертированному индексу в памяти (запасной бэкенд для SQLite)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        shop = Shop.objects.create(name='Магазин', url='https://shop.example.com')
+        category = Category.objects.create(name='Телефоны')
+        cls.products = {name: Product.objects.create(name=name, category=category) for name in (
+            'Смартфон Apple iPhone 14', 'Смартфоны Samsung Galaxy', 'Чехол для смартфона Apple', 'Ноутбук Lenovo')}
+        colour = Parameter.objects.create(name='Цвет')
+        for number, product in enumerate(cls.products.values()):
+            product_info = ProductInfo.objects.create(name=f'{product.name} ({number})', quantity_in_stock=1,
+                                                      price=1, retail_price=1, product=product, shop=shop)
+            ProductParameter.objects.create(product_info=product_info, parameter=colour,
+                                            value='черный' if number % 2 else 'белый')
+
+    def setUp(self):
+        throttling._counters.clear()
+
+    def names(self, backend, term):
+        return list(backend.search(Product.objects.all(), term).values_list('name', flat=True))
+
+    def test_ranking_stemming_and_typos(self):
+        backend = PythonSearchBackend()
+        self.assertEqual(self.names(backend, 'смартфон apple'),
+                         ['Смартфон Apple iPhone 14', 'Чехол для смартфона Apple', 'Смартфоны Samsung Galaxy'])
+        self.assertEqual(self.names(backend, 'смартвон samsung')[0], 'Смартфоны Samsung Galaxy')
+        self.assertEqual(self.names(backend, 'холодильник'), [])
+
+    def test_changes_from_other_processes(self):
+        """Индекс, построенный до изменений, видит изменения, опубликованные через журнал в кэше"""
+        backend = PythonSearchBackend()
+        self.assertEqual(self.names(backend, 'ноутбук'), ['Ноутбук Lenovo'])
+        category = Category.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            product = self.products['Ноутбук Lenovo']
+            product.name = 'Планшет Lenovo'
+            product.save()
+            created = Product.objects.bulk_create([Product(name='Ноутбук Apple MacBook', category=category)])
+            get_search_backend().update(Product, [product.pk for product in created])
+            removed = self.products['Смартфоны Samsung Galaxy']
+            Product.objects.filter(pk=removed.pk).delete()
+            get_search_backend().remove(Product, [removed.pk])
+        self.assertEqual(self.names(backend, 'ноутбук'), ['Ноутбук Apple MacBook'])
+        self.assertEqual(self.names(backend, 'планшет'), ['Планшет Lenovo'])
+        self.assertEqual(self.names(backend, 'samsung'), [])
+
+    def test_endpoints(self):
+        response = APIClient().get('/api/v1/products/', {'search': 'смартфон apple'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['name'] for product in response.json()['results']],
+                         ['Смартфон Apple iPhone 14', 'Чехол для смартфона Apple', 'Смартфоны Samsung Galaxy'])
+        response = APIClient().get('/api/v1/products/filter/', {'search': 'смартфон', 'param[Цвет]': 'белый'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(response.json()['facets'], {'Цвет': {'белый': 2, 'черный': 1}})
+
+
+@override_settings(CACHES=TEST_CACHES, THROTTLE_REDIS_URL=None, BASKET_BACKEND='db')
+class CatalogInvalidationTests(TestCase):
+    """Кэш каталога и маршруты к поставщикам обновляются только при изменении значимых полей"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shops, cls.product_infos = seed_catalog(shops=2, categories=2, products=4)
+        cls.buyer = seed_user('buyer@example.com')
+
+    def setUp(self):
+        throttling._counters.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        self.product_info = self.product_infos[0]
+        self.path = f'/api/v1/products/{self.product_info.product_id}/detail/'
+
+    def test_add_to_basket_keeps_catalog_and_routes(self):
+        version = catalog_cache.get_version()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put(self.path, {'basket': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(catalog_cache.get_version(), version)
+        self.assertFalse([query for query in context if 'sales_product_app_productinfo' in query['sql']
+                          and query['sql'].startswith('UPDATE')])
+        self.assertFalse([query for query in context if 'sales_product_app_supplierroute' in query['sql']])
+        self.assertTrue(Order.objects.filter(user=self.buyer, product_info=self.product_info).exists())
+
+    def test_catalog_fields_invalidate(self):
+        version = catalog_cache.get_version()
+        product_info = ProductInfo.objects.get(pk=self.product_info.pk)
+        product_info.save()
+        self.assertEqual(catalog_cache.get_version(), version)
+        product_info.retail_price += 1
+        product_info.save()
+        self.assertNotEqual(catalog_cache.get_version(), version)
+
+    def test_product_move_refreshes_routes(self):
+        product_info = ProductInfo.objects.select_related('product').get(pk=self.product_info.pk)
+        category = Category.objects.exclude(pk=product_info.product.category_id).filter(shops__isnull=False)[0]
+        with CaptureQueriesContext(connection) as context:
+            product_info.product.save()
+        self.assertFalse([query for query in context if 'sales_product_app_supplierroute' in query['sql']])
+        product_info.product.category = category
+        product_info.product.save()
+        self.assertEqual(set(product_info.supplier_routes.values_list('shop_id', flat=True)),
+                         set(category.shops.values_list('id', flat=True)))
+
+
+@override_settings(CACHES=TEST_CACHES, THROTTLE_REDIS_URL=None)
+class CatalogCacheTests(TestCase):
+    """Условные запросы каталога: ответ 304 по ETag и Last-Modified"""
+    paths = ['/api/v1/shops/', '/api/v1/categories/', '/api/v1/products/']
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(shops=2, categories=2, products=5)
+
+    def setUp(self):
+        throttling._counters.clear()
+        self.client = APIClient()
+
+    def test_not_modified(self):
+        before = catalog_cache.stats()['not_modified']
+        for path in self.paths:
+            with self.subTest(path=path):
+                throttling._counters.clear()
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+                etag, last_modified = response['ETag'], response['Last-Modified']
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=last_modified)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+        self.assertEqual(catalog_cache.stats()['not_modified'], before + 2 * len(self.paths))
+
+
+def load_urlconf(name='REST_API_DIPLOM.urls'):
+    """Новый экземпляр модуля URL-маршрутов: представления выбираются по настройкам при импорте"""
+    spec = importlib.util.find_spec(name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@override_settings(CACHES=TEST_CACHES, THROTTLE_REDIS_URL=None, ASYNC_READ_VIEWS=True)
+class AsyncReadViewsTests(TestCase):
+    """Асинхронные представления чтения при ASYNC_READ_VIEWS: ответы 200 и 304 по ETag"""
+
+    @classmethod
+    def setUpTestData(cls):
+        _, product_infos = seed_catalog(shops=2, categories=2, products=5)
+        cls.buyer = seed_user('buyer@example.com')
+        seed_orders(cls.buyer, product_infos, orders=3)
+
+    def setUp(self):
+        throttling._counters.clear()
+        self.urlconf = load_urlconf()
+        urlconf = override_settings(ROOT_URLCONF=self.urlconf)
+        urlconf.enable()
+        self.addCleanup(urlconf.disable)
+
+    async def test_catalog(self):
+        self.assertIs(resolve('/api/v1/shops/', self.urlconf).func.view_class, AsyncShopView)
+        client = AsyncClient()
+        for path in ('/api/v1/shops/', '/api/v1/categories/', '/api/v1/products/'):
+            with self.subTest(path=path):
+                response = await client.get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.json())
+                response = await client.get(path, headers={'If-None-Match': response['ETag']})
+                self.assertEqual(response.status_code, 304)
+
+    async def test_orders(self):
+        self.assertIs(resolve('/api/v1/orders/', self.urlconf).func.view_class, AsyncOrderListView)
+        token = await Token.objects.acreate(user=self.buyer)
+        response = await AsyncClient().get('/api/v1/orders/', headers={'Authorization': f'Token {token.key}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order['order_number'] for order in response.json()['results']],
+                         [f'{self.buyer.id}-{number}' for number in (3, 2, 1)])
+
+
+@override_settings(CACHES=TEST_CACHES, THROTTLE_REDIS_URL=None)
+class KeysetPaginationTests(TestCase):
+    """Курсор по (дата, id): заказы с одной датой не пропускаются и не повторяются"""
+
+    @classmethod
+    def setUpTestData(cls):
+        _, product_infos = seed_catalog(shops=1, categories=1, products=5)
+        cls.buyer = seed_user('buyer@example.com')
+        seed_orders(cls.buyer, product_infos, orders=30)
+
+    def setUp(self):
+        throttling._counters.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([order['order_number'] for order in response.json()['results']])
+            url = response.json()[link]
+        return pages
+
+    def test_pages_with_equal_dates(self):
+        expected = list(OrderHeader.objects.order_by('-date', '-id').values_list('order_number', flat=True))
+        pages = self.walk('/api/v1/orders/?page_size=7', 'next')
+        self.assertEqual([number for page in pages for number in page], expected)
+        self.assertEqual([len(page) for page in pages], [7, 7, 7, 7, 2])
+        response = self.client.get('/api/v1/orders/?page_size=7')
+        for _ in range(3):
+            response = self.client.get(response.json()['next'])
+        backwards = self.walk(response.json()['previous'], 'previous')
+        self.assertEqual(backwards, pages[2::-1])
+
+    def test_search_ordering(self):
+        """Совпадения с равной релевантностью идут по схожести, а не по id"""
+        queryset = ProductInfo.objects.annotate(rank=Value(0.0, output_field=FloatField()),
+                                                similarity=Mod(F('id'), 3)).order_by('-rank', '-similarity')
+        expected = sorted(ProductInfo.objects.values_list('id', flat=True), key=lambda pk: (-(pk % 3), pk))
+        url, found = '/api/v1/products/?page_size=2', []
+        while url:
+            paginator = ProductPagination()
+            page = paginator.paginate_queryset(queryset, Request(APIRequestFactory().get(url)))
+            self.assertEqual(paginator.ordering, ('-rank', '-similarity', 'id'))
+            found += [product_info.id for product_info in page]
+            url = paginator.get_next_link()
+        self.assertEqual(found, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/v1/orders/', {'cursor': 'cD0lNUIlMjJ4JTIyJTVE'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReservationTests(TestCase):
+    """Списание остатков при оформлении корзины и возврат при отмене"""
+
+    @classmethod
+    def setUpTestData(cls):
+        _, product_infos = seed_catalog(shops=1, categories=1, products=2)
+        cls.product_info = product_infos[0]
+        ProductInfo.objects.filter(id=cls.product_info.id).update(quantity_in_stock=5)
+        cls.buyer = seed_user('buyer@example.com')
+
+    def stock(self):
+        return ProductInfo.objects.values_list('quantity_in_stock', flat=True).get(id=self.product_info.id)
+
+    def test_reserve_and_release(self):
+        Order.objects.create(user=self.buyer, product_info=self.product_info, quantity=2)
+        order_number = reserve_basket(self.buyer.id)
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(set(Order.objects.values_list('status', 'order_number')), {('new', order_number)})
+        release_orders(self.buyer.id)
+        self.assertEqual(self.stock(), 5)
+        self.assertEqual(set(Order.objects.values_list('status', flat=True)), {'canceled'})
+        release_orders(self.buyer.id)
+        self.assertEqual(self.stock(), 5)
+
+    def test_events_disabled(self):
+        """Нагрузочная проверка (stress_reservation) не записывает события и не запускает уведомления"""
+        Order.objects.create(user=self.buyer, product_info=self.product_info, quantity=1)
+        with self.captureOnCommitCallbacks() as callbacks, order_events_disabled():
+            reserve_basket(self.buyer.id)
+        self.assertEqual((callbacks, OutboxEvent.objects.count()), ([], 0))
+        Order.objects.create(user=self.buyer, product_info=self.product_info, quantity=1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            reserve_basket(self.buyer.id)
+        self.assertEqual((len(callbacks), OutboxEvent.objects.count()), (1, 1))
+
+    def test_release_locks_stock_in_id_order(self):
+        Order.objects.create(user=self.buyer, product_info=self.product_info, quantity=2)
+        reserve_basket(self.buyer.id)
+        with CaptureQueriesContext(connection) as context:
+            release_orders(self.buyer.id)
+        stock = [query['sql'] for query in context if 'sales_product_app_productinfo' in query['sql']]
+        self.assertEqual(len(stock), 2)
+        self.assertTrue(stock[0].startswith('SELECT') and 'ORDER BY' in stock[0])
+        self.assertTrue(stock[1].startswith('UPDATE'))
+
+    def test_shortage_rolls_back(self):
+        Order.objects.create(user=self.buyer, product_info=self.product_info, quantity=6)
+        with self.assertRaises(StockReservationError):
+            reserve_basket(self.buyer.id)
+        self.assertEqual(self.stock(), 5)
+        self.assertEqual(set(Order.objects.values_list('status', 'order_number')), {('basket', '')})
+        self.assertFalse(OrderHeader.objects.exists())
+
+
+
+@override_settings(CACHES=TEST_CACHES, THROTTLE_REDIS_URL=None)
+class OrderHeaderTests(TestCase):
+    """Статус заголовка по статусам строк и чтение заголовков в представлениях покупателя и поставщика"""
+
+    @classmethod
+    def setUpTestData(cls):
+        shops, cls.product_infos = seed_catalog(shops=2, categories=1, products=4)
+        cls.buyer = seed_user('buyer@example.com')
+        cls.supplier = seed_user('supplier@example.com', 'supplier', company=shops[0].name)
+        Shop.objects.filter(id=shops[0].id).update(user=cls.supplier)
+        Contact.objects.create(user=cls.buyer, city='Москва', street='Тверская', house='1', phone='+79990000000')
+
+    def setUp(self):
+        throttling._counters.clear()
+
+    def order(self, order_number, statuses, date=None):
+        Order.objects.bulk_create([Order(user=self.buyer, product_info=product_info, quantity=2, status=status,
+                                         order_number=order_number)
+                                   for product_info, status in zip(self.product_infos, statuses)])
+        if date:
+            Order.objects.filter(order_number=order_number).update(date=date)
+        refresh_order_headers([order_number])
+        return OrderHeader.objects.get(order_number=order_number)
+
+    def test_status(self):
+        self.assertEqual(self.order('1', ['sent', 'sent']).status, 'sent')
+        self.assertEqual(self.order('2', ['new', 'canceled']).status, 'new')
+        self.assertEqual(self.order('3', ['sent', 'assembled', 'delivered']).status, 'assembled')
+        self.assertEqual(self.order('4', ['canceled', 'canceled']).status, 'canceled')
+        header = self.order('5', ['confirmed', 'received'])
+        self.assertEqual(header.status, 'confirmed')
+        self.assertEqual(header.total, 2 * (self.product_infos[0].retail_price + self.product_infos[1].retail_price))
+        Order.objects.filter(order_number='5').update(status='received')
+        refresh_order_headers(['5'])
+        self.assertEqual(OrderHeader.objects.get(order_number='5').status, 'received')
+
+    def test_views(self):
+        self.order('1', ['new', 'new'])
+        self.order('2', ['delivered'], date='2024-01-01')
+        self.order('3', ['new'], date='2024-01-01')
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        response = client.get('/api/v1/thanks-for-order/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(line['name'], line['street'], line['sum_value']) for line in response.json()],
+                         [(product_info.name, 'Тверская', 2 * product_info.retail_price)
+                          for product_info in self.product_infos[:2]])
+        client.force_authenticate(self.supplier)
+        response = client.get('/api/v1/supplier-orders/')
+        self.assertEqual(response.status_code, 200)
+        price = self.product_infos[0].price
+        self.assertEqual([(order['order_number'], order['status'], order['sum_'])
+                          for order in response.json()['results']],
+                         [('1', 'new', 2 * price), ('3', 'new', 2 * price), ('2', 'delivered', 2 * price)])
+        response = client.get('/api/v1/supplier-orders/1/')
+        self.assertEqual([line['name'] for line in response.json()], [self.product_infos[0].name])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+@override_settings(CACHES=TEST_CACHES)
+class ReservationConcurrencyTests(TransactionTestCase):
+    """Параллельное оформление последних единиц товара: без перепродажи и с ровно stock успешными заказами"""
+    buyers = 40
+    stock = 10
+
+    def checkout(self, user_id):
+        try:
+            return reserve_basket(user_id) is not None
+        except StockReservationError:
+            return False
+        finally:
+            connection.close()
+
+    def test_last_units(self):
+        _, product_infos = seed_catalog(shops=1, categories=1, products=1)
+        product_info = product_infos[0]
+        ProductInfo.objects.filter(id=product_info.id).update(quantity_in_stock=self.stock)
+        buyers = [seed_user(f'buyer{number}@example.com') for number in range(self.buyers)]
+        Order.objects.bulk_create([Order(user=buyer, product_info=product_info, quantity=1) for buyer in buyers])
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(self.checkout, [buyer.id for buyer in buyers]))
+        product_info.refresh_from_db()
+        self.assertGreaterEqual(product_info.quantity_in_stock, 0)
+        self.assertEqual(sum(results), self.stock)
+        self.assertEqual(product_info.quantity_in_stock, 0)
+        self.assertEqual(Order.objects.filter(status='new').count(), self.stock)
+        self.assertEqual(Order.objects.filter(status='basket').count(), self.buyers - self.stock)
+
+
+class BasketViewTestsMixin:
+    """Сценарий корзины через API, общий для бэкендов BASKET_BACKEND"""
+
+    @classmethod
+    def setUpTestData(cls):
+        _, cls.product_infos = seed_catalog(shops=1, categories=1, products=3)
+        ProductInfo.objects.update(quantity_in_stock=10)
+        cls.buyer = seed_user('buyer@example.com')
+
+    def setUp(self):
+        throttling._counters.clear()
+        baskets._backends.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def add(self, product_info):
+        return self.client.put(f'/api/v1/products/{product_info.product_id}/detail/', {'basket': True},
+                               format='json')
+
+    def lines(self):
+        response = self.client.get('/api/v1/basket/')
+        self.assertEqual(response.status_code, 200)
+        return {line['name']: line for line in response.json()}
+
+    def test_basket(self):
+        first, second = self.product_infos[:2]
+        self.assertIn('добавлен', self.add(first).json())
+        self.assertIn('уже в Корзине', self.add(first).json())
+        self.add(second)
+        self.assertEqual({name: line['quantity'] for name, line in self.lines().items()},
+                         {first.name: 1, second.name: 1})
+
+        response = self.client.put(f'/api/v1/basket/{self.lines()[first.name]["id"]}/', {'quantity': 3},
+                                   format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lines()[first.name]['quantity'], 3)
+        response = self.client.put(f'/api/v1/basket/{self.lines()[first.name]["id"]}/', {'quantity': 11},
+                                   format='json')
+        self.assertIn('превышает', response.json())
+        self.client.delete(f'/api/v1/basket/{self.lines()[second.name]["id"]}/')
+        self.assertEqual(list(self.lines()), [first.name])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/v1/contact/', {'city': 'Москва', 'street': 'Ленина', 'house': '1',
+                                                             'phone': '+79991234567'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Order.objects.filter(user=self.buyer).values_list('product_info_id', 'quantity',
+                                                                                 'status')),
+                         [(first.id, 3, 'new')])
+        self.assert_basket_kept_until_commit(callbacks)
+        self.assertEqual(self.lines(), {})
+        self.assertIn('добавлен', self.add(first).json())
+
+    def test_batch_limit(self):
+        items = [{'product_id': number, 'quantity': 'много'} for number in range(301)]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/v1/basket/batch/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['items']), ['non_field_errors'])
+        self.assertEqual(len(context), 0)
+
+    def assert_basket_kept_until_commit(self, callbacks):
+        for callback in callbacks:
+            callback()
+
+
+@override_settings(CACHES=TEST_CACHES, THROTTLE_REDIS_URL=None, BASKET_BACKEND='db')
+class DatabaseBasketViewTests(BasketViewTestsMixin, TestCase):
+    pass
+
+
+@override_settings(CACHES=TEST_CACHES, THROTTLE_REDIS_URL=None, BASKET_BACKEND='memory')
+class RedisBasketViewTests(BasketViewTestsMixin, TestCase):
+    """Корзина в хеше (FakeRedis): строки Order создаются при оформлении, хеш удаляется после фиксации"""
+
+    def assert_basket_kept_until_commit(self, callbacks):
+        basket = get_basket_backend()
+        self.assertEqual(basket.items(self.buyer.id), {self.product_infos[0].id: 3})
+        super().assert_basket_kept_until_commit(callbacks)
+        self.assertEqual(basket.items(self.buyer.id), {})
+
+
+@override_settings(CACHES=TEST_CACHES, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                   DEFAULT_FROM_EMAIL='shop@example.com')
+class OrderMailTests(TestCase):
+    """Уведомления о заказах: пакет событий - одна задача Celery и одно SMTP-соединение"""
+
+    @classmethod
+    def setUpTestData(cls):
+        shops, cls.product_infos = seed_catalog(shops=1, categories=1, products=2)
+        supplier = seed_user('supplier@example.com', 'supplier', company=shops[0].name)
+        Shop.objects.filter(id=shops[0].id).update(user=supplier)
+        refresh_supplier_routes()
+        ProductInfo.objects.update(quantity_in_stock=10)
+        cls.buyers = [seed_user(f'buyer{number}@example.com') for number in range(2)]
+
+    def send_eagerly(self):
+        return mock.patch.object(tasks.send_order_emails, 'delay',
+                                 side_effect=lambda notifications: tasks.send_order_emails.apply(
+                                     args=(notifications,)).get())
+
+    def test_relay_sends_batch_over_one_connection(self):
+        for buyer in self.buyers:
+            Order.objects.create(user=buyer, product_info=self.product_infos[0], quantity=1)
+            reserve_basket(buyer.id)
+        with self.send_eagerly() as delay, mock.patch('sales_product_app.mailing.get_connection',
+                                                      wraps=get_connection) as connect:
+            self.assertEqual(relay_outbox(tasks.send_order_events), 2)
+        self.assertEqual((delay.call_count, connect.call_count), (1, 1))
+        self.assertEqual(sorted((message.subject, tuple(message.to)) for message in mail.outbox),
+                         sorted([(f'Изменение статуса заказа #{buyer.id}-1', (buyer.email,)) for buyer in self.buyers] +
+                                [(f'Получен новый заказ #{buyer.id}-1', ('supplier@example.com',))
+                                 for buyer in self.buyers]))
+        self.assertFalse(OutboxEvent.objects.filter(processed_at=None).exists())
+
+    def test_smtp_error_retries_task(self):
+        failures = [smtplib.SMTPServerDisconnected('Connection unexpectedly closed')]
+
+        def connect(**kwargs):
+            if failures:
+                raise failures.pop()
+            return get_connection(**kwargs)
+
+        notification = {'event': 'order_canceled', 'first_name': 'Иван', 'last_name': 'Иванов',
+                        'email': 'buyer@example.com', 'order_number': '1-1', 'suppliers': ['supplier@example.com']}
+        with mock.patch('sales_product_app.mailing.get_connection', side_effect=connect):
+            result = tasks.send_order_emails.apply(args=([notification],))
+        self.assertTrue(result.successful())
+        self.assertFalse(failures)
+        self.assertEqual([(message.subject, message.to) for message in mail.outbox],
+                         [('Изменение статуса заказа #1-1', ['buyer@example.com']),
+                          ('Изменение статуса заказа #1-1', ['supplier@example.com'])])
+
+
+@override_settings(CACHES=TEST_CACHES, METRICS_TOKEN='secret')
+class MetricsAccessTests(TestCase):
+    """Метрики доступны по токену METRICS_TOKEN или сотрудникам, без токена - только сотрудникам"""
+
+    def test_access(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/v1/metrics/').status_code, 401)
+        self.assertEqual(client.get('/api/v1/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        response = client.get('/api/v1/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_request_duration_seconds', response.content.decode())
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(client.get('/api/v1/metrics/').status_code, 403)
+            client.force_login(seed_user('buyer@example.com'))
+            self.assertEqual(client.get('/api/v1/metrics/').status_code, 403)
+            client.force_login(seed_user('staff@example.com', is_staff=True))
+            self.assertEqual(client.get('/api/v1/metrics/').status_code, 200)
+
+
+@override_settings(CACHES=TEST_CACHES, THROTTLE_REDIS_URL=None, METRICS_TOKEN='secret')
+class RequestMetricsTests(TestCase):
+    """Время сериализации учитывается отдельно от рендеринга"""
+
+    def histogram(self, view):
+        return metrics_registry.histograms.get(('http_request_serialize_seconds', view, 'GET'))
+
+    def test_serialize_seconds(self):
+        seed_catalog(shops=3, categories=1, products=3)
+        throttling._counters.clear()
+        before = self.histogram('ShopView')
+        count, total = (before.count, before.sum) if before else (0, 0.0)
+        catalog_cache.bump_version()
+        self.assertEqual(APIClient().get('/api/v1/shops/').status_code, 200)
+        self.assertEqual(self.histogram('ShopView').count, count + 1)
+        self.assertGreater(self.histogram('ShopView').sum, total)
+        response = APIClient().get('/api/v1/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertIn('http_request_serialize_seconds_count{view="ShopView",method="GET"}', response.content.decode())
+        self.assertEqual(self.histogram('metrics').sum, 0)
+
+class MediaCollectTests(TestCase):
+    """Удаление файлов без ссылок не затрагивает только что сохраненные (возможно, еще не учтенные) файлы"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_root = override_settings(MEDIA_ROOT=directory.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def test_collect_skips_recently_stored(self):
+        name = default_storage.save('images/photo.png', ContentFile(b'image'))
+        self.assertEqual(MediaFile.objects.get(name=name).references, 0)
+        self.assertEqual(collect(), 0)
+        self.assertTrue(default_storage.exists(name))
+
+        MediaFile.objects.update(stored_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(default_storage.save('images/copy.png', ContentFile(b'image')), name)
+        self.assertEqual(collect(), 0)
+        acquire([name])
+        MediaFile.objects.update(stored_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(collect(), 0)
+
+        release([name])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(collect(), 1)
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(MediaFile.objects.exists())
+
+
+@override_settings(CACHES=TEST_CACHES, THROTTLE_REDIS_URL=None, BASKET_BACKEND='db')
+class CachedTokenAuthenticationTests(TestCase):
+    """В кэше токенов хранится только id пользователя, пользователь читается из БД при каждом запросе"""
+
+    def setUp(self):
+        throttling._counters.clear()
+        self.user = seed_user('buyer@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cache_holds_user_id(self):
+        self.assertEqual(self.client.get('/api/v1/basket/').status_code, 200)
+        self.assertEqual(get_token_cache().get(token_cache_key(self.token.key)), self.user.pk)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/v1/basket/').status_code, 401)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=True)
+        self.assertEqual(self.client.get('/api/v1/basket/').status_code, 200)
+        key = self.token.key
+        self.token.delete()
+        self.assertIsNone(get_token_cache().get(token_cache_key(key)))
+        self.assertEqual(self.client.get('/api/v1/basket/').status_code, 401)
+
+
+def good(product_id, name, category=224, price=1000, quantity=5, **parameters):
+    return {'id': product_id, 'category': category, 'model': 'model', 'name': name, 'price': price,
+            'price_rrc': price + 100, 'quantity': quantity, 'parameters': parameters}
+
+
+@override_settings(CACHES=TEST_CACHES, PRODUCT_SEARCH_BACKEND='python')
+class BulkImporterTests(TestCase):
+    """Пакетный импорт прайс-листов"""
+    shop = {'id': 1, 'name': 'Связной', 'url': 'https://www.svyaznoy.ru'}
+
+    def run_import(self, goods, categories=({'id': 224, 'name': 'Смартфоны', 'shops': [1]},), **kwargs):
+        entries = [('shop', self.shop)] + [('categories', category) for category in categories] + \
+            [('goods', item) for item in goods]
+        with self.captureOnCommitCallbacks(execute=True):
+            return BulkImporter(**kwargs).run(entries)
+
+    def test_foreign_ids_are_not_renamed(self):
+        other = Category.objects.create(id=224, name='Ноутбуки')
+        Product.objects.create(id=1, name='Ноутбук', category=other)
+        Product.objects.create(id=500, name='Смартфон X', category=other)
+        importer = self.run_import([good(1, 'Смартфон A'), good(2, 'Смартфон X')])
+        category = Category.objects.get(name='Смартфоны')
+        self.assertNotEqual(category.id, 224)
+        self.assertEqual(Category.objects.get(id=224).name, 'Ноутбуки')
+        self.assertEqual(Product.objects.get(id=1).name, 'Ноутбук')
+        self.assertNotEqual(Product.objects.get(name='Смартфон A').id, 1)
+        self.assertEqual(Product.objects.get(id=500).category, category)
+        self.assertEqual(ProductInfo.objects.get(name='Смартфон X').product_id, 500)
+        self.assertEqual(len(importer.conflicts), 3)
+
+    def catalog(self):
+        """Товары в БД: название -> (id товара, магазин, категория, цены, остаток, параметры)"""
+        parameters = defaultdict(dict)
+        for name, parameter, value in ProductParameter.objects.values_list('product_info__name', 'parameter__name',
+                                                                           'value'):
+            parameters[name][parameter] = value
+        return {product_info.name: (product_info.product_id, product_info.shop_id, product_info.product.category_id,
+                                    product_info.price, product_info.retail_price, product_info.quantity_in_stock,
+                                    parameters[product_info.name])
+                for product_info in ProductInfo.objects.select_related('product')}
+
+    def expected_catalog(self, data):
+        categories = {category['id']: category['shops'][0] for category in data['categories']}
+        return {item['name']: (item['id'], categories[item['category']], item['category'], item['price'],
+                               item['price_rrc'], item['quantity'],
+                               {key: str(value) for key, value in item['parameters'].items()})
+                for item in data['goods']}
+
+    def test_yaml_round_trip(self):
+        with open(SHOP1_YAML, encoding='utf8') as file:
+            data = yaml.safe_load(file)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = import_file(SHOP1_YAML, batch_size=2)
+        self.assertIsNone(result['error'])
+        self.assertEqual((result['rows'], result['conflicts']), (len(data['goods']), []))
+        self.assertEqual(dict(Shop.objects.values_list('id', 'name')),
+                         {shop['id']: shop['name'] for shop in data['shop']})
+        self.assertEqual(dict(Category.objects.values_list('id', 'name')),
+                         {category['id']: category['name'] for category in data['categories']})
+        self.assertEqual(self.catalog(), self.expected_catalog(data))
+
+    def test_command(self):
+        with open(SHOP1_YAML, encoding='utf8') as file:
+            data = yaml.safe_load(file)
+        output = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_data', SHOP1_YAML, stdout=output)
+        self.assertIn(f'Итого: 1 файлов, {len(data["goods"])} товаров', output.getvalue())
+        self.assertEqual(self.catalog(), self.expected_catalog(data))
+
+    def test_jsonl_matches_yaml(self):
+        entries = list(read_price_list(SHOP1_YAML))
+        self.assertEqual([section for section, _ in entries[:5]], ['shop', 'shop', 'categories', 'categories',
+                                                                   'categories'])
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf8', delete=False) as file:
+            file.writelines(json.dumps({section: entry}, ensure_ascii=False) + '\n\n' for section, entry in entries)
+        self.addCleanup(os.remove, file.name)
+        self.assertEqual(list(read_price_list(file.name)), entries)
+        with self.captureOnCommitCallbacks(execute=True):
+            import_file(SHOP1_YAML)
+        from_yaml = self.catalog()
+        ProductInfo.objects.all().delete()
+        Product.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(import_file(file.name)['error'])
+        self.assertEqual(self.catalog(), from_yaml)
+
+    def test_yaml_is_read_by_entry(self):
+        """Элементы отдаются по мере разбора: ошибка в конце файла не мешает прочитать начало"""
+        with tempfile.NamedTemporaryFile('w', suffix='.yaml', encoding='utf8', delete=False) as file:
+            file.write('shop:\n  - id: 1\n    name: Связной\ngoods:\n  - id: 2\n    name: Товар\n  - [\n')
+        self.addCleanup(os.remove, file.name)
+        entries = read_price_list(file.name)
+        self.assertEqual(next(entries), ('shop', {'id': 1, 'name': 'Связной'}))
+        self.assertEqual(next(entries), ('goods', {'id': 2, 'name': 'Товар'}))
+        with self.assertRaises(yaml.YAMLError):
+            next(entries)
+
+    def test_incremental_reimport(self):
+        goods = [good(1, 'Смартфон A', **{'Цвет': 'черный', 'Вес': '200'}), good(2, 'Смартфон B', **{'Цвет': 'белый'}),
+                 good(3, 'Смартфон C'), good(4, 'Смартфон D', **{'Цвет': 'синий'})]
+        self.assertEqual(self.run_import(goods, incremental=True).diff,
+                         {'inserted': 4, 'changed': 0, 'unchanged': 0, 'removed': 0})
+        self.assertEqual(self.run_import(goods, incremental=True).diff,
+                         {'inserted': 0, 'changed': 0, 'unchanged': 4, 'removed': 0})
+        goods = [good(1, 'Смартфон A', **{'Цвет': 'черный'}), good(2, 'Смартфон B', price=900, **{'Цвет': 'белый'}),
+                 good(4, 'Смартфон D', **{'Цвет': 'синий'}), good(5, 'Смартфон E')]
+        with CaptureQueriesContext(connection) as context:
+            importer = self.run_import(goods, incremental=True)
+        self.assertEqual(importer.diff, {'inserted': 1, 'changed': 2, 'unchanged': 1, 'removed': 1})
+        catalog = self.catalog()
+        self.assertEqual(catalog['Смартфон A'][6], {'Цвет': 'черный'})
+        self.assertEqual(catalog['Смартфон B'][3], 900)
+        self.assertEqual(catalog['Смартфон C'][5], 0)
+        written = [query['sql'] for query in context if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertTrue(any('Смартфон E' in sql for sql in written))
+        self.assertFalse(any('Смартфон D' in sql for sql in written))
+        self.assertEqual(self.run_import(goods, incremental=True).diff,
+                         {'inserted': 0, 'changed': 0, 'unchanged': 4, 'removed': 0})
+
+    def test_reimport_replaces_parameters(self):
+        self.run_import([good(1, 'Смартфон A', **{'Цвет': 'черный', 'Вес': '200'})])
+        self.run_import([good(1, 'Смартфон A', price=900, **{'Цвет': 'белый'})])
+        self.assertEqual(self.catalog()['Смартфон A'][3:], (900, 1000, 5, {'Цвет': 'белый'}))
@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from rest_framework import throttling
+
+logger = logging.getLogger(__name__)
+
+# Скользящее окно из двух соседних интервалов: запросы прошлого интервала учитываются с весом,
+# пропорциональным его доле, еще попадающей в окно. Проверка и увеличение счетчика - один вызов скрипта.
+SLIDING_WINDOW_SCRIPT = """
+local window = tonumber(ARGV[1])
+local elapsed = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local previous = tonumber(redis.call('GET', KEYS[1]) or '0')
+local current = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * (window - elapsed) / window + current >= limit then
+    return window - elapsed
+end
+redis.call('INCR', KEYS[2])
+redis.call('PEXPIRE', KEYS[2], window * 2)
+return 0
+"""
+
+
+def window_position(duration, now=None):
+    """Длина окна, номер текущего интервала и прошедшее в нем время (мс)"""
+    now = int(time.time() * 1000) if now is None else now
+    window = duration * 1000
+    return window, now // window, now % window
+
+
+class LocalWindowCounter:
+    """Счетчик скользящего окна в памяти процесса (без Redis)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.pruned = 0
+
+    def hit(self, key, limit, duration):
+        """Учет запроса, возвращает время ожидания в мс (0 - запрос разрешен)"""
+        now = int(time.time() * 1000)
+        window, bucket, elapsed = window_position(duration, now)
+        with self.lock:
+            if now - self.pruned > 1000:
+                self.counters = {name: value for name, value in self.counters.items() if value[1] > now}
+                self.pruned = now
+            previous = self.counters.get((key, bucket - 1), (0, 0))[0]
+            current = self.counters.get((key, bucket), (0, 0))[0]
+            if previous * (window - elapsed) / window + current >= limit:
+                return window - elapsed
+            self.counters[(key, bucket)] = (current + 1, now - elapsed + window * 2)
+        return 0
+
+
+class RedisWindowCounter:
+    """Общий для всех процессов счетчик скользящего окна в Redis (атомарный скрипт Lua)"""
+
+    def __init__(self, client):
+        self.script = client.register_script(SLIDING_WINDOW_SCRIPT)
+
+    def hit(self, key, limit, duration):
+        window, bucket, elapsed = window_position(duration)
+        return int(self.script(keys=[f'{key}:{bucket - 1}', f'{key}:{bucket}'], args=[window, elapsed, limit]))
+
+
+_counters = {}
+
+
+def get_window_counter():
+    """Счетчик по настройке THROTTLE_REDIS_URL: Redis, а если адрес не задан - память процесса"""
+    if 'default' not in _counters:
+        url = getattr(settings, 'THROTTLE_REDIS_URL', None)
+        if url:
+            import redis
+
+            _counters['default'] = RedisWindowCounter(redis.Redis.from_url(url, socket_timeout=0.5))
+        else:
+            _counters['default'] = get_local_counter()
+    return _counters['default']
+
+
+def get_local_counter():
+    return _counters.setdefault('local', LocalWindowCounter())
+
+
+class SlidingWindowThrottleMixin:
+    """Ограничение частоты запросов счетчиком скользящего окна вместо списка отметок времени в кэше.
+
+    При недоступности Redis используется счетчик в памяти процесса.
+    """
+    wait_ms = 0
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        try:
+            self.wait_ms = get_window_counter().hit(self.key, self.num_requests, self.duration)
+        except Exception as error:
+            logger.warning('Throttle backend error, using local memory: %s', error)
+            self.wait_ms = get_local_counter().hit(self.key, self.num_requests, self.duration)
+        return not self.wait_ms
+
+    def wait(self):
+        return self.wait_ms / 1000
+
+
+class AnonRateThrottle(SlidingWindowThrottleMixin, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(SlidingWindowThrottleMixin, throttling.UserRateThrottle):
+    pass
@@ -0,0 +1,74 @@
+from io import BytesIO
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+from pilkit.processors import ResizeToFill, ResizeToFit
+
+from .media import acquire, discard, release
+
+# Уменьшенные копии изображения: (обработчик, формат, качество)
+RENDITIONS = {
+    'list': (ResizeToFill(200, 200), 'WEBP', 75),
+    'detail': (ResizeToFit(800, 800, upscale=False), 'JPEG', 82),
+    'retina': (ResizeToFit(1600, 1600, upscale=False), 'WEBP', 80),
+}
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png'}
+
+
+def renditions_ready(instance):
+    """Копии построены для текущего оригинала изображения"""
+    renditions = instance.thumbnail_renditions or {}
+    return bool(instance.thumbnail) and renditions.get('source') == instance.thumbnail.name
+
+
+def rendition_urls(instance):
+    """URL копий изображения {название: url} или None, если копии еще не готовы"""
+    if not renditions_ready(instance):
+        return None
+    return {name: default_storage.url(path) for name, path in instance.thumbnail_renditions.items()
+            if name != 'source'}
+
+
+def render(image, processor, image_format, quality):
+    """Построение одной копии, возвращает байты файла"""
+    image = processor.process(image)
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    options = {'progressive': True, 'optimize': True} if image_format == 'JPEG' else {'method': 4}
+    image.save(buffer, image_format, quality=quality, **options)
+    return buffer.getvalue()
+
+
+def generate_renditions(model_label, pk):
+    """Построение копий изображения объекта и сохранение их путей.
+
+    Пути записываются, только если оригинал не сменился во время обработки. Копии с одинаковым
+    содержимым хранятся в одном файле, ссылки на новые копии учитываются, на старые - освобождаются.
+    Возвращает словарь путей или None, если у объекта нет изображения.
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).only('thumbnail', 'thumbnail_renditions').first()
+    if instance is None or not instance.thumbnail or renditions_ready(instance):
+        return None
+    source = instance.thumbnail.name
+    with instance.thumbnail.open('rb') as file:
+        original = ImageOps.exif_transpose(Image.open(file))
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+    renditions = {'source': source}
+    for name, (processor, image_format, quality) in RENDITIONS.items():
+        path = f'images/renditions/{name}.{EXTENSIONS[image_format]}'
+        renditions[name] = default_storage.save(path, ContentFile(render(original, processor, image_format, quality)))
+    with transaction.atomic():
+        if not model.objects.filter(pk=pk, thumbnail=source).update(thumbnail_renditions=renditions):
+            discard(path for name, path in renditions.items() if name != 'source')
+            return None
+        acquire(path for name, path in renditions.items() if name != 'source')
+        release(path for name, path in (instance.thumbnail_renditions or {}).items() if name != 'source')
+    return renditions
@@ -1,22 +1,35 @@
 from datetime import datetime
 from time import sleep
 
-from django.db.models import F, Sum, Count
+from django.db.models import F, Sum, Count, Prefetch
 from django.http import HttpResponse
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.shortcuts import render, get_object_or_404, redirect
-from rest_framework.filters import OrderingFilter, SearchFilter
+from django.utils.crypto import constant_time_compare
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, IsAdminUser
 from rest_framework.response import Response
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
 from rest_framework.views import APIView
 from rest_framework import viewsets
 
-from .models import CustomUser, ProductInfo, Shop, Category, Product, Order, Contact, ProductParameter
+from .models import CustomUser, ProductInfo, Shop, Category, Product, Order, Contact, ProductParameter, OrderHeader
 from .serializers import ProductInfoSerializer, ShopSerializer, CategorySerializer, ProductSerializer, \
     BasketSerializer, ContactSerializer, ThanksForOrderSerializer, OrderListSerializer, OrderDetailSerializer, \
-    CustomUserSerializer
-from .tasks import create_user_async, upload_thumbnail_async
+    CustomUserSerializer, FacetProductSerializer, OrderHeaderSerializer, BasketBatchSerializer
+from .baskets import get_basket_backend
+from .catalog_cache import cache_catalog_response, catalog_cache
+from .facets import facet_index, parse_facet_filters
+from .metrics import metrics_registry
+from .pagination import ProductPagination, OrderPagination
+from .reservations import StockReservationError, reserve_basket, release_orders
+from .routing import refresh_shop_routes
+from .search import ProductSearchFilter, get_search_backend
+from .tasks import create_user_async
+from .throttling import AnonRateThrottle, UserRateThrottle
+
+
 def account_activation(request, uid, token):
     """Активация пользователя"""
     context = {
@@ -26,23 +39,43 @@ def account_activation(request, uid, token):
     return render(request, 'account_activation.html', context)
 
 
+def metrics(request):
+    """Метрики запросов в текстовом формате Prometheus: по токену METRICS_TOKEN или для сотрудников"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorized = token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized and not request.user.is_staff:
+        return HttpResponse(status=401 if token else 403)
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class UserView(APIView):
     """Класс для просмотра списка пользователей"""
     permission_classes = [IsAdminUser]
 
+
+class CatalogCacheStatsView(APIView):
+    """Класс для просмотра статистики кэша каталога"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        """Получение счетчиков попаданий и промахов кэша"""
+        return Response(catalog_cache.stats())
+
+
 class ShopView(APIView):
     """Класс для работы со списком магазинов """
     throttle_classes = [AnonRateThrottle]
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    @staticmethod
+    def get_queryset(pk=None):
+        """Магазин по pk или все магазины"""
+        return Shop.objects.filter(pk=pk) if pk else Shop.objects.all()
+
+    @cache_catalog_response
     def get(self, request, *args, **kwargs):
         """Получить магазин (список магазинов)"""
-        pk = kwargs.get('pk')
-        if pk:
-            shops = Shop.objects.filter(pk=pk)
-            return Response(ShopSerializer(shops, many=True).data)
-        shops = Shop.objects.all()
-        return Response(ShopSerializer(shops, many=True).data)
+        return Response(ShopSerializer(self.get_queryset(kwargs.get('pk')), many=True).data)
 
     def put(self, request, *args, **kwargs):
         """Изменить статус магазина"""
@@ -68,29 +101,43 @@ class CategoryView(ListAPIView):
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        """Получение списка категорий"""
+        return super().list(request, *args, **kwargs)
+
 
 class ProductViewSet(viewsets.ModelViewSet):
     """Класс для просмотра списка товаров"""
     throttle_classes = [AnonRateThrottle]
     queryset = Product.objects.all().select_related('category')
     serializer_class = ProductSerializer
-    filter_backends = [OrderingFilter, SearchFilter]
+    filter_backends = [ProductSearchFilter, OrderingFilter]
     ordering_fields = ['name']
-    search_fields = ['name']
+    pagination_class = ProductPagination
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        """Получение списка товаров"""
+        return super().list(request, *args, **kwargs)
+
 
 class ProductInfoView(APIView):
     """Класс для работы с информацией о товаре"""
     throttle_classes = [AnonRateThrottle]
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    @staticmethod
+    def get_queryset():
+        """Информация о товарах с магазином, продуктом и параметрами за фиксированное число запросов"""
+        return ProductInfo.objects.select_related('shop', 'product').prefetch_related(
+            Prefetch('product_parameter', queryset=ProductParameter.objects.select_related('parameter')))
+
     def create_order(self, user_id, product_info_id, product):
         """Создание номера заказа"""
-        order_count = Order.objects.filter(user_id=user_id, product_info_id=product_info_id).count()
-        if order_count >= 1:
+        if not get_basket_backend().add(user_id, product_info_id):
             return Response(f"{product} уже в Корзине Пользователя (user_id: {user_id})")
-        Order.objects.create(user_id=user_id, product_info_id=product_info_id)
         return Response(f"{product} добавлен в Корзину Пользователя (user_id: {user_id})")
 
     def get(self, request, product_id):
@@ -98,7 +145,7 @@ class ProductInfoView(APIView):
         if not product_id:
             return Response({'Error': 'Method GET not allowed'})
         try:
-            product_info = ProductInfo.objects.get(product_id=product_id)
+            product_info = self.get_queryset().get(product_id=product_id)
         except:
             return Response({'Error': 'Object does not exists'})
         return Response(ProductInfoSerializer(product_info).data)
@@ -112,16 +159,64 @@ class ProductInfoView(APIView):
             instance = ProductInfo.objects.get(product_id=product_id)
         except:
             return Response({'Error': 'Object does not exists'})
-        if request.data.get('thumbnail'):
-            upload_thumbnail_async.delay(tuple(request.data), product_id)
         serializer = ProductInfoSerializer(data=request.data, instance=instance)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        if serializer.data['basket']:
-            return self.create_order(request.user.id, serializer.data['id'], serializer.data['product'])
+        # basket - действие покупателя, а не свойство товара: товар сохраняется, только если изменены другие поля
+        to_basket = serializer.validated_data.pop('basket')
+        if serializer.validated_data:
+            serializer.save()
+        if to_basket:
+            return self.create_order(request.user.id, instance.id, instance.product)
         return Response(serializer.data)
 
 
+class ProductFilterView(APIView):
+    """Класс для фильтрации товаров по параметрам с подсчетом фасетов"""
+    throttle_classes = [AnonRateThrottle]
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    default_limit = 50
+    max_limit = 500
+
+    def get(self, request, *args, **kwargs):
+        """Получение товаров по фильтрам ?param[Цвет]=красный&param[Встроенная память (Гб)]=256
+        и поисковому запросу ?search= по названиям товаров магазинов"""
+        try:
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+            limit = min(max(int(request.query_params.get('limit', self.default_limit)), 1), self.max_limit)
+        except ValueError:
+            return Response({'Error': 'offset и limit должны быть числами'})
+        term = request.query_params.get('search', '').strip()
+        within = get_search_backend().search(ProductInfo.objects.all(), term).order_by(). \
+            values_list('id', flat=True) if term else None
+        count, ids, facets = facet_index.search(parse_facet_filters(request.query_params), offset, limit, within)
+        product_infos = ProductInfo.objects.filter(id__in=ids).select_related('product', 'shop').order_by('id')
+        return Response({'count': count,
+                         'results': FacetProductSerializer(product_infos, many=True).data,
+                         'facets': facets})
+
+
+class ProductInfoBatchView(APIView):
+    """Класс для получения информации о нескольких товарах за один запрос"""
+    throttle_classes = [AnonRateThrottle]
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    max_ids = 300
+
+    def get(self, request, *args, **kwargs):
+        """Получение информации о товарах по списку ?ids=1,2,3"""
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in request.query_params.get('ids', '').split(',') if pk))
+        except ValueError:
+            return Response({'Error': 'ids должен быть списком чисел через запятую'})
+        if not ids:
+            return Response({'Error': 'Не указан параметр ids'})
+        if len(ids) > self.max_ids:
+            return Response({'Error': f'Можно запросить не более {self.max_ids} товаров'})
+        product_infos = {product_info.product_id: product_info
+                         for product_info in ProductInfoView.get_queryset().filter(product_id__in=ids)}
+        return Response(ProductInfoSerializer([product_infos[pk] for pk in ids if pk in product_infos],
+                                              many=True).data)
+
+
 class BasketView(APIView):
     """Класс для работы с корзиной пользователя"""
     throttle_classes = [UserRateThrottle]
@@ -132,45 +227,64 @@ class BasketView(APIView):
         pk = kwargs.get('pk')
         if pk:
             return Response({'Error': 'Method GET not allowed'})
-        queryset = Order.objects.filter(user_id=request.user.id).select_related('product_info')
-        queryset = queryset.annotate(name=F('product_info__name'),
-                                     shop=F('product_info__shop__name'),
-                                     price=F('product_info__retail_price'),
-                                     quantity_in_stock=F('product_info__quantity_in_stock'),
-                                     sum_value=Sum(F('product_info__retail_price') * F('quantity')))
-        return Response(BasketSerializer(queryset, many=True).data)
+        return Response(BasketSerializer(get_basket_backend().lines(request.user.id), many=True).data)
 
     def put(self, request, *args, **kwargs):
         """Изменение количества товара"""
         pk = kwargs.get('pk')
         if not pk:
             return Response("{'Error': 'Method PUT not allowed'}")
-        try:
-            instance = Order.objects.filter(user_id=request.user.id).get(pk=pk)
-        except:
+        basket = get_basket_backend()
+        line = basket.get_line(request.user.id, pk)
+        if line is None:
             return Response('Object does not exist')
-        serializer = BasketSerializer(data=request.data, instance=instance)
+        serializer = BasketSerializer(data=request.data)
         try:
-            if int(request.data['quantity']) > instance.product_info.quantity_in_stock:
-                return Response(f"Данное число превышает количество товара '{instance.product_info.name}' на складе")
+            if int(request.data['quantity']) > line['quantity_in_stock']:
+                return Response(f"Данное число превышает количество товара '{line['name']}' на складе")
         except KeyError:
             return Response({'Error': 'Введите число для изменения количества товара'})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(f"Количество товара '{instance.product_info.name}' изменено на "
-                        f"{serializer.data['quantity']} шт.")
+        basket.set_quantity(request.user.id, pk, serializer.validated_data['quantity'])
+        return Response(f"Количество товара '{line['name']}' изменено на "
+                        f"{serializer.validated_data['quantity']} шт.")
 
     def delete(self, request, *args, **kwargs):
         """Удаление товара из корзины"""
         pk = kwargs.get('pk')
         if not pk:
             return Response("{'Error': 'Method DELETE not allowed'}")
-        try:
-            instance = Order.objects.filter(user_id=request.user.id).get(pk=pk)
-        except:
+        basket = get_basket_backend()
+        line = basket.get_line(request.user.id, pk)
+        if line is None:
             return Response('Object does not exist')
-        instance.delete()
-        return Response(f'Товар {instance.product_info.name} удален из Корзины')
+        basket.remove(request.user.id, pk)
+        return Response(f"Товар {line['name']} удален из Корзины")
+
+
+class BasketBatchView(APIView):
+    """Класс для изменения нескольких товаров корзины за один запрос"""
+    throttle_classes = [UserRateThrottle]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """Добавление, изменение количества и удаление (quantity = 0) товаров корзины"""
+        serializer = BasketBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = {item['product_id']: item['quantity'] for item in serializer.validated_data['items']}
+        product_infos = {product_info['product_id']: product_info for product_info in
+                         ProductInfo.objects.filter(product_id__in=items).
+                         values('id', 'product_id', 'name', 'quantity_in_stock')}
+        errors = [f'Товар с product_id {product_id} не существует' for product_id in items
+                  if product_id not in product_infos]
+        errors += [f"Данное число превышает количество товара '{product_info['name']}' на складе"
+                   for product_id, product_info in product_infos.items()
+                   if items[product_id] > product_info['quantity_in_stock']]
+        if errors:
+            return Response({'Error': errors})
+        added, updated, removed = get_basket_backend().set_items(
+            request.user.id, {product_infos[product_id]['id']: quantity for product_id, quantity in items.items()})
+        return Response({'added': added, 'updated': updated, 'removed': removed})
 
 
 class ContactView(APIView):
@@ -200,7 +314,10 @@ class ContactView(APIView):
             data[key] = value
         serializer = ContactSerializer(data=data)
         serializer.is_valid(raise_exception=True)
-        OrderListView.update_order_new(self, self.request.user.id)
+        try:
+            OrderListView.update_order_new(self, self.request.user.id, serializer.validated_data)
+        except StockReservationError as error:
+            return Response({'Error': str(error)})
         serializer.save()
         return Response(serializer.data)
 
@@ -241,18 +358,20 @@ class ThanksForOrderView(APIView):
         pk = kwargs.get('pk')
         if pk:
             return Response("{'Error': 'Method GET not allowed'}")
-        current_date = datetime.now().date()
-        product_info = Order.objects.filter(user_id=request.user.id, status='new',
-                                            date=current_date).select_related('product_info')
-        product_info = product_info.annotate(name=F('product_info__name'),
-                                             shop=F('product_info__shop__name'),
-                                             price=F('product_info__retail_price'),
-                                             sum_value=Sum(F('product_info__retail_price') * F('quantity')),
-                                             email=F('user__email'),
-                                             phone=F('user__contacts__phone'),
-                                             street=F('user__contacts__street'),
-                                             house=F('user__contacts__house'))
-        return Response(ThanksForOrderSerializer(product_info, many=True).data)
+        # Сегодняшние новые заказы - по индексу заголовков, адрес - копия из заголовка на момент оформления
+        headers = {header.order_number: header for header in
+                   OrderHeader.objects.filter(user_id=request.user.id, status='new', date=datetime.now().date())}
+        lines = list(Order.objects.filter(user_id=request.user.id, order_number__in=list(headers)).
+                     select_related('user').order_by('id').
+                     annotate(name=F('product_info__name'),
+                              shop=F('product_info__shop__name'),
+                              price=F('product_info__retail_price'),
+                              sum_value=F('product_info__retail_price') * F('quantity'),
+                              email=F('user__email')))
+        for line in lines:
+            header = headers[line.order_number]
+            line.phone, line.street, line.house = header.phone, header.street, header.house
+        return Response(ThanksForOrderSerializer(lines, many=True).data)
 
 
 class OrderListView(APIView):
@@ -262,39 +381,42 @@ class OrderListView(APIView):
     filter_backends = [OrderingFilter]
     ordering_fields = ['status']
 
-    def update_order_new(self, user_id):
-        """Обновление статуса заказа и создание номера для нового заказа"""
-        Order.objects.filter(user_id=user_id, status='basket').update(status='new')
-        orders = Order.objects.filter(user_id=user_id, status='new').values('user_id', 'date').annotate().distinct()
-        for i, v in enumerate(orders):
-            v['id'] = i + 1
-            Order.objects.filter(user_id=v['user_id'], date=v['date']). \
-                update(order_number=f"{user_id}-{v['id']}")
+    def update_order_new(self, user_id, contact=None):
+        """Резервирование товаров, обновление статуса заказа и создание номера для нового заказа"""
+        with transaction.atomic():
+            get_basket_backend().materialize(user_id)
+            return reserve_basket(user_id, contact)
 
     def update_order_canceled(self, user_id):
-        """Обновление статуса заказа на при удалении контакта"""
+        """Обновление статуса заказа на при удалении контакта с возвратом товаров на склад"""
         try:
-            Order.objects.filter(user_id=user_id).exclude(status='basket').update(status='canceled')
+            release_orders(user_id)
         except:
             return Response('Object does not exist')
 
+    @staticmethod
+    def get_order_queryset(user_id, order_number):
+        """Строки заказа пользователя с названием, магазином, ценой, суммой и контактами"""
+        return Order.objects.filter(user_id=user_id, order_number=order_number).select_related('user'). \
+            annotate(name=F('product_info__name'),
+                     shop=F('product_info__shop__name'),
+                     price=F('product_info__retail_price'),
+                     sum_=Sum(F('product_info__retail_price') * F('quantity')),
+                     email=F('user__email'),
+                     phone=F('user__contacts__phone'),
+                     street=F('user__contacts__street'),
+                     house=F('user__contacts__house'))
+
     def get(self, request, **kwargs):
         """Получение детализированного заказа пользователя"""
         order_number = kwargs.get('order_number')
         if order_number:
-            order = Order.objects.filter(user_id=request.user.id, order_number=order_number). \
-                annotate(name=F('product_info__name'),
-                         shop=F('product_info__shop__name'),
-                         price=F('product_info__retail_price'),
-                         sum_=Sum(F('product_info__retail_price') * F('quantity')),
-                         email=F('user__email'),
-                         phone=F('user__contacts__phone'),
-                         street=F('user__contacts__street'),
-                         house=F('user__contacts__house'))
+            order = self.get_order_queryset(request.user.id, order_number)
             return Response(OrderDetailSerializer(order, many=True).data)
-        orders = Order.objects.filter(user_id=request.user.id).values('user_id', 'date', 'status', 'order_number'). \
-            annotate(sum_=Sum(F('product_info__retail_price') * F('quantity'))).distinct()
-        return Response(OrderListSerializer(orders, many=True).data)
+        orders = OrderHeader.objects.filter(user_id=request.user.id)
+        paginator = OrderPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        return paginator.get_paginated_response(OrderHeaderSerializer(page, many=True).data)
 
 
 class ShopUpdateUserView(APIView):
@@ -306,16 +428,22 @@ class ShopUpdateUserView(APIView):
         """Изменение user_id магазина"""
         if request.user.type != 'supplier':
             return Response({'Error': 'Only for suppliers'})
+        suppliers = list(CustomUser.objects.filter(type='supplier').values('id', 'username', 'company'))
+        shops = Shop.objects.in_bulk([supplier['company'] for supplier in suppliers], field_name='name')
+        if any(supplier['company'] not in shops for supplier in suppliers):
+            return Response({'Error': 'Supplier or Shop does not exists'})
+        response = {}
+        for supplier in suppliers:
+            shops[supplier['company']].user_id = supplier['id']
+            response[f"Поставщик (username: '{supplier['username']}') прикреплен к магазину"] = \
+                f"{shops[supplier['company']]}"
         try:
-            response = {}
-            suppliers = CustomUser.objects.filter(type='supplier').values('id', 'username', 'company')
-            for supplier in suppliers:
-                Shop.objects.filter(name=supplier['company']).update(user_id=supplier['id'])
-                response[f"Поставщик (username: '{supplier['username']}') прикреплен к магазину"] = \
-                    f"{Shop.objects.filter(name=supplier['company'])[0]}"
-            return Response(response)
-        except:
+            with transaction.atomic():
+                Shop.objects.bulk_update(shops.values(), ['user'])
+                refresh_shop_routes([shop.id for shop in shops.values()])
+        except IntegrityError:
             return Response({'Error': 'Supplier or Shop does not exists'})
+        return Response(response)
 
 
 class SupplierOrdersView(APIView):
@@ -330,12 +458,15 @@ class SupplierOrdersView(APIView):
             return Response({'Error': 'Only for suppliers'})
         if order_number:
             try:
-                order = Order.objects.filter(order_number=order_number).annotate(name=F('product_info__name'),
-                                                                                 price=F('product_info__price'))
+                order = Order.objects.filter(order_number=order_number,
+                                             product_info__shop__user_id=request.user.id).select_related('user'). \
+                    annotate(name=F('product_info__name'), price=F('product_info__price'))
                 return Response(OrderDetailSerializer(order, many=True).data)
             except:
                 return Response('Object does not exist')
-        order = Order.objects.filter(product_info__shop__user_id=request.user.id). \
-            select_related('product_info__shop').exclude(status='Basket'). \
-            annotate(sum_=Sum(F('product_info__price') * F('quantity')))
-        return Response(OrderListSerializer(order, many=True).data)
\ No newline at end of file
+        # Только строки магазинов поставщика и по его ценам: заголовки содержат суммы всего заказа
+        order = Order.objects.filter(product_info__shop__user_id=request.user.id).exclude(status='basket'). \
+            annotate(sum_=F('product_info__price') * F('quantity'))
+        paginator = OrderPagination()
+        page = paginator.paginate_queryset(order, request, view=self)
+        return paginator.get_paginated_response(OrderListSerializer(page, many=True).data)
\ No newline at end of file